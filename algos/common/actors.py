@@ -0,0 +1,286 @@
+"""Actor processes that collect experience in parallel with the learner"""
+import copy
+import queue
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from gym import Env
+from torch import nn
+
+from algos.common.agents import ValueAgent, reset_noise
+from algos.common.experience import ExperienceSource, NStepExperienceSource
+from algos.common.inference import InferenceServer, RemoteAgent
+from algos.common.memory import Experience
+from algos.common.quantize import quantize_network
+
+
+def actor_epsilons(num_actors: int, base: float = 0.4, alpha: float = 7.0) -> List[float]:
+    """
+    Epsilon of each actor, spread from base down to base ** (1 + alpha) as done in Ape-X. This way some actors keep
+    exploring while others mostly follow the greedy policy
+
+    Args:
+        num_actors: number of actors
+        base: epsilon of the first actor
+        alpha: controls how fast the epsilon decreases over the actors
+
+    Returns:
+        epsilon of each actor
+    """
+    if num_actors == 1:
+        return [base]
+    return [base ** (1 + alpha * idx / (num_actors - 1)) for idx in range(num_actors)]
+
+
+def _to_numpy(exp: Experience) -> Experience:
+    """Converts an experience to plain numpy values so it is cheap to send to the learner"""
+    return Experience(np.asarray(exp.state), int(exp.action), float(exp.reward), bool(exp.done),
+                      np.asarray(exp.new_state))
+
+
+def td_priorities(net: nn.Module, target_net: nn.Module, experiences: List[Experience], gamma: float) -> np.ndarray:
+    """
+    Initial priority of a batch of experiences, the squared TD error used by the PER learner for its own priorities
+
+    Args:
+        net: network giving the Q values of the actions taken
+        target_net: network giving the Q values of the next states
+        experiences: experiences to prioritise
+        gamma: discount applied to the value of the next state, gamma ** n for n step experiences
+
+    Returns:
+        priority of each experience
+    """
+    states, actions, rewards, dones, next_states = zip(*experiences)
+
+    with torch.no_grad():
+        state_action_values = net(torch.as_tensor(np.stack(states)))
+        state_action_values = state_action_values.gather(1, torch.as_tensor(actions).unsqueeze(-1)).squeeze(-1)
+        next_state_values = target_net(torch.as_tensor(np.stack(next_states))).max(1)[0]
+        next_state_values[torch.as_tensor(dones)] = 0.0
+        expected = next_state_values * gamma + torch.as_tensor(rewards, dtype=torch.float32)
+
+    return ((state_action_values - expected) ** 2 + 1e-5).numpy()
+
+
+class _SharedNetworks:
+    """
+    Networks kept in shared memory holding the weights published by the learner, with a counter increased on
+    every publish so the actors know when to reload them
+
+    Args:
+        ctx: multiprocessing context
+        net: learner network
+        target_net: learner target network, only needed when the actors compute priorities
+    """
+
+    def __init__(self, ctx, net: nn.Module, target_net: Optional[nn.Module] = None) -> None:
+        self.net = copy.deepcopy(net).cpu().share_memory()
+        self.target_net = None if target_net is None else copy.deepcopy(target_net).cpu().share_memory()
+        self.version = ctx.Value("i", 0)
+
+    def publish(self, net: nn.Module, target_net: Optional[nn.Module] = None) -> None:
+        """Copies the learner weights into shared memory"""
+        with self.version.get_lock():
+            with torch.no_grad():
+                _copy_weights(self.net, net)
+                if self.target_net is not None and target_net is not None:
+                    _copy_weights(self.target_net, target_net)
+            self.version.value += 1
+
+    def load(self, net: nn.Module, target_net: Optional[nn.Module] = None) -> None:
+        """Copies the shared weights into the local networks of an actor"""
+        with self.version.get_lock():
+            net.load_state_dict(self.net.state_dict())
+            if target_net is not None:
+                target_net.load_state_dict(self.target_net.state_dict())
+
+
+def _copy_weights(destination: nn.Module, source: nn.Module) -> None:
+    """Copies the parameters and buffers of source in place into destination"""
+    for dest_tensor, src_tensor in zip(destination.state_dict().values(), source.state_dict().values()):
+        dest_tensor.copy_(src_tensor)
+
+
+def _actor_loop(index: int, env_fn: Callable[[], Env], shared: _SharedNetworks, experience_queue, stop,
+                epsilon: float, n_steps: int, gamma: float, chunk_size: int, conn=None, quantize: bool = False) -> None:
+    """
+    Steps an env with a local copy of the shared network and sends the experiences to the learner in chunks.
+    The local network is refreshed whenever the learner publishes new weights. When a target network is shared
+    each chunk is sent with the initial priority of its experiences. When a connection to an inference server
+    is given the actions are asked to the server instead. The noise of a noisy network is resampled on every step,
+    as the learner only resamples it once per training step
+
+    Args:
+        index: index of the actor, used to seed its env
+        env_fn: function creating the env
+        shared: networks in shared memory holding the weights published by the learner
+        experience_queue: queue used to send the experiences to the learner
+        stop: event set when the actor should stop
+        epsilon: epsilon used by the actor for its whole life
+        n_steps: number of steps accumulated for each experience
+        gamma: discount factor used for the n step rewards and the priorities
+        chunk_size: number of experiences sent together
+        conn: actor end of a pipe connected to an InferenceServer
+        quantize: act with an int8 dynamically quantised copy of the network, rebuilt on every weight sync
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    torch.set_num_threads(1)
+    env = env_fn()
+    env.seed(123 + index)
+
+    net = copy.deepcopy(shared.net)
+    target_net = None if shared.target_net is None else copy.deepcopy(shared.target_net)
+    if conn is None:
+        agent = ValueAgent(net, env.action_space.n, eps_start=epsilon, eps_end=epsilon)
+    else:
+        agent = RemoteAgent(conn, epsilon)
+    device = torch.device("cpu")
+    if n_steps > 1:
+        source = NStepExperienceSource(env, agent, device, n_steps=n_steps, gamma=gamma)
+    else:
+        source = ExperienceSource(env, agent, device)
+
+    local_version = -1
+    chunk, finished = [], []
+    episode_reward, episode_steps = 0.0, 0
+
+    with torch.no_grad():
+        while not stop.is_set():
+            if shared.version.value != local_version:
+                local_version = shared.version.value
+                shared.load(net, target_net)
+                if quantize and conn is None:
+                    agent.net = quantize_network(net)
+
+            if conn is None:
+                reset_noise(agent.net)
+            exp, reward, done = source.step()
+            chunk.append(_to_numpy(exp))
+            episode_reward += float(reward)
+            episode_steps += 1
+            if done:
+                finished.append((episode_reward, episode_steps))
+                episode_reward, episode_steps = 0.0, 0
+
+            if len(chunk) >= chunk_size:
+                priorities = None if target_net is None else td_priorities(net, target_net, chunk, gamma ** n_steps)
+                while not stop.is_set():
+                    try:
+                        experience_queue.put((chunk, priorities, finished), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                chunk, finished = [], []
+
+    env.close()
+
+
+class ActorPool:
+    """
+    Runs several actor processes, each stepping its own env with a CPU copy of the learner network and a fixed
+    epsilon. The actors send their experiences to the learner through a queue, so the learner only has to add them
+    to its replay buffer and train, it no longer waits on the env.
+
+    The learner publishes its weights to a network kept in shared memory with sync, the actors pick them up
+    before their next step. When a target network is given the actors also compute the initial priority of their
+    experiences, as done in Ape-X, so a prioritized buffer does not have to give them all the max priority.
+
+    Args:
+        env_fn: function creating the env of an actor
+        net: learner network, its architecture is copied into shared memory
+        epsilons: epsilon of each actor, one actor is started for each value
+        n_steps: number of steps accumulated for each experience
+        target_net: learner target network, given when the actors should compute priorities
+        gamma: discount factor used for the n step rewards and the priorities
+        chunk_size: number of experiences an actor sends at a time
+        queue_size: maximum number of chunks waiting for the learner, full queues block the actors
+        start_method: multiprocessing start method, defaults to the platform default
+        server: inference server acting for every actor, the actors then only step their env. Its weights are
+            swapped on every sync and it is closed with the pool
+        quantize: actors act with an int8 dynamically quantised copy of the network, see quantize_network
+    """
+
+    def __init__(self, env_fn: Callable[[], Env], net: nn.Module, epsilons: List[float], n_steps: int = 1,
+                 target_net: Optional[nn.Module] = None, gamma: float = 0.99, chunk_size: int = 32,
+                 queue_size: int = 64, start_method: Optional[str] = None,
+                 server: Optional[InferenceServer] = None, quantize: bool = False) -> None:
+        # pylint: disable=too-many-arguments,too-many-locals
+        ctx = mp.get_context(start_method)
+        self.shared = _SharedNetworks(ctx, net, target_net)
+        self.queue = ctx.Queue(maxsize=queue_size)
+        self.stop = ctx.Event()
+        self.epsilons = epsilons
+        self.server = server
+
+        self.processes = []
+        for index, epsilon in enumerate(epsilons):
+            conn = None
+            if server is not None:
+                server_conn, conn = ctx.Pipe()
+                server.connect(server_conn)
+            process = ctx.Process(target=_actor_loop, daemon=True,
+                                  args=(index, env_fn, self.shared, self.queue, self.stop, epsilon, n_steps, gamma,
+                                        chunk_size, conn, quantize))
+            process.start()
+            if conn is not None:
+                conn.close()
+            self.processes.append(process)
+
+    def __len__(self) -> int:
+        return len(self.processes)
+
+    def sync(self, net: nn.Module, target_net: Optional[nn.Module] = None) -> None:
+        """
+        Publishes the weights of the learner networks to the actors
+
+        Args:
+            net: learner network
+            target_net: learner target network, only used when the actors compute priorities
+        """
+        self.shared.publish(net, target_net)
+        if self.server is not None:
+            self.server.update_weights(net.state_dict())
+
+    def collect(self, block: bool = False,
+                timeout: float = 1.0) -> Tuple[List[Experience], Optional[np.ndarray], List[Tuple[float, int]]]:
+        """
+        Gets every experience the actors have sent so far
+
+        Args:
+            block: wait up to timeout seconds for the first chunk when none is ready
+            timeout: maximum time waited when blocking
+
+        Returns:
+            the experiences, their priorities or None when the actors do not compute them, followed by the total
+            reward and steps of each episode the actors finished
+        """
+        experiences, priorities, finished = [], [], []
+        try:
+            chunk, chunk_priorities, chunk_finished = self.queue.get(timeout=timeout) if block \
+                else self.queue.get_nowait()
+            while True:
+                experiences.extend(chunk)
+                if chunk_priorities is not None:
+                    priorities.append(chunk_priorities)
+                finished.extend(chunk_finished)
+                chunk, chunk_priorities, chunk_finished = self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        priorities = np.concatenate(priorities) if priorities else None
+        return experiences, priorities, finished
+
+    def close(self) -> None:
+        """Stops every actor, draining the queue so none of them stays blocked on it"""
+        self.stop.set()
+        for process in self.processes:
+            while process.is_alive():
+                self.collect()
+                process.join(timeout=0.1)
+        self.processes = []
+        if self.server is not None:
+            self.server.close()
+            self.server = None
@@ -1,5 +1,6 @@
 """Module containing basic type of agents used by the various algorithms"""
 from random import randint
+from typing import Tuple, Union
 
 import numpy as np
 import torch
@@ -7,6 +8,17 @@ from torch import nn
 import torch.nn.functional as F
 
 
+def reset_noise(net: nn.Module) -> None:
+    """
+    Resamples the noise of a noisy network, e.g. before each acting step. Networks without noise are left as they are
+
+    Args:
+        net: acting network, may be None
+    """
+    if hasattr(net, "reset_noise"):
+        net.reset_noise()
+
+
 class Agent:
     """Basic agent that always returns 0"""
 
@@ -25,6 +37,20 @@ class Agent:
         """
         return 0
 
+    # pylint: disable=unused-argument
+    def act_batch(self, states, device: str = None, epsilon=None) -> np.ndarray:
+        """
+        Decide what action to carry out for each state in a batch
+
+        Args:
+            states: batch of states of the environments
+            device: device used for current batch
+            epsilon: exploration rate of each state, not used
+        Returns:
+            action for each state
+        """
+        return np.zeros(len(states), dtype=np.int64)
+
 
 class ValueAgent(Agent):
     """Value based agent that returns an action based on the Q values from the network"""
@@ -62,7 +88,7 @@ class ValueAgent(Agent):
 
         return action
 
-    def get_action(self, state: torch.Tensor, device: torch.device):
+    def get_action(self, state: torch.Tensor, device: torch.device) -> int:
         """
             Returns the best action based on the Q values of the network
             Args:
@@ -71,15 +97,54 @@ class ValueAgent(Agent):
             Returns:
                 action defined by Q values
         """
-        if not isinstance(state, torch.Tensor):
-            state = torch.tensor([state])
+        states = state.unsqueeze(0) if isinstance(state, torch.Tensor) else np.asarray(state)[None]
+        return int(self.greedy_actions(states, device)[0])
 
-        if device.type != 'cpu':
-            state = state.cuda(device)
+    def greedy_actions(self, states, device: torch.device = None) -> np.ndarray:
+        """
+        Returns the action with the highest Q value for each state, without building an autograd graph
 
-        q_values = self.net(state)
-        _, action = torch.max(q_values, dim=1)
-        return int(action.item())
+        Args:
+            states: batch of states
+            device: the device used for the current batch
+
+        Returns:
+            greedy action for each state
+        """
+        states = torch.as_tensor(states, device=device)
+
+        with torch.inference_mode():
+            return self.net(states).argmax(dim=1).cpu().numpy()
+
+    def act_batch(self, states, device: torch.device = None, epsilon=None) -> np.ndarray:
+        """
+        Takes in a batch of states and returns an epsilon greedy action for each of them. The exploring rows are
+        drawn first so the network is only called on the greedy rows
+
+        Args:
+            states: batch of states of the environments
+            device: the device used for the current batch
+            epsilon: epsilon of each row, either a single value or one value per state as used by Ape-X style
+                exploration schedules. Defaults to the epsilon of the agent
+
+        Returns:
+            action for each state
+        """
+        if not isinstance(states, torch.Tensor):
+            states = np.asarray(states)
+        epsilon = self.epsilon if epsilon is None else np.asarray(epsilon)
+
+        explore = np.random.random(len(states)) < epsilon
+        actions = np.random.randint(0, self.action_space, size=len(states))
+
+        greedy = ~explore
+        if greedy.all():
+            actions = self.greedy_actions(states, device)
+        elif greedy.any():
+            mask = torch.from_numpy(greedy) if isinstance(states, torch.Tensor) else greedy
+            actions[greedy] = self.greedy_actions(states[mask], device)
+
+        return actions.astype(np.int64)
 
     def update_epsilon(self, step: int) -> None:
         """
@@ -105,14 +170,48 @@ class PolicyAgent(Agent):
         Returns:
             action defined by policy
         """
-        if device.type != 'cpu':
-            state = state.cuda(device)
+        return int(self.sample_actions(state, device))
 
-        # get the logits and pass through softmax for probability distribution
-        probabilities = F.softmax(self.net(state))
-        prob_np = probabilities.data.cpu().numpy()
+    def sample_actions(self, states, device: torch.device = None,
+                       return_log_probs: bool = False) -> Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Samples an action from the policy for each state of a batch. The sampling happens on the device of the
+        network, so no probabilities are copied to the host
 
-        # take the numpy values and randomly select action based on prob distribution
-        action = np.random.choice(len(prob_np), p=prob_np)
+        Args:
+            states: batch of states, or a single state
+            device: the device used for the current batch
+            return_log_probs: also return the log probability of each sampled action
 
-        return action
+        Returns:
+            sampled actions, followed by their log probabilities when return_log_probs is set
+        """
+        states = torch.as_tensor(states, device=device)
+
+        with torch.no_grad():
+            logits = self.net(states)
+            log_probs = F.log_softmax(logits, dim=-1)
+            flat_probs = log_probs.exp().reshape(-1, log_probs.shape[-1])
+            actions = torch.multinomial(flat_probs, 1).reshape(log_probs.shape[:-1])
+
+            if return_log_probs:
+                return actions, log_probs.gather(-1, actions.unsqueeze(-1)).squeeze(-1)
+
+        return actions
+
+    # pylint: disable=unused-argument
+    def act_batch(self, states, device: torch.device = None, epsilon=None) -> np.ndarray:
+        """
+        Samples an action from the policy for each state in a batch
+
+        Args:
+            states: batch of states of the environments
+            device: the device used for the current batch
+            epsilon: not used, the policy does its own exploration
+
+        Returns:
+            action for each state
+        """
+        if not isinstance(states, torch.Tensor):
+            states = np.asarray(states)
+        return self.sample_actions(states, device).cpu().numpy()
@@ -32,4 +32,6 @@ def add_base_args(parent) -> argparse.ArgumentParser:
                             help="seed for training run")
     arg_parser.add_argument("--backend", type=str, default="dp",
                             help="distributed backend to be used by lightning")
+    arg_parser.add_argument("--export_path", type=str, default=None,
+                            help="file the trained acting policy is exported to as TorchScript")
     return arg_parser
@@ -1,12 +1,13 @@
 """Experience sources to be used as datasets for Ligthning DataLoaders"""
 from collections import deque
-from typing import List, Tuple
+from typing import Iterator, List, Optional, Tuple
 
 import numpy as np
+import torch
 from gym import Env
-from torch.utils.data import IterableDataset
+from torch.utils.data import IterableDataset, get_worker_info
 from algos.common.agents import Agent
-from algos.common.memory import Experience, Buffer
+from algos.common.memory import Experience, Buffer, Rollout, RolloutBuffer
 
 
 class RLDataset(IterableDataset):
@@ -51,6 +52,59 @@ class PrioRLDataset(RLDataset):
             yield (states[idx], actions[idx], rewards[idx], dones[idx], new_states[idx]), indices[idx], weights[idx]
 
 
+def _split_batches(sample, batch_size: int) -> List:
+    """Converts a sample of numpy arrays to tensors and splits it into minibatches, keeping the nesting of the sample"""
+    if isinstance(sample, (tuple, list)):
+        return list(zip(*(_split_batches(item, batch_size) for item in sample)))
+    return list(torch.as_tensor(sample).split(batch_size))
+
+
+class ReplayBatchStream(IterableDataset):
+    """
+    Stream of ready collated minibatches drawn from the replay buffer. The buffer already returns stacked arrays, so
+    they are turned into tensors once per sample call instead of being split into experiences and collated again by
+    the DataLoader, which must be created with batch_size=None. Each iteration gives num_batches minibatches, e.g.
+    one training epoch, shared out between the DataLoader workers. Without num_batches the stream is endless, so the
+    epoch never ends and training is only bounded by max_steps.
+
+    Works with both the uniform and the prioritized buffers, the minibatches keep the layout of the buffer sample,
+    e.g. (states, actions, rewards, dones, next_states) or ((states, ...), indices, weights)
+
+    Args:
+        buffer: replay buffer
+        batch_size: number of experiences in each minibatch
+        batches_per_sample: number of minibatches drawn by each call to the buffer sample
+        num_batches: number of minibatches before the stream ends, over all the DataLoader workers, None for an
+            endless stream
+    """
+
+    def __init__(self, buffer: Buffer, batch_size: int, batches_per_sample: int = 1,
+                 num_batches: Optional[int] = None) -> None:
+        self.buffer = buffer
+        self.batch_size = batch_size
+        self.batches_per_sample = batches_per_sample
+        self.num_batches = num_batches
+
+    def __iter__(self) -> Iterator:
+        num_batches = self.num_batches
+        worker_info = get_worker_info()
+        if num_batches is not None and worker_info is not None:
+            num_batches = len(range(worker_info.id, num_batches, worker_info.num_workers))
+
+        count = 0
+        while num_batches is None or count < num_batches:
+            batches = self.batches_per_sample
+            if num_batches is not None:
+                batches = min(batches, num_batches - count)
+
+            yield from _split_batches(self.buffer.sample(self.batch_size * batches), self.batch_size)
+            count += batches
+
+    def __getitem__(self, item):
+        """Not used"""
+        return None
+
+
 class ExperienceSource:
     """
     Basic single step experience source
@@ -95,10 +149,20 @@ class ExperienceSource:
 
 
 class NStepExperienceSource(ExperienceSource):
-    """Expands upon the basic ExperienceSource by collecting experience across N steps"""
-    def __init__(self, env: Env, agent: Agent, device, n_steps: int = 1):
+    """
+    Expands upon the basic ExperienceSource by collecting experience across N steps
+
+    Args:
+        env: Environment that is being used
+        agent: Agent being used to make decisions
+        device: device used to run the agent
+        n_steps: number of steps to accumulate for each experience
+        gamma: discount factor used to accumulate the n step rewards
+    """
+    def __init__(self, env: Env, agent: Agent, device, n_steps: int = 1, gamma: float = 0.9):
         super().__init__(env, agent, device)
         self.n_steps = n_steps
+        self.gamma = gamma
         self.n_step_buffer = deque(maxlen=n_steps)
 
     def step(self) -> Tuple[Experience, float, bool]:
@@ -134,15 +198,16 @@ class NStepExperienceSource(ExperienceSource):
         self.n_step_buffer.append(exp)
         return exp
 
-    def get_transition_info(self, gamma=0.9) -> Tuple[np.float, np.array, np.int]:
+    def get_transition_info(self, gamma: Optional[float] = None) -> Tuple[np.float, np.array, np.int]:
         """
         get the accumulated transition info for the n_step_buffer
         Args:
-            gamma: discount factor
+            gamma: discount factor, defaults to the gamma of the source
 
         Returns:
             multi step reward, final observation and done
         """
+        gamma = self.gamma if gamma is None else gamma
         last_experience = self.n_step_buffer[-1]
         final_state = last_experience.new_state
         done = last_experience.done
@@ -161,6 +226,159 @@ class NStepExperienceSource(ExperienceSource):
         return reward, final_state, done
 
 
+class NStepAccumulator:
+    """
+    Accumulates the n step experiences of a vector of environments stepped together. The last n steps of every
+    environment are kept in numpy rings of shape (num_envs, n_steps) along with the discounted return accumulated
+    so far for each of them, so a step only costs a few array operations whatever the number of environments and
+    n_steps.
+
+    Once a step is n steps old its experience is emitted. When an episode ends every pending step of that
+    environment is emitted at once, with the terminal state as next state, and its ring starts over.
+
+    Args:
+        num_envs: number of environments
+        n_steps: number of steps accumulated for each experience
+        gamma: discount factor used to accumulate the n step rewards
+    """
+
+    def __init__(self, num_envs: int, n_steps: int, gamma: float = 0.9) -> None:
+        self.num_envs = num_envs
+        self.n_steps = n_steps
+        self.gamma = gamma
+        self.pos = 0
+
+        self.states = None
+        self.actions = None
+        self.returns = np.zeros((num_envs, n_steps), dtype=np.float32)
+        self.ages = np.zeros((num_envs, n_steps), dtype=np.int64)
+        self.pending = np.zeros((num_envs, n_steps), dtype=np.bool_)
+        self.discounts = (gamma ** np.arange(n_steps)).astype(np.float32)
+
+    def add(self, states: np.ndarray, actions: np.ndarray, rewards: np.ndarray, dones: np.ndarray,
+            new_states: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """
+        Adds a step of every environment and emits the experiences completed by it
+
+        Args:
+            states: state of each environment before the step
+            actions: action taken in each environment
+            rewards: reward of each environment
+            dones: whether the episode of each environment ended
+            new_states: state of each environment after the step, the terminal state when the episode ended
+
+        Returns:
+            arrays of states, actions, n step rewards, dones and next states of the completed experiences
+        """
+        states, actions = np.asarray(states), np.asarray(actions)
+        rewards, dones = np.asarray(rewards, dtype=np.float32), np.asarray(dones, dtype=np.bool_)
+        if self.states is None:
+            self.states = np.zeros((self.num_envs, self.n_steps, *states.shape[1:]), dtype=states.dtype)
+            self.actions = np.zeros((self.num_envs, self.n_steps, *actions.shape[1:]), dtype=actions.dtype)
+
+        slot = self.pos
+        self.pos = (self.pos + 1) % self.n_steps
+        self.states[:, slot] = states
+        self.actions[:, slot] = actions
+        self.returns[:, slot] = 0.0
+        self.ages[:, slot] = 0
+        self.pending[:, slot] = True
+
+        self.returns += np.where(self.pending, self.discounts[np.minimum(self.ages, self.n_steps - 1)], 0.0) \
+            * rewards[:, None]
+        self.ages += self.pending
+
+        completed = self.pending & ((self.ages == self.n_steps) | dones[:, None])
+        env_idx, slot_idx = np.nonzero(completed)
+        self.pending[env_idx, slot_idx] = False
+
+        return (self.states[env_idx, slot_idx], self.actions[env_idx, slot_idx], self.returns[env_idx, slot_idx],
+                dones[env_idx], np.asarray(new_states)[env_idx])
+
+
+class VectorExperienceSource:
+    """
+    Experience source that steps a vector of environments together. The agent is called once on the batch of
+    states of every environment and each call returns one experience per environment. When n_steps > 1 the
+    experiences are accumulated over n steps for each environment by an NStepAccumulator
+
+    Args:
+        env: vector of environments that is being used, e.g. a SyncVectorEnv
+        agent: Agent being used to make decisions
+        device: device used to run the agent
+        n_steps: number of steps to accumulate for each experience
+        gamma: discount factor used to accumulate the n step rewards
+        epsilons: fixed epsilon of each environment, e.g. from actor_epsilons. By default every environment uses
+            the epsilon of the agent
+    """
+
+    def __init__(self, env, agent: Agent, device, n_steps: int = 1, gamma: float = 0.9,
+                 epsilons: Optional[List[float]] = None) -> None:
+        self.env = env
+        self.agent = agent
+        self.device = device
+        self.n_steps = n_steps
+        self.gamma = gamma
+        self.epsilons = None if epsilons is None else np.asarray(epsilons)
+        self.num_envs = len(env)
+        self.states = self.env.reset()
+
+        self.accumulator = NStepAccumulator(self.num_envs, n_steps, gamma) if n_steps > 1 else None
+        self.episode_rewards = np.zeros(self.num_envs, dtype=np.float32)
+        self.episode_steps = np.zeros(self.num_envs, dtype=np.int64)
+        self.finished_episodes = []
+
+    def step(self) -> Tuple[List[Experience], np.ndarray, np.ndarray]:
+        """
+        Takes a single step in every environment
+
+        Returns:
+            the experiences ready to be stored, followed by the reward and done of each environment for this step
+        """
+        if self.epsilons is None:
+            actions = self.agent.act_batch(self.states, self.device)
+        else:
+            actions = self.agent.act_batch(self.states, self.device, epsilon=self.epsilons)
+        new_states, rewards, dones, states = self.env.step(actions)
+
+        if self.accumulator is None:
+            experiences = [Experience(*exp) for exp in zip(self.states, actions, rewards, dones, new_states)]
+        else:
+            completed = self.accumulator.add(self.states, actions, rewards, dones, new_states)
+            experiences = [Experience(*exp) for exp in zip(*completed)]
+
+        self.episode_rewards += rewards
+        self.episode_steps += 1
+        for idx in np.flatnonzero(dones):
+            self.finished_episodes.append((float(self.episode_rewards[idx]), int(self.episode_steps[idx])))
+            self.episode_rewards[idx] = 0
+            self.episode_steps[idx] = 0
+
+        self.states = states
+
+        return experiences, rewards, dones
+
+    def pop_rewards_steps(self) -> List[Tuple[float, int]]:
+        """
+        Returns the total reward and number of steps of every episode that finished since the last call
+
+        Returns:
+            list of (total reward, steps) for each finished episode
+        """
+        finished = self.finished_episodes
+        self.finished_episodes = []
+        return finished
+
+    def run_episode(self) -> float:
+        """Steps every environment until the first one finishes its episode and returns its total reward. This is
+        used for testing"""
+        self.pop_rewards_steps()
+        while not self.finished_episodes:
+            self.step()
+
+        return self.pop_rewards_steps()[0][0]
+
+
 class EpisodicExperienceStream(ExperienceSource, IterableDataset):
     """
     Basic experience stream that iteratively yield the current experience of the agent in the env
@@ -207,3 +425,40 @@ class EpisodicExperienceStream(ExperienceSource, IterableDataset):
             self.state = self.env.reset()
 
         return experience
+
+
+class EpisodicRolloutStream(EpisodicExperienceStream):
+    """
+    Experience stream that plays whole episodes and yields them as a single Rollout of flat tensors, to be used with
+    a DataLoader with batch_size=None so nothing is collated. The steps are written into two RolloutBuffers used in
+    turn, as Lightning plays the next rollout before training on the current one
+
+    Args:
+        env: Environment that is being used
+        agent: Agent being used to make decisions
+        device: device used to run the agent
+        episodes: number of episodes in each rollout
+        capacity: initial number of steps of the rollout buffers
+    """
+
+    def __init__(self, env: Env, agent: Agent, device, episodes: int = 1, capacity: int = 1024):
+        super().__init__(env, agent, device, episodes=episodes)
+        self.buffers = [RolloutBuffer(capacity), RolloutBuffer(capacity)]
+        self.turn = 0
+
+    def __iter__(self) -> Iterator[Rollout]:
+        """
+        Plays steps through the environment until the rollout holds enough complete episodes
+
+        Returns:
+            rollout of all transitions of the episodes
+        """
+        buffer = self.buffers[self.turn]
+        self.turn = 1 - self.turn
+        buffer.clear()
+
+        while buffer.num_episodes < self.episodes:
+            exp = self.step()
+            buffer.append(exp.state, exp.action, exp.reward, exp.done)
+
+        yield buffer.rollout()
@@ -0,0 +1,169 @@
+"""
+Export of trained networks as standalone TorchScript acting policies. The exported file holds the network and the
+action selection, so it can be loaded with torch alone, without Lightning or the training code
+"""
+from typing import Union
+
+import numpy as np
+import torch
+from torch import nn, Tensor
+
+from algos.common.agents import Agent
+
+
+class EpsilonGreedyPolicy(nn.Module):
+    """
+    Acting head for value networks, picks the action with the highest Q value and replaces it by a random action
+    with probability epsilon
+
+    Args:
+        net: value network returning the Q value of each action
+        n_actions: number of actions
+    """
+
+    def __init__(self, net: nn.Module, n_actions: int) -> None:
+        super().__init__()
+        self.net = net
+        self.n_actions = n_actions
+
+    def forward(self, states: Tensor, epsilon: Tensor) -> Tensor:
+        """
+        Selects an action for each state
+
+        Args:
+            states: batch of states
+            epsilon: exploration rate, a single value or one per state
+
+        Returns:
+            action for each state
+        """
+        actions = self.net(states).argmax(dim=1)
+        random_actions = torch.randint(0, self.n_actions, actions.shape, device=actions.device)
+        explore = torch.rand(actions.shape, device=actions.device) < epsilon
+        return torch.where(explore, random_actions, actions)
+
+
+class CategoricalPolicy(nn.Module):
+    """
+    Acting head for policy networks, samples an action from the softmax of the logits
+
+    Args:
+        net: policy network returning the logits of each action
+    """
+
+    def __init__(self, net: nn.Module) -> None:
+        super().__init__()
+        self.net = net
+
+    def forward(self, states: Tensor) -> Tensor:
+        """
+        Samples an action for each state
+
+        Args:
+            states: batch of states
+
+        Returns:
+            action for each state
+        """
+        probs = torch.softmax(self.net(states), dim=-1)
+        return torch.multinomial(probs, 1).squeeze(-1)
+
+
+def export_policy(net: nn.Module, example_states: Tensor, path: str, n_actions: int = None,
+                  head: str = "greedy") -> torch.jit.ScriptModule:
+    """
+    Traces the network together with its acting head and saves the frozen result as a TorchScript file
+
+    Args:
+        net: trained network, a copy is not made so it is put in eval mode
+        example_states: batch of states with the shape and dtype the policy will receive
+        path: file the policy is saved to
+        n_actions: number of actions, needed by the greedy head
+        head: greedy for value networks or categorical for policy networks
+
+    Returns:
+        the exported policy
+    """
+    if head == "greedy":
+        policy = EpsilonGreedyPolicy(net, n_actions)
+        example_inputs = (example_states, torch.tensor(0.0))
+    elif head == "categorical":
+        policy = CategoricalPolicy(net)
+        example_inputs = (example_states,)
+    else:
+        raise ValueError(f"Unknown policy head {head}")
+
+    policy.eval()
+    with torch.no_grad():
+        scripted = torch.jit.trace(policy, example_inputs, check_trace=False)
+    scripted = torch.jit.freeze(scripted)
+    torch.jit.save(scripted, path)
+
+    return scripted
+
+
+def load_policy(path: str, device: Union[str, torch.device] = "cpu") -> torch.jit.ScriptModule:
+    """
+    Loads a policy saved by export_policy
+
+    Args:
+        path: file the policy was saved to
+        device: device the policy is loaded on
+
+    Returns:
+        the policy, called with a batch of states (and epsilon for the greedy head) it returns an action per state
+    """
+    return torch.jit.load(path, map_location=device)
+
+
+class ScriptedAgent(Agent):
+    """
+    Agent acting with an exported policy, it can replace the training agents in the experience sources, e.g. for
+    evaluation or in actors deployed without the training code
+
+    Args:
+        policy: policy returned by export_policy or load_policy
+        epsilon: exploration rate given to greedy policies, None for categorical policies
+    """
+
+    def __init__(self, policy: torch.jit.ScriptModule, epsilon: float = None) -> None:
+        super().__init__(policy)
+        self.epsilon = epsilon
+
+    def __call__(self, state, device: torch.device = None) -> int:
+        """
+        Selects the action of a single state
+
+        Args:
+            state: current state of the environment
+            device: device the state is moved to
+
+        Returns:
+            action
+        """
+        state = torch.as_tensor(np.asarray(state), device=device).unsqueeze(0)
+        return int(self.act_batch(state, device)[0])
+
+    def act_batch(self, states, device: torch.device = None, epsilon=None) -> np.ndarray:
+        """
+        Selects an action for each state in a batch
+
+        Args:
+            states: batch of states of the environments
+            device: device the states are moved to
+            epsilon: exploration rate of each state, defaults to the epsilon of this agent
+
+        Returns:
+            action for each state
+        """
+        states = torch.as_tensor(states if isinstance(states, Tensor) else np.asarray(states), device=device)
+
+        with torch.no_grad():
+            if self.epsilon is None:
+                actions = self.net(states)
+            else:
+                epsilon = torch.as_tensor(self.epsilon if epsilon is None else epsilon, dtype=torch.float32,
+                                          device=states.device)
+                actions = self.net(states, epsilon)
+
+        return actions.cpu().numpy()
@@ -0,0 +1,226 @@
+"""Inference server batching the action requests of many actors into a single forward pass"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+from algos.common.agents import Agent, reset_noise
+
+
+class InferenceServer:
+    """
+    Owns the acting network and answers the action requests of many actor threads or processes. Waiting requests
+    are grouped into micro batches of at most max_batch_size states, a batch is run as soon as it is full or once
+    max_wait seconds have passed since its first request. Each request gets its action back through a future.
+
+    The weights can be swapped while the server runs, the new weights are loaded between two batches. The noise
+    of a noisy network is resampled before every micro batch.
+
+    Args:
+        agent: agent owning the acting network, e.g. a ValueAgent or a PolicyAgent. Its act_batch is called on
+            every micro batch
+        device: device used to run the network
+        max_batch_size: maximum number of states in a micro batch
+        max_wait: maximum time in seconds a request waits for the micro batch to fill up
+    """
+
+    def __init__(self, agent: Agent, device: torch.device = None, max_batch_size: int = 64,
+                 max_wait: float = 0.002) -> None:
+        self.agent = agent
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.requests = queue.Queue()
+        self.weights_lock = threading.Lock()
+        self.pending_weights = None
+        self.num_batches = 0
+        self.num_requests = 0
+        self.clients = []
+
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def submit(self, state, epsilon: Optional[float] = None) -> Future:
+        """
+        Queues a state to be acted on
+
+        Args:
+            state: state of the environment
+            epsilon: exploration rate for this request, defaults to the epsilon of the agent
+
+        Returns:
+            future holding the action once the micro batch has been run
+        """
+        future = Future()
+        self.requests.put((state, epsilon, future))
+        return future
+
+    def act(self, state, epsilon: Optional[float] = None) -> int:
+        """Blocking version of submit returning the action"""
+        return self.submit(state, epsilon).result()
+
+    def update_weights(self, state_dict: Dict[str, torch.Tensor]) -> None:
+        """
+        Swaps in new weights for the acting network, they are copied so the caller can keep training on its own
+
+        Args:
+            state_dict: new weights of the network
+        """
+        weights = {name: tensor.detach().to("cpu", copy=True) for name, tensor in state_dict.items()}
+        with self.weights_lock:
+            self.pending_weights = weights
+
+    def connect(self, conn) -> None:
+        """
+        Serves the requests of an actor process sending them through a multiprocessing connection, see
+        RemoteAgent. The actions are sent back in the order the requests were received
+
+        Args:
+            conn: server end of a multiprocessing pipe
+        """
+        thread = threading.Thread(target=self._serve_connection, args=(conn,), daemon=True)
+        thread.start()
+        self.clients.append(thread)
+
+    def close(self) -> None:
+        """Answers the waiting requests and stops the server"""
+        self.requests.put(None)
+        self.thread.join()
+
+    def _serve_connection(self, conn) -> None:
+        """Forwards the requests of a connection to the server until the other end is closed"""
+        try:
+            while True:
+                state, epsilon = conn.recv()
+                self.submit(state, epsilon).add_done_callback(partial(_reply, conn))
+        except (EOFError, OSError):
+            pass
+
+    def _next_batch(self) -> Optional[List]:
+        """Waits for a request, then gathers more until the batch is full or max_wait has passed"""
+        request = self.requests.get()
+        if request is None:
+            return None
+
+        batch = [request]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+
+        return batch
+
+    def _swap_weights(self) -> None:
+        """Loads the weights given to update_weights since the last batch"""
+        with self.weights_lock:
+            weights, self.pending_weights = self.pending_weights, None
+        if weights is not None:
+            self.agent.net.load_state_dict(weights)
+
+    def _serve(self) -> None:
+        """Runs a forward pass for each micro batch until close is called"""
+        batch = self._next_batch()
+        while batch is not None:
+            self._swap_weights()
+            reset_noise(getattr(self.agent, "net", None))
+            states, epsilons, futures = zip(*batch)
+            default_epsilon = getattr(self.agent, "epsilon", 0.0)
+            epsilons = np.array([default_epsilon if eps is None else eps for eps in epsilons])
+
+            try:
+                actions = self.agent.act_batch(np.stack([np.asarray(state) for state in states]), self.device,
+                                               epsilon=epsilons)
+            except Exception as err:  # pylint: disable=broad-except
+                for future in futures:
+                    future.set_exception(err)
+            else:
+                for future, action in zip(futures, actions):
+                    future.set_result(int(action))
+
+            self.num_batches += 1
+            self.num_requests += len(batch)
+            batch = self._next_batch()
+
+
+def _reply(conn, future: Future) -> None:
+    """
+    Sends the action of a request back through its connection. When acting failed the error is sent instead, so
+    the RemoteAgent raises it rather than waiting forever for an action
+
+    Args:
+        conn: server end of the pipe of the actor
+        future: future of the request
+    """
+    try:
+        result = future.result()
+    except Exception as err:  # pylint: disable=broad-except
+        result = RuntimeError(f"The inference server failed to act: {err!r}")
+    conn.send(result)
+
+
+class RemoteAgent(Agent):
+    """
+    Agent used in an actor process, it sends its states to an InferenceServer in the learner process instead of
+    running a network itself
+
+    Args:
+        conn: actor end of a multiprocessing pipe whose other end was given to InferenceServer.connect
+        epsilon: exploration rate of this actor, defaults to the epsilon of the server agent
+    """
+
+    def __init__(self, conn, epsilon: Optional[float] = None) -> None:
+        super().__init__(net=None)
+        self.conn = conn
+        self.epsilon = epsilon
+
+    def __call__(self, state, device: str = None) -> int:
+        """
+        Asks the server for the action of a single state
+
+        Args:
+            state: current state of the environment
+            device: not used, the server decides where the network runs
+
+        Returns:
+            action
+        """
+        self.conn.send((np.asarray(state), self.epsilon))
+        return self._receive()
+
+    def act_batch(self, states, device: str = None, epsilon=None) -> np.ndarray:
+        """
+        Sends every state of the batch before waiting for the first action, so the server can put them in the same
+        micro batch
+
+        Args:
+            states: batch of states of the environments
+            device: not used, the server decides where the network runs
+            epsilon: exploration rate of each state, defaults to the epsilon of this agent
+
+        Returns:
+            action for each state
+        """
+        epsilons = np.broadcast_to(self.epsilon if epsilon is None else epsilon, (len(states),))
+        for state, eps in zip(states, epsilons):
+            self.conn.send((np.asarray(state), None if eps is None else float(eps)))
+        return np.array([self._receive() for _ in range(len(states))], dtype=np.int64)
+
+    def _receive(self) -> int:
+        """Waits for the next action, raising the error sent by the server when acting failed"""
+        result = self.conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
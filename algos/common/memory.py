@@ -1,17 +1,25 @@
 """Series of memory buffers sued"""
+# pylint: disable=too-many-lines
 
 # Named tuple for storing experience steps gathered in training
 import collections
-from typing import Tuple, List, Union
+import os
+import queue
+import threading
+from typing import Optional, Tuple, List, Union
 from collections import deque, namedtuple
 
 import numpy as np
+import torch
 
 
 Experience = namedtuple(
     'Experience', field_names=['state', 'action', 'reward',
                                'done', 'new_state'])
 
+# Whole episodes stored as flat tensors, episode i holds the steps offsets[i]:offsets[i + 1]
+Rollout = namedtuple('Rollout', field_names=['states', 'actions', 'rewards', 'dones', 'offsets'])
+
 
 class Buffer:
     """
@@ -76,6 +84,456 @@ class ReplayBuffer(Buffer):
                 np.array(dones, dtype=np.bool), np.array(next_states))
 
 
+class RingReplayBuffer:
+    """
+    Replay Buffer that preallocates a typed numpy array for each field of the experience and writes to them as a
+    ring. Appending is a single slot write and sampling is a single gather over each field.
+
+    Args:
+        capacity: size of the buffer
+        obs_shape: shape of a single observation
+        obs_dtype: dtype used to store the observations
+        action_shape: shape of a single action, empty for discrete actions
+        action_dtype: dtype used to store the actions
+    """
+
+    def __init__(self, capacity: int, obs_shape: Tuple, obs_dtype=np.float32,
+                 action_shape: Tuple = (), action_dtype=np.int64) -> None:
+        self.capacity = capacity
+        self.obs_shape = tuple(obs_shape)
+        self.pos = 0
+        self.size = 0
+
+        self._allocate_fields(obs_dtype, tuple(action_shape), action_dtype)
+
+    @classmethod
+    def from_env(cls, capacity: int, env, **kwargs) -> 'RingReplayBuffer':
+        """
+        Creates a buffer with field arrays sized from the observation and action space of the env
+
+        Args:
+            capacity: size of the buffer
+            env: environment the experiences will be gathered from
+            kwargs: any extra arguments for the buffer
+
+        Returns:
+            buffer ready to store experiences from the env
+        """
+        obs_space = env.observation_space
+        action_space = env.action_space
+
+        if action_space.shape:
+            action_shape, action_dtype = action_space.shape, action_space.dtype
+        else:
+            action_shape, action_dtype = (), np.int64
+
+        return cls(capacity, obs_space.shape, obs_dtype=obs_space.dtype,
+                   action_shape=action_shape, action_dtype=action_dtype, **kwargs)
+
+    def _allocate_fields(self, obs_dtype, action_shape: Tuple, action_dtype) -> None:
+        """
+        Allocates the arrays holding each field of the experience
+
+        Args:
+            obs_dtype: dtype used to store the observations
+            action_shape: shape of a single action
+            action_dtype: dtype used to store the actions
+        """
+        self.states = self._allocate('states', self.obs_shape, obs_dtype)
+        self.actions = self._allocate('actions', action_shape, action_dtype)
+        self.rewards = self._allocate('rewards', (), np.float32)
+        self.dones = self._allocate('dones', (), np.bool_)
+        self.next_states = self._allocate('next_states', self.obs_shape, obs_dtype)
+
+    # pylint: disable=unused-argument
+    def _allocate(self, name: str, shape: Tuple, dtype) -> np.ndarray:
+        """
+        Allocates the storage for a single field of the experience
+
+        Args:
+            name: name of the field
+            shape: shape of a single entry of the field
+            dtype: dtype of the field
+
+        Returns:
+            array with room for capacity entries
+        """
+        return np.zeros((self.capacity, *shape), dtype=dtype)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, experience: Experience) -> int:
+        """
+        Writes the experience into the next slot of the ring, overwriting the oldest experience once full
+
+        Args:
+            experience: tuple (state, action, reward, done, new_state)
+
+        Returns:
+            index of the slot that was written
+        """
+        idx = self.pos
+        self._write(idx, experience)
+
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+        return idx
+
+    def _write(self, idx: int, experience: Experience) -> None:
+        """
+        Writes each field of the experience into the given slot
+
+        Args:
+            idx: slot of the buffer to write
+            experience: tuple (state, action, reward, done, new_state)
+        """
+        self.states[idx] = experience.state
+        self.actions[idx] = experience.action
+        self.rewards[idx] = experience.reward
+        self.dones[idx] = experience.done
+        self.next_states[idx] = experience.new_state
+
+    def _sample_indices(self, batch_size: int) -> np.ndarray:
+        """
+        Draws uniform indices of the slots that can be sampled. Indices are drawn with replacement so the cost does
+        not depend on the size of the buffer
+
+        Args:
+            batch_size: number of indices to draw
+
+        Returns:
+            slots of the buffer
+        """
+        return np.random.randint(0, self.size, size=batch_size)
+
+    def _gather(self, indices: np.ndarray) -> Tuple:
+        """
+        Retrieves the experiences at the given slots
+
+        Args:
+            indices: slots of the buffer to gather
+
+        Returns:
+            a batch of tuple np arrays of state, action, reward, done, next_state
+        """
+        return (self.states[indices], self.actions[indices], self.rewards[indices],
+                self.dones[indices], self.next_states[indices])
+
+    def sample(self, batch_size: int) -> Tuple:
+        """
+        Takes a uniform sample of the buffer
+
+        Args:
+            batch_size: current batch_size
+
+        Returns:
+            a batch of tuple np arrays of state, action, reward, done, next_state
+        """
+        return self._gather(self._sample_indices(batch_size))
+
+
+class FrameStackReplayBuffer(RingReplayBuffer):
+    """
+    Replay Buffer for stacked frame observations, such as those produced by wrappers.BufferWrapper. Consecutive
+    stacked observations share all but one of their frames, so only the newest frame of each state is stored, once,
+    as uint8. The stacked state and next_state are rebuilt from the neighbouring slots when sampled, with the frames
+    from before the start of an episode filled with zeros the same way BufferWrapper does on reset.
+
+    The last frame of the next_state of a terminal experience is replaced by the first frame of the next episode.
+    This is harmless for the value targets as the done flag masks out the next state.
+
+    Args:
+        capacity: size of the buffer
+        obs_shape: shape of a single stacked observation (stack_size, height, width)
+        obs_dtype: dtype of the observations given to and returned by the buffer
+        action_shape: shape of a single action, empty for discrete actions
+        action_dtype: dtype used to store the actions
+        scale: factor applied to the observations before they are stored as uint8 and removed again when sampled.
+            Defaults to 255 for float observations scaled to [0, 1] and 1 for uint8 observations
+    """
+
+    def __init__(self, capacity: int, obs_shape: Tuple, obs_dtype=np.uint8, action_shape: Tuple = (),
+                 action_dtype=np.int64, scale: float = None) -> None:
+        if scale is None:
+            scale = 1.0 if np.dtype(obs_dtype) == np.uint8 else 255.0
+        self.scale = scale
+        self.obs_dtype = np.dtype(obs_dtype)
+        self.stack_size = obs_shape[0]
+        self.episode_start = True
+        super().__init__(capacity, obs_shape, obs_dtype=obs_dtype, action_shape=action_shape,
+                         action_dtype=action_dtype)
+
+    # pylint: disable=unused-argument
+    def _allocate_fields(self, obs_dtype, action_shape: Tuple, action_dtype) -> None:
+        """
+        Allocates a single uint8 frame per slot along with the flag marking the first step of each episode
+
+        Args:
+            obs_dtype: dtype of the observations, frames are always stored as uint8
+            action_shape: shape of a single action
+            action_dtype: dtype used to store the actions
+        """
+        self.frames = self._allocate('frames', self.obs_shape[1:], np.uint8)
+        self.actions = self._allocate('actions', action_shape, action_dtype)
+        self.rewards = self._allocate('rewards', (), np.float32)
+        self.dones = self._allocate('dones', (), np.bool_)
+        self.starts = self._allocate('starts', (), np.bool_)
+
+    def _encode(self, frame) -> np.ndarray:
+        """Converts a single frame to its stored uint8 form"""
+        frame = np.asarray(frame)
+        if self.scale != 1.0:
+            frame = np.rint(frame * self.scale)
+        return frame.astype(np.uint8)
+
+    def _decode(self, frames: np.ndarray) -> np.ndarray:
+        """Converts stored frames back to the dtype and range of the observations"""
+        if self.scale != 1.0:
+            return (frames.astype(np.float32) / self.scale).astype(self.obs_dtype)
+        return frames.astype(self.obs_dtype, copy=False)
+
+    def _write(self, idx: int, experience: Experience) -> None:
+        """
+        Writes the newest frame of the state to the slot. The newest frame of new_state is written to the following
+        slot, it becomes the state frame of the next experience and lets the latest experience be sampled before
+        the next one arrives
+
+        Args:
+            idx: slot of the buffer to write
+            experience: tuple (state, action, reward, done, new_state)
+        """
+        self.frames[idx] = self._encode(experience.state[-1])
+        self.actions[idx] = experience.action
+        self.rewards[idx] = experience.reward
+        self.dones[idx] = experience.done
+        self.starts[idx] = self.episode_start
+        self.frames[(idx + 1) % self.capacity] = self._encode(experience.new_state[-1])
+
+        self.episode_start = bool(experience.done)
+
+    def _oldest(self) -> int:
+        """Slot of the oldest experience that can still be sampled"""
+        if self.size < self.capacity:
+            return 0
+        return (self.pos + 1) % self.capacity
+
+    def _sample_indices(self, batch_size: int) -> np.ndarray:
+        """
+        Draws uniform indices of the slots that can be sampled. Once the buffer is full the slot at the write
+        position holds the frame of the latest new_state instead of its own, so it is skipped, and the frames that
+        came before the oldest slots have been overwritten. The stack_size - 1 oldest slots are skipped as well so
+        every sampled state is rebuilt with all of its frames
+
+        Args:
+            batch_size: number of indices to draw
+
+        Returns:
+            slots of the buffer
+        """
+        if self.size < self.capacity:
+            return np.random.randint(0, self.size, size=batch_size)
+        offsets = np.random.randint(0, self.capacity - self.stack_size, size=batch_size)
+        return (self._oldest() + self.stack_size - 1 + offsets) % self.capacity
+
+    def _stack(self, indices: np.ndarray) -> np.ndarray:
+        """
+        Rebuilds the stacked observations ending at each of the indices. Going back in time from each index, frames
+        are zeroed from the first one that belongs to a previous episode or that is older than the oldest slot
+
+        Args:
+            indices: slots holding the newest frame of each observation
+
+        Returns:
+            uint8 stacked observations
+        """
+        stacked = np.zeros((len(indices), *self.obs_shape), dtype=np.uint8)
+        stacked[:, -1] = self.frames[indices]
+
+        oldest = self._oldest()
+        valid = np.ones(len(indices), dtype=np.bool_)
+        for k in range(1, self.stack_size):
+            later = (indices - k + 1) % self.capacity
+            valid &= ~self.starts[later] & (later != oldest)
+            earlier = (indices - k) % self.capacity
+            stacked[valid, -1 - k] = self.frames[earlier[valid]]
+
+        return stacked
+
+    def _gather(self, indices: np.ndarray) -> Tuple:
+        """
+        Retrieves the experiences at the given slots, rebuilding the stacked state and next_state
+
+        Args:
+            indices: slots of the buffer to gather
+
+        Returns:
+            a batch of tuple np arrays of state, action, reward, done, next_state
+        """
+        states = self._stack(indices)
+        next_frames = self.frames[(indices + 1) % self.capacity]
+        next_states = np.concatenate([states[:, 1:], next_frames[:, None]], axis=1)
+
+        return (self._decode(states), self.actions[indices], self.rewards[indices],
+                self.dones[indices], self._decode(next_states))
+
+
+class NStepReplayBuffer(RingReplayBuffer):
+    """
+    Ring replay buffer storing single step experiences of one env in the order they happened, the n step returns
+    are computed when sampling. For each sampled slot the rewards of the following n_steps slots are discounted and
+    summed, stopping at the end of the episode, and the next_state and done of the last of these steps are returned.
+    All of it is done with a few gathers over the window of slots of the whole batch.
+
+    As nothing is folded into the stored experiences, n_steps and gamma can be changed at any time, e.g. to sweep
+    them without collecting the experience again. The newest n_steps - 1 slots are not sampled until their window
+    is complete, so the value of the next state is always discounted by gamma ** n_steps unless the episode ended.
+
+    Args:
+        capacity: size of the buffer
+        obs_shape: shape of a single observation
+        n_steps: number of steps accumulated for each sampled experience
+        gamma: discount factor of the n step rewards
+        kwargs: any extra arguments for the buffer
+    """
+
+    def __init__(self, capacity: int, obs_shape: Tuple, n_steps: int = 1, gamma: float = 0.99, **kwargs) -> None:
+        super().__init__(capacity, obs_shape, **kwargs)
+        self.n_steps = n_steps
+        self.gamma = gamma
+
+    def _sample_indices(self, batch_size: int) -> np.ndarray:
+        """
+        Draws uniform indices of the slots whose n step window has been written
+
+        Args:
+            batch_size: number of indices to draw
+
+        Returns:
+            slots of the buffer
+        """
+        complete = self.size - self.n_steps + 1
+        if complete < 1:
+            raise ValueError(f'The buffer needs at least {self.n_steps} experiences to sample {self.n_steps} steps')
+
+        oldest = 0 if self.size < self.capacity else self.pos
+        return (oldest + np.random.randint(0, complete, size=batch_size)) % self.capacity
+
+    def _gather(self, indices: np.ndarray) -> Tuple:
+        """
+        Retrieves the n step experiences starting at the given slots
+
+        Args:
+            indices: slots of the first step of each experience
+
+        Returns:
+            a batch of tuple np arrays of state, action, n step reward, done, next_state
+        """
+        offsets = np.arange(self.n_steps)
+        window = (indices[:, None] + offsets) % self.capacity
+
+        # a step counts as long as none of the previous steps of the window ended the episode
+        dones = self.dones[window]
+        alive = np.ones_like(dones)
+        alive[:, 1:] = ~np.logical_or.accumulate(dones[:, :-1], axis=1)
+
+        discounts = (self.gamma ** offsets).astype(np.float32)
+        rewards = (self.rewards[window] * alive * discounts).sum(axis=1, dtype=np.float32)
+        last = window[np.arange(len(indices)), alive.sum(axis=1) - 1]
+
+        return (self.states[indices], self.actions[indices], rewards,
+                self.dones[last], self.next_states[last])
+
+
+class RolloutBuffer:
+    """
+    On policy storage of whole episodes for policy gradient methods. Each step is written into preallocated tensors
+    holding every field, so the learner gets the flat (T, ...) tensors of all the steps directly instead of stacking
+    one tensor per step. The offsets mark where each episode starts, followed by the total number of steps.
+
+    Args:
+        capacity: initial number of steps, the tensors double in size whenever they are full
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.capacity = capacity
+        self.size = 0
+        self.offsets = [0]
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.dones = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def num_episodes(self) -> int:
+        """Number of complete episodes in the buffer"""
+        return len(self.offsets) - 1
+
+    def _allocate(self, state: torch.Tensor, action: torch.Tensor) -> None:
+        """Allocates the tensors of every field from the first step"""
+        self.states = torch.empty((self.capacity, *state.shape), dtype=state.dtype)
+        self.actions = torch.empty((self.capacity, *action.shape), dtype=action.dtype)
+        self.rewards = torch.empty(self.capacity, dtype=torch.float32)
+        self.dones = torch.empty(self.capacity, dtype=torch.bool)
+
+    def _grow(self) -> None:
+        """Doubles the capacity of every field, keeping the steps stored so far"""
+        self.capacity *= 2
+        for name in ('states', 'actions', 'rewards', 'dones'):
+            setattr(self, name, self._resized(getattr(self, name)))
+
+    def _resized(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Copy of the stored steps of a field in a tensor with room for capacity steps"""
+        resized = torch.empty((self.capacity, *tensor.shape[1:]), dtype=tensor.dtype)
+        resized[:self.size] = tensor[:self.size]
+        return resized
+
+    def append(self, state, action, reward, done: bool) -> None:
+        """
+        Writes a step into the next row of every field
+
+        Args:
+            state: state the action was taken in
+            action: action taken
+            reward: reward received
+            done: whether the step ended the episode
+        """
+        state, action = torch.as_tensor(state), torch.as_tensor(action)
+        if self.states is None:
+            self._allocate(state, action)
+        elif self.size == self.capacity:
+            self._grow()
+
+        self.states[self.size] = state
+        self.actions[self.size] = action
+        self.rewards[self.size] = float(reward)
+        self.dones[self.size] = bool(done)
+        self.size += 1
+
+        if done:
+            self.offsets.append(self.size)
+
+    def clear(self) -> None:
+        """Empties the buffer, keeping its tensors to be written again"""
+        self.size = 0
+        self.offsets = [0]
+
+    def rollout(self) -> Rollout:
+        """
+        Views of the steps of the complete episodes, they are only valid until the buffer is written again
+
+        Returns:
+            flat states, actions, rewards and dones of every step with the offsets of the episodes
+        """
+        end = self.offsets[-1]
+        return Rollout(self.states[:end], self.actions[:end], self.rewards[:end], self.dones[:end],
+                       torch.tensor(self.offsets, dtype=torch.int64))
+
+
 class MultiStepBuffer:
     """
     N Step Replay Buffer
@@ -189,6 +647,7 @@ class PERBuffer(ReplayBuffer):
         self.pos = 0
         self.buffer = []
         self.priorities = np.zeros((buffer_size,), dtype=np.float32)
+        self.lock = threading.RLock()
 
     def update_beta(self, step) -> float:
         """
@@ -212,19 +671,20 @@ class PERBuffer(ReplayBuffer):
         Args:
             exp: experience tuple being added to the buffer
         """
-        # what is the max priority for new sample
-        max_prio = self.priorities.max() if self.buffer else 1.0
+        with self.lock:
+            # what is the max priority for new sample
+            max_prio = self.priorities.max() if self.buffer else 1.0
 
-        if len(self.buffer) < self.capacity:
-            self.buffer.append(exp)
-        else:
-            self.buffer[self.pos] = exp
+            if len(self.buffer) < self.capacity:
+                self.buffer.append(exp)
+            else:
+                self.buffer[self.pos] = exp
 
-        # the priority for the latest sample is set to max priority so it will be resampled soon
-        self.priorities[self.pos] = max_prio
+            # the priority for the latest sample is set to max priority so it will be resampled soon
+            self.priorities[self.pos] = max_prio
 
-        # update position, loop back if it reaches the end
-        self.pos = (self.pos + 1) % self.capacity
+            # update position, loop back if it reaches the end
+            self.pos = (self.pos + 1) % self.capacity
 
     def sample(self, batch_size=32) -> Tuple:
         """
@@ -236,31 +696,32 @@ class PERBuffer(ReplayBuffer):
         Returns:
             sample of experiences chosen with ranked probability
         """
-        # get list of priority rankings
-        if len(self.buffer) == self.capacity:
-            prios = self.priorities
-        else:
-            prios = self.priorities[:self.pos]
+        with self.lock:
+            # get list of priority rankings
+            if len(self.buffer) == self.capacity:
+                prios = self.priorities
+            else:
+                prios = self.priorities[:self.pos]
 
-        # probability to the power of alpha to weight how important that probability it, 0 = normal distirbution
-        probs = prios ** self.prob_alpha
-        probs /= probs.sum()
+            # probability to the power of alpha to weight how important that probability it, 0 = normal distirbution
+            probs = prios ** self.prob_alpha
+            probs /= probs.sum()
 
-        # choise sample of indices based on the priority prob distribution
-        indices = np.random.choice(len(self.buffer), batch_size, p=probs)
-        # samples = [self.buffer[idx] for idx in indices]
-        states, actions, rewards, dones, next_states = zip(*[self.buffer[idx] for idx in indices])
+            # choise sample of indices based on the priority prob distribution
+            indices = np.random.choice(len(self.buffer), batch_size, p=probs)
+            # samples = [self.buffer[idx] for idx in indices]
+            states, actions, rewards, dones, next_states = zip(*[self.buffer[idx] for idx in indices])
 
-        samples = (np.array(states), np.array(actions), np.array(rewards, dtype=np.float32),
-                   np.array(dones, dtype=np.bool), np.array(next_states))
-        total = len(self.buffer)
+            samples = (np.array(states), np.array(actions), np.array(rewards, dtype=np.float32),
+                       np.array(dones, dtype=np.bool), np.array(next_states))
+            total = len(self.buffer)
 
-        # weight of each sample datum to compensate for the bias added in with prioritising samples
-        weights = (total * probs[indices]) ** (-self.beta)
-        weights /= weights.max()
+            # weight of each sample datum to compensate for the bias added in with prioritising samples
+            weights = (total * probs[indices]) ** (-self.beta)
+            weights /= weights.max()
 
-        # return the samples, the indices chosen and the weight of each datum in the sample
-        return samples, indices, np.array(weights, dtype=np.float32)
+            # return the samples, the indices chosen and the weight of each datum in the sample
+            return samples, indices, np.array(weights, dtype=np.float32)
 
     def update_priorities(self, batch_indices: List, batch_priorities: List) -> None:
         """
@@ -271,129 +732,662 @@ class PERBuffer(ReplayBuffer):
             batch_indices: index of each datum in the batch
             batch_priorities: priority of each datum in the batch
         """
-        for idx, prio in zip(batch_indices, batch_priorities):
-            self.priorities[idx] = prio
-
-#
-# class SumTree:
-#     write = 0
-#
-#     def __init__(self, capacity):
-#         self.capacity = capacity
-#         self.tree = np.zeros(2 * capacity - 1)
-#         self.data = np.zeros(capacity, dtype=object)
-#         self.n_entries = 0
-#
-#     # update to the root node
-#     def _propagate(self, idx, change):
-#         parent = (idx - 1) // 2
-#
-#         self.tree[parent] += int(change)
-#
-#         if parent != 0:
-#             self._propagate(parent, change)
-#
-#     # find sample on leaf node
-#     def _retrieve(self, idx, s):
-#         left = 2 * idx + 1
-#         right = left + 1
-#
-#         if left >= len(self.tree):
-#             return idx
-#
-#         if s <= self.tree[left]:
-#             return self._retrieve(left, s)
-#         else:
-#             return self._retrieve(right, s - self.tree[left])
-#
-#     def total(self):
-#         return self.tree[0]
-#
-#     # store priority and sample
-#     def add(self, p, data):
-#         idx = self.write + self.capacity - 1
-#
-#         self.data[self.write] = data
-#         self.update(idx, p)
-#
-#         self.write += 1
-#         if self.write >= self.capacity:
-#             self.write = 0
-#
-#         if self.n_entries < self.capacity:
-#             self.n_entries += 1
-#
-#     # update priority
-#     def update(self, idx, p):
-#         change = p - self.tree[idx]
-#
-#         self.tree[idx] = p
-#
-#         if isinstance(idx, int):
-#             self._propagate(idx, change)
-#         else:
-#             for index, node in enumerate(idx):
-#                 self._propagate(node, change[index])
-#
-#     # get priority and sample
-#     def get(self, s):
-#         idx = self._retrieve(0, s)
-#         dataIdx = idx - self.capacity + 1
-#
-#         return (idx, self.tree[idx], self.data[dataIdx])
-#
-#
-# class SumTreeBuffer:  # stored as ( s, a, r, s_ ) in SumTree
-#     e = 0.01
-#     a = 0.6
-#     beta = 0.4
-#     beta_increment_per_sampling = 0.001
-#
-#     def __init__(self, capacity):
-#         self.tree = SumTree(capacity)
-#         self.capacity = capacity
-#         self.step = 0
-#         self.beta_start = 0.4
-#         self.beta_frames = 100000
-#
-#     def _get_priority(self, error):
-#         return (np.abs(error)) ** self.a
-#
-#     def append(self, sample):
-#         # p = self._get_priority(error)
-#         p = 1.0
-#         self.tree.add(p, sample)
-#
-#     def sample(self, n):
-#         self.step += 1
-#         batch = []
-#         idxs = []
-#         segment = self.tree.total() / n
-#         priorities = []
-#
-#         # self.beta = np.min([1., self.beta + self.beta_increment_per_sampling])
-#         beta_val = self.beta_start + self.step * (1.0 - self.beta_start) / self.beta_frames
-#         self.beta = min(1.0, beta_val)
-#
-#         for i in range(n):
-#             a = segment * i
-#             b = segment * (i + 1)
-#
-#             s = random.uniform(a, b)
-#             (idx, p, data) = self.tree.get(s)
-#             priorities.append(p)
-#             sample = (np.array(data.state), np.array(data.action), np.array(data.reward, dtype=np.float32),
-#                       np.array(data.done, dtype=np.bool), np.array(data.new_state))
-#             batch.append(sample)
-#             idxs.append(idx)
-#
-#         sampling_probabilities = priorities / self.tree.total()
-#         is_weight = np.power(self.tree.n_entries * sampling_probabilities, -self.beta)
-#         is_weight /= is_weight.max()
-#
-#         return batch, idxs, is_weight
-#
-#     def update_priorities(self, idx, error):
-#         p = self._get_priority(error)
-#         self.tree.update(idx, p)
-#
+        with self.lock:
+            for idx, prio in zip(batch_indices, batch_priorities):
+                self.priorities[idx] = prio
+
+
+class SegmentTree:
+    """
+    Array backed binary tree where every node holds the reduction of its two children. The leaves are stored in the
+    second half of the array so the root is always at index 1 and can be read in O(1).
+
+    Args:
+        capacity: number of leaves needed
+        operation: vectorised reduction applied to the children, e.g. np.add
+        neutral: value of an empty leaf for the given operation
+    """
+
+    def __init__(self, capacity: int, operation, neutral: float) -> None:
+        self.size = 1
+        while self.size < capacity:
+            self.size *= 2
+
+        self.operation = operation
+        self.neutral = neutral
+        self.tree = np.full(2 * self.size, neutral, dtype=np.float64)
+
+    def __getitem__(self, indices):
+        return self.tree[np.asarray(indices) + self.size]
+
+    def root(self) -> float:
+        """Reduction over all the leaves"""
+        return self.tree[1]
+
+    def update(self, indices, values) -> None:
+        """
+        Sets the value of the given leaves and updates their ancestors one level at a time for the whole batch
+
+        Args:
+            indices: leaf indices to update
+            values: new values of the leaves
+        """
+        if np.ndim(indices) == 0:
+            self._update_single(int(indices), float(values))
+            return
+
+        nodes = np.asarray(indices, dtype=np.int64) + self.size
+        if nodes.size == 0:
+            return
+        self.tree[nodes] = values
+
+        nodes = np.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.operation(self.tree[2 * nodes], self.tree[2 * nodes + 1])
+            if nodes[0] == 1:
+                break
+            nodes = np.unique(nodes // 2)
+
+    def _update_single(self, index: int, value: float) -> None:
+        """Scalar version of update, avoids the array overhead when a single leaf changes"""
+        node = index + self.size
+        self.tree[node] = value
+
+        node //= 2
+        while node >= 1:
+            self.tree[node] = self.operation(self.tree[2 * node], self.tree[2 * node + 1])
+            node //= 2
+
+
+class SumTree(SegmentTree):
+    """Segment tree holding the sum of the priorities, used to sample proportionally to priority"""
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__(capacity, np.add, 0.0)
+
+    def total(self) -> float:
+        """Sum over all the leaves"""
+        return self.root()
+
+    def find_prefix_sum(self, values: np.ndarray) -> np.ndarray:
+        """
+        Finds for each value the leaf where the running sum of the leaves exceeds the value. The whole batch walks
+        down the tree together, one level per iteration
+
+        Args:
+            values: prefix sums to search for, each in [0, total)
+
+        Returns:
+            leaf index for each value
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+
+        while nodes[0] < self.size:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+
+        return nodes - self.size
+
+
+class MinTree(SegmentTree):
+    """Segment tree holding the smallest priority, used to normalise the importance sampling weights"""
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__(capacity, np.minimum, float('inf'))
+
+    def min(self) -> float:
+        """Smallest leaf"""
+        return self.root()
+
+
+class MaxTree(SegmentTree):
+    """Segment tree holding the largest priority, used to give new experiences the max priority"""
+
+    def __init__(self, capacity: int) -> None:
+        super().__init__(capacity, np.maximum, 0.0)
+
+    def max(self) -> float:
+        """Largest leaf"""
+        return self.root()
+
+
+class SumTreePERBuffer(RingReplayBuffer):
+    """
+    Prioritized Experience Replay Buffer backed by sum, min and max segment trees. Sampling a batch and updating its
+    priorities are O(batch_size * log(capacity)) and looking up the max priority is O(1).
+
+    Args:
+        capacity: size of the buffer
+        obs_shape: shape of a single observation
+        prob_alpha: how much prioritization is used, 0 = uniform sampling
+        beta_start: starting value of beta used to correct the sampling bias
+        beta_frames: number of frames until beta reaches 1
+        minibatch_size: size of the minibatches a sample is split into, e.g. by the ReplayBatchStream. Each
+            consecutive minibatch of a sample is stratified over the whole priority mass on its own. Defaults to
+            stratifying the whole sample at once
+        kwargs: any extra arguments for the RingReplayBuffer
+    """
+
+    def __init__(self, capacity: int, obs_shape: Tuple, prob_alpha: float = 0.6, beta_start: float = 0.4,
+                 beta_frames: int = 100000, minibatch_size: Optional[int] = None, **kwargs) -> None:
+        super().__init__(capacity, obs_shape, **kwargs)
+        self.minibatch_size = minibatch_size
+        self.beta_start = beta_start
+        self.beta = beta_start
+        self.beta_frames = beta_frames
+        self.prob_alpha = prob_alpha
+
+        self.sum_tree = SumTree(capacity)
+        self.min_tree = MinTree(capacity)
+        self.max_tree = MaxTree(capacity)
+        self.lock = threading.RLock()
+
+    def update_beta(self, step) -> float:
+        """
+        Update the beta value which accounts for the bias in the PER
+
+        Args:
+            step: current global step
+
+        Returns:
+            beta value for this indexed experience
+        """
+        beta_val = self.beta_start + step * (1.0 - self.beta_start) / self.beta_frames
+        self.beta = min(1.0, beta_val)
+
+        return self.beta
+
+    def append(self, experience: Experience, priority: float = None) -> int:
+        """
+        Adds an experience to the buffer. Without a priority it gets the current max priority so it will be
+        sampled soon
+
+        Args:
+            experience: tuple (state, action, reward, done, new_state)
+            priority: initial priority of the experience, e.g. computed by the actor that collected it
+
+        Returns:
+            index of the slot that was written
+        """
+        with self.lock:
+            if priority is None:
+                priority = self.max_tree.max() if self.size else 1.0
+            else:
+                priority = float(priority) ** self.prob_alpha
+            idx = super().append(experience)
+            self._set_priorities(idx, priority)
+
+        return idx
+
+    def _set_priorities(self, indices, priorities) -> None:
+        """Writes priorities that already have alpha applied to all the trees"""
+        self.sum_tree.update(indices, priorities)
+        self.min_tree.update(indices, priorities)
+        self.max_tree.update(indices, priorities)
+
+    def sample(self, batch_size: int = 32) -> Tuple:
+        """
+        Takes a stratified prioritized sample from the buffer. The total priority is split into minibatch_size equal
+        segments and each minibatch of the sample draws one experience from each of them, so splitting a sample of
+        several minibatches does not leave each one with a slice of the buffer
+
+        Args:
+            batch_size: size of sample
+
+        Returns:
+            sample of experiences, the indices chosen and the importance sampling weight of each experience
+        """
+        with self.lock:
+            total = self.sum_tree.total()
+            strata = min(self.minibatch_size or batch_size, batch_size)
+            values = (np.arange(batch_size) % strata + np.random.random(batch_size)) * (total / strata)
+            indices = np.minimum(self.sum_tree.find_prefix_sum(values), self.size - 1)
+
+            # weight of each sample datum to compensate for the bias added in with prioritising samples
+            probs = self.sum_tree[indices] / total
+            weights = (self.size * probs) ** (-self.beta)
+            max_weight = (self.size * self.min_tree.min() / total) ** (-self.beta)
+            weights /= max_weight
+
+            return self._gather(indices), indices, weights.astype(np.float32)
+
+    def update_priorities(self, batch_indices: np.ndarray, batch_priorities: np.ndarray) -> None:
+        """
+        Update the priorities from the last batch, this should be called after the loss for this batch has been
+        calculated.
+
+        Args:
+            batch_indices: index of each datum in the batch
+            batch_priorities: priority of each datum in the batch
+        """
+        priorities = np.asarray(batch_priorities, dtype=np.float64) ** self.prob_alpha
+        with self.lock:
+            self._set_priorities(np.asarray(batch_indices, dtype=np.int64), priorities)
+
+
+class AsyncPriorityUpdater:
+    """
+    Applies priority updates to a SumTreePERBuffer from a background thread, so the learner does not wait on the
+    tree updates after each batch. Every update waiting when the thread wakes up is merged into a single call,
+    keeping the latest priority of an index that was sampled several times
+
+    Args:
+        buffer: prioritized buffer to update, its lock is held while the priorities are written
+    """
+
+    def __init__(self, buffer: 'SumTreePERBuffer') -> None:
+        self.buffer = buffer
+        self.updates = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, batch_indices: np.ndarray, batch_priorities: np.ndarray) -> None:
+        """
+        Queues the priorities of a batch, they are applied the next time the thread wakes up
+
+        Args:
+            batch_indices: index of each datum in the batch
+            batch_priorities: priority of each datum in the batch
+        """
+        self.updates.put((np.asarray(batch_indices, dtype=np.int64), np.asarray(batch_priorities)))
+
+    def _run(self) -> None:
+        """Waits for updates and applies all the waiting ones together, until close queues None"""
+        running = True
+        while running:
+            items = [self.updates.get()]
+            while True:
+                try:
+                    items.append(self.updates.get_nowait())
+                except queue.Empty:
+                    break
+
+            batches = [item for item in items if item is not None]
+            running = len(batches) == len(items)
+            if batches:
+                indices = np.concatenate([indices for indices, _ in batches])
+                priorities = np.concatenate([priorities for _, priorities in batches])
+                # keep the last priority submitted for each index
+                _, last = np.unique(indices[::-1], return_index=True)
+                last = len(indices) - 1 - last
+                self.buffer.update_priorities(indices[last], priorities[last])
+
+            for _ in items:
+                self.updates.task_done()
+
+    def flush(self) -> None:
+        """Blocks until every submitted update has been applied"""
+        self.updates.join()
+
+    def close(self) -> None:
+        """Applies the remaining updates and stops the thread"""
+        self.updates.put(None)
+        self.thread.join()
+
+
+def _copy_into(slot, sample, pin_memory: bool = False):
+    """
+    Copies a sample of numpy arrays into the tensors of a slot, keeping the nesting of the sample. The tensors are
+    only allocated on the first copy or when the shape of the sample changes
+
+    Args:
+        slot: tensors filled by the previous copy, None for a new slot
+        sample: sample returned by a buffer
+        pin_memory: allocate the tensors in page locked memory for faster copies to the GPU
+
+    Returns:
+        the filled slot
+    """
+    if isinstance(sample, (tuple, list)):
+        slot = (None,) * len(sample) if slot is None else slot
+        return tuple(_copy_into(item_slot, item, pin_memory) for item_slot, item in zip(slot, sample))
+
+    source = torch.from_numpy(np.asarray(sample))
+    if slot is None or slot.shape != source.shape or slot.dtype != source.dtype:
+        slot = torch.empty(source.shape, dtype=source.dtype, pin_memory=pin_memory)
+    return slot.copy_(source)
+
+
+class PrefetchSampler:
+    """
+    Samples a replay buffer in a background thread, so the next samples are gathered and turned into tensors while
+    the current batch trains. NumPy fancy indexing and tensor copies release the GIL, so most of the sampling time is
+    hidden behind the training step. Samples of a prioritized buffer keep their (samples, indices, weights) layout.
+
+    Each sample is copied into one of num_samples + in_use slots of preallocated tensors, which are reused. A slot
+    is only refilled once in_use newer samples were handed out, so the caller must not keep a sample longer than
+    that. The default of 2 covers Lightning, which fetches the next batch before training on the current one.
+
+    The buffer must tolerate being sampled from this thread while experiences are appended, the prioritized
+    buffers hold their lock for that. The priorities of a prefetched sample are the ones of when it was drawn.
+
+    Args:
+        buffer: replay buffer
+        sample_size: number of experiences in each sample
+        num_samples: number of samples prepared ahead
+        in_use: number of the latest samples handed out that the caller may still be using
+        pin_memory: allocate the slots in page locked memory for faster copies to the GPU
+    """
+
+    def __init__(self, buffer, sample_size: int, num_samples: int = 2, in_use: int = 2,
+                 pin_memory: bool = False) -> None:
+        self.buffer = buffer
+        self.sample_size = sample_size
+        self.in_use = in_use
+        self.pin_memory = pin_memory
+
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        self.handed_out = deque()
+        for _ in range(num_samples + in_use):
+            self.free.put(None)
+
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def sample(self, batch_size: int = None) -> Tuple:
+        """
+        Takes the next prefetched sample
+
+        Args:
+            batch_size: must be the sample_size of the sampler, kept so it can replace a buffer
+
+        Returns:
+            the sample of the buffer as tensors
+        """
+        if batch_size is not None and batch_size != self.sample_size:
+            raise ValueError(f'The sampler prefetches samples of {self.sample_size} experiences, not {batch_size}')
+
+        slot = self.ready.get()
+        if isinstance(slot, Exception):
+            # the thread has stopped, the error is put back so every later call raises it instead of blocking
+            self.ready.put(slot)
+            raise slot
+
+        self.handed_out.append(slot)
+        if len(self.handed_out) > self.in_use:
+            self.free.put(self.handed_out.popleft())
+        return slot
+
+    def close(self) -> None:
+        """Stops the background thread"""
+        self.stop.set()
+        self.thread.join()
+
+    def _run(self) -> None:
+        """Fills the free slots with new samples until close is called"""
+        while not self.stop.is_set():
+            try:
+                slot = self.free.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                slot = _copy_into(slot, self.buffer.sample(self.sample_size), self.pin_memory)
+            except Exception as err:  # pylint: disable=broad-except
+                self.ready.put(err)
+                return
+            self.ready.put(slot)
+
+
+class MemmapReplayBuffer(RingReplayBuffer):
+    """
+    Ring replay buffer that keeps its observation arrays in np.memmap files under a directory, so the capacity is
+    bounded by disk space instead of RAM. The small fields (actions, rewards, dones) are read from RAM and mirrored
+    to disk on every append along with the write position. Everything written by a process that crashes is kept by
+    the OS, so creating the buffer again on the same directory picks up where it left off without a warm start.
+    Call flush to force the files to disk, e.g. to also survive the machine going down.
+
+    Args:
+        capacity: size of the buffer
+        obs_shape: shape of a single observation
+        directory: directory holding the buffer files, an existing buffer in it is reopened
+        kwargs: any extra arguments for the buffer
+    """
+
+    OBS_FIELDS = ('states', 'next_states', 'frames')
+
+    def __init__(self, capacity: int, obs_shape: Tuple, directory: str = 'replay_buffer', **kwargs) -> None:
+        self.directory = directory
+        self.mirrors = {}
+        os.makedirs(directory, exist_ok=True)
+        self.cursor = self._open('cursor', (3,), np.int64)
+        super().__init__(capacity, obs_shape, **kwargs)
+
+        if self.cursor[1] > 0:
+            self._restore(self.cursor)
+
+    def _open(self, name: str, shape: Tuple, dtype) -> np.memmap:
+        """
+        Opens the memmap file of a field, creating it if it does not exist yet
+
+        Args:
+            name: name of the field
+            shape: full shape of the array
+            dtype: dtype of the array
+
+        Returns:
+            memory mapped array
+        """
+        path = os.path.join(self.directory, name + '.npy')
+        if not os.path.exists(path):
+            return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+        array = np.lib.format.open_memmap(path, mode='r+')
+        if array.shape != tuple(shape) or array.dtype != np.dtype(dtype):
+            raise ValueError(f'{path} holds a {array.dtype} array of shape {array.shape}, '
+                             f'expected {np.dtype(dtype)} of shape {tuple(shape)}')
+        return array
+
+    def _allocate(self, name: str, shape: Tuple, dtype) -> np.ndarray:
+        """
+        Observations are paged from a memmap file, any other field is loaded into RAM and mirrored to a file
+
+        Args:
+            name: name of the field
+            shape: shape of a single entry of the field
+            dtype: dtype of the field
+
+        Returns:
+            array with room for capacity entries
+        """
+        array = self._open(name, (self.capacity, *shape), dtype)
+        if name in self.OBS_FIELDS:
+            return array
+
+        self.mirrors[name] = array
+        return np.array(array)
+
+    def _write(self, idx: int, experience: Experience) -> None:
+        """
+        Writes the experience into the given slot and mirrors the in memory fields to disk
+
+        Args:
+            idx: slot of the buffer to write
+            experience: tuple (state, action, reward, done, new_state)
+        """
+        super()._write(idx, experience)
+        for name, mirror in self.mirrors.items():
+            mirror[idx] = getattr(self, name)[idx]
+
+    def append(self, experience: Experience) -> int:
+        """
+        Adds the experience to the buffer and then records the new write position on disk
+
+        Args:
+            experience: tuple (state, action, reward, done, new_state)
+
+        Returns:
+            index of the slot that was written
+        """
+        idx = super().append(experience)
+        self.cursor[:] = self._cursor_values()
+        return idx
+
+    def _cursor_values(self) -> Tuple[int, int, int]:
+        """Values describing the write position that are stored on disk"""
+        return self.pos, self.size, 0
+
+    def _restore(self, cursor: np.ndarray) -> None:
+        """
+        Restores the write position of a buffer reopened from disk
+
+        Args:
+            cursor: values stored by _cursor_values
+        """
+        self.pos, self.size = int(cursor[0]), int(cursor[1])
+
+    def flush(self) -> None:
+        """Writes any changes of the memmap files to disk"""
+        for name in self.OBS_FIELDS:
+            if hasattr(self, name):
+                getattr(self, name).flush()
+        for mirror in self.mirrors.values():
+            mirror.flush()
+        self.cursor.flush()
+
+
+class MemmapFrameStackReplayBuffer(MemmapReplayBuffer, FrameStackReplayBuffer):
+    """FrameStackReplayBuffer with its frames kept in a memmap file, see MemmapReplayBuffer"""
+
+    def _cursor_values(self) -> Tuple[int, int, int]:
+        """Values describing the write position that are stored on disk"""
+        return self.pos, self.size, int(self.episode_start)
+
+    def _restore(self, cursor: np.ndarray) -> None:
+        """
+        Restores the write position of a buffer reopened from disk
+
+        Args:
+            cursor: values stored by _cursor_values
+        """
+        super()._restore(cursor)
+        self.episode_start = bool(cursor[2])
+
+
+class MemmapSumTreePERBuffer(MemmapReplayBuffer, SumTreePERBuffer):
+    """
+    SumTreePERBuffer with its observations kept in memmap files, see MemmapReplayBuffer. The priorities stay in RAM,
+    when the buffer is reopened from disk every experience starts again with priority 1
+    """
+
+    def append(self, experience: Experience, priority: float = None) -> int:
+        """
+        Adds an experience with its priority, see SumTreePERBuffer.append, then records the new write position on
+        disk
+
+        Args:
+            experience: tuple (state, action, reward, done, new_state)
+            priority: initial priority of the experience, e.g. computed by the actor that collected it
+
+        Returns:
+            index of the slot that was written
+        """
+        with self.lock:
+            idx = SumTreePERBuffer.append(self, experience, priority)
+            self.cursor[:] = self._cursor_values()
+        return idx
+
+    def _restore(self, cursor: np.ndarray) -> None:
+        """
+        Restores the write position of a buffer reopened from disk and resets the priorities of its experiences
+
+        Args:
+            cursor: values stored by _cursor_values
+        """
+        super()._restore(cursor)
+        self._set_priorities(np.arange(self.size), 1.0)
+
+
+class SharedMemoryReplayBuffer(RingReplayBuffer):
+    """
+    Ring replay buffer whose field arrays and write position live in shared memory, so DataLoader worker processes
+    sample the experiences appended by the training process instead of a stale copy of the buffer. Only the
+    training process should append, the workers only sample. Each slot is written before the size is increased so
+    a worker never samples a slot that was not written yet, only the oldest slots may be overwritten while a worker
+    gathers them.
+
+    Forked workers inherit the shared memory. When the buffer is pickled, e.g. for spawned workers, the shared
+    tensors are sent instead of their numpy views so the copy maps the same memory.
+
+    Args:
+        capacity: size of the buffer
+        obs_shape: shape of a single observation
+        kwargs: any extra arguments for the buffer
+    """
+
+    def __init__(self, capacity: int, obs_shape: Tuple, **kwargs) -> None:
+        self.tensors = {}
+        self.cursor = self._allocate_shared('cursor', (2,), np.int64)
+        super().__init__(capacity, obs_shape, **kwargs)
+
+    @property
+    def pos(self) -> int:
+        """Next slot written, shared with the workers"""
+        return int(self.cursor[0])
+
+    @pos.setter
+    def pos(self, value: int) -> None:
+        self.cursor[0] = value
+
+    @property
+    def size(self) -> int:
+        """Number of experiences in the buffer, shared with the workers"""
+        return int(self.cursor[1])
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self.cursor[1] = value
+
+    def _allocate_shared(self, name: str, shape: Tuple, dtype) -> np.ndarray:
+        """
+        Allocates a torch tensor in shared memory and returns a numpy view of it
+
+        Args:
+            name: name of the array
+            shape: full shape of the array
+            dtype: dtype of the array
+
+        Returns:
+            numpy view of the shared tensor
+        """
+        torch_dtype = torch.from_numpy(np.zeros(0, dtype=dtype)).dtype
+        self.tensors[name] = torch.zeros(shape, dtype=torch_dtype).share_memory_()
+        return self.tensors[name].numpy()
+
+    def _allocate(self, name: str, shape: Tuple, dtype) -> np.ndarray:
+        """
+        Allocates the storage for a single field of the experience in shared memory
+
+        Args:
+            name: name of the field
+            shape: shape of a single entry of the field
+            dtype: dtype of the field
+
+        Returns:
+            array with room for capacity entries
+        """
+        return self._allocate_shared(name, (self.capacity, *shape), dtype)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        for name in self.tensors:
+            del state[name]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        for name, tensor in self.tensors.items():
+            setattr(self, name, tensor.numpy())
+
+
+class SharedMemoryFrameStackReplayBuffer(SharedMemoryReplayBuffer, FrameStackReplayBuffer):
+    """FrameStackReplayBuffer with its frames kept in shared memory, see SharedMemoryReplayBuffer"""
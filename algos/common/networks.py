@@ -8,6 +8,21 @@ from torch import Tensor
 from torch.nn import functional as F
 
 
+def scale_obs(input_x: Tensor) -> Tensor:
+    """
+    Casts uint8 image observations to float and scales them to [0, 1], any other input is returned unchanged
+
+    Args:
+        input_x: batch of observations
+
+    Returns:
+        float observations
+    """
+    if input_x.dtype == torch.uint8:
+        return input_x.float() / 255.0
+    return input_x
+
+
 class CNN(nn.Module):
     """
     Simple MLP network
@@ -58,6 +73,7 @@ class CNN(nn.Module):
         Returns:
             output of network
         """
+        input_x = scale_obs(input_x)
         conv_out = self.conv(input_x).view(input_x.size()[0], -1)
         return self.head(conv_out)
 
@@ -230,8 +246,8 @@ class DuelingCNN(nn.Module):
         Returns:
             advantage, value
         """
-        float_x = input_x.float()
-        base_out = self.conv(input_x).view(float_x.size()[0], -1)
+        float_x = scale_obs(input_x).float()
+        base_out = self.conv(float_x).view(float_x.size()[0], -1)
         return self.head_adv(base_out), self.head_val(base_out)
 
 
@@ -242,8 +258,10 @@ class NoisyCNN(nn.Module):
     Args:
         input_shape: observation shape of the environment
         n_actions: number of discrete actions available in the environment
+        factorised: use factorised gaussian noise in the noisy layers
+        auto_reset_noise: resample the noise on every forward call, otherwise only on reset_noise
     """
-    def __init__(self, input_shape, n_actions):
+    def __init__(self, input_shape, n_actions, factorised=False, auto_reset_noise=True):
         super().__init__()
 
         self.conv = nn.Sequential(
@@ -257,11 +275,17 @@ class NoisyCNN(nn.Module):
 
         conv_out_size = self._get_conv_out(input_shape)
         self.head = nn.Sequential(
-            NoisyLinear(conv_out_size, 512),
+            NoisyLinear(conv_out_size, 512, factorised=factorised, auto_reset_noise=auto_reset_noise),
             nn.ReLU(),
-            NoisyLinear(512, n_actions)
+            NoisyLinear(512, n_actions, factorised=factorised, auto_reset_noise=auto_reset_noise)
         )
 
+    def reset_noise(self) -> None:
+        """Samples new noise for every noisy layer"""
+        for layer in self.head:
+            if isinstance(layer, NoisyLinear):
+                layer.reset_noise()
+
     def _get_conv_out(self, shape) -> int:
         """
         Calculates the output size of the last conv layer
@@ -285,6 +309,7 @@ class NoisyCNN(nn.Module):
         Returns:
             output of network
         """
+        input_x = scale_obs(input_x)
         conv_out = self.conv(input_x).view(input_x.size()[0], -1)
         return self.head(conv_out)
 
@@ -295,32 +320,50 @@ class NoisyCNN(nn.Module):
 
 class NoisyLinear(nn.Linear):
     """
-    Noisy Layer using Independent Gaussian Noise.
+    Noisy Layer using Independent Gaussian Noise, or Factorised Gaussian Noise which only samples in_features +
+    out_features values instead of a full out_features x in_features matrix.
+
+    By default the noise is resampled on every forward call. With auto_reset_noise=False it is only resampled by
+    reset_noise, e.g. once per training batch. In eval mode the layer uses its mean weights and is deterministic.
 
     Args:
         in_features: number of inputs
         out_features: number of outputs
-        sigma_init: initial fill value of noisy weights
+        sigma_init: initial fill value of noisy weights, defaults to 0.017 for independent noise and
+            0.5 / sqrt(in_features) for factorised noise
         bias: flag to include bias to linear layer
+        factorised: use factorised gaussian noise
+        auto_reset_noise: resample the noise on every forward call
     """
 
     def __init__(self, in_features, out_features,
-                 sigma_init=0.017, bias=True):
+                 sigma_init=None, bias=True, factorised=False, auto_reset_noise=True):
         super(NoisyLinear, self).__init__(
             in_features, out_features, bias=bias)
+        self.factorised = factorised
+        self.auto_reset_noise = auto_reset_noise
+
+        if sigma_init is None:
+            sigma_init = 0.5 / math.sqrt(in_features) if factorised else 0.017
 
         weights = torch.full((out_features, in_features), sigma_init)
         self.sigma_weight = nn.Parameter(weights)
-        epsilon_weight = torch.zeros(out_features, in_features)
-        self.register_buffer("epsilon_weight", epsilon_weight)
+        if factorised:
+            self.register_buffer("epsilon_in", torch.zeros(in_features))
+            self.register_buffer("epsilon_out", torch.zeros(out_features))
+        else:
+            epsilon_weight = torch.zeros(out_features, in_features)
+            self.register_buffer("epsilon_weight", epsilon_weight)
 
         if bias:
             bias = torch.full((out_features,), sigma_init)
             self.sigma_bias = nn.Parameter(bias)
-            epsilon_bias = torch.zeros(out_features)
-            self.register_buffer("epsilon_bias", epsilon_bias)
+            if not factorised:
+                epsilon_bias = torch.zeros(out_features)
+                self.register_buffer("epsilon_bias", epsilon_bias)
 
         self.reset_parameters()
+        self.reset_noise()
 
     def reset_parameters(self) -> None:
         """initializes or resets the paramseter of the layer"""
@@ -328,6 +371,22 @@ class NoisyLinear(nn.Linear):
         self.weight.data.uniform_(-std, std)
         self.bias.data.uniform_(-std, std)
 
+    @staticmethod
+    def _scale_noise(noise: Tensor) -> Tensor:
+        """f(x) = sign(x) * sqrt(|x|) applied to the factorised noise"""
+        return noise.sign() * noise.abs().sqrt()
+
+    @torch.no_grad()
+    def reset_noise(self) -> None:
+        """Samples new noise, it is used by every forward call until the next reset"""
+        if self.factorised:
+            self.epsilon_in.copy_(self._scale_noise(torch.randn_like(self.epsilon_in)))
+            self.epsilon_out.copy_(self._scale_noise(torch.randn_like(self.epsilon_out)))
+        else:
+            self.epsilon_weight.normal_()
+            if self.bias is not None:
+                self.epsilon_bias.normal_()
+
     def forward(self, input_x: Tensor) -> Tensor:
         """
         Forward pass of the layer
@@ -338,10 +397,22 @@ class NoisyLinear(nn.Linear):
         Returns:
             output of the layer
         """
-        self.epsilon_weight.normal_()
+        if not self.training:
+            return F.linear(input_x, self.weight, self.bias)
+
+        if self.auto_reset_noise:
+            self.reset_noise()
+
+        if self.factorised:
+            # (W + sigma * outer(eps_out, eps_in)) x = W x + eps_out * (sigma (eps_in * x)), no noise matrix needed
+            output = F.linear(input_x, self.weight, self.bias)
+            output = output + F.linear(input_x * self.epsilon_in.data, self.sigma_weight) * self.epsilon_out.data
+            if self.bias is not None:
+                output = output + self.sigma_bias * self.epsilon_out.data
+            return output
+
         bias = self.bias
         if bias is not None:
-            self.epsilon_bias.normal_()
             bias = bias + self.sigma_bias * self.epsilon_bias.data
 
         noisy_weights = self.sigma_weight * self.epsilon_weight.data + self.weight
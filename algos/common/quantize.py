@@ -0,0 +1,98 @@
+"""Dynamic int8 quantisation of acting networks for CPU rollouts"""
+import copy
+import time
+from typing import Dict
+
+import torch
+from torch import nn, Tensor
+
+from algos.common.networks import NoisyLinear
+
+
+def quantize_network(net: nn.Module) -> nn.Module:
+    """
+    Builds an int8 dynamically quantised copy of a network for acting on CPU. The weights of the nn.Linear layers,
+    e.g. the heads of the CNN and DuelingCNN and the whole MLP, are stored as int8 and their activations are
+    quantised on the fly. Convolutions and NoisyLinear layers stay in fp32. The given network is left untouched so
+    the learner keeps training it in fp32
+
+    Args:
+        net: network to quantise
+
+    Returns:
+        quantised copy of the network on the CPU, in eval mode except for its NoisyLinear layers which stay in
+        train mode so an actor acting with it still explores with their noise
+    """
+    net = copy.deepcopy(net).cpu().eval()
+    quantized_net = torch.quantization.quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+    for module in quantized_net.modules():
+        if isinstance(module, NoisyLinear):
+            module.train()
+    return quantized_net
+
+
+def action_agreement(reference: nn.Module, candidate: nn.Module, states: Tensor) -> float:
+    """
+    Fraction of states where two value networks pick the same greedy action
+
+    Args:
+        reference: fp32 network
+        candidate: network compared with it, e.g. its quantised copy
+        states: batch of states to compare the networks on
+
+    Returns:
+        agreement rate in [0, 1]
+    """
+    states = torch.as_tensor(states).cpu()
+    with torch.no_grad():
+        reference_actions = reference(states).argmax(dim=1)
+        candidate_actions = candidate(states).argmax(dim=1)
+
+    return float((reference_actions == candidate_actions).float().mean())
+
+
+def quantized_agreement(net: nn.Module, states: Tensor) -> float:
+    """
+    Fraction of states where a network and its quantised copy pick the same greedy action. Both are compared as CPU
+    copies in eval mode, so the network may live on the GPU and noisy layers act with their mean weights in both
+
+    Args:
+        net: fp32 network, e.g. the one trained by the learner, it is left untouched
+        states: batch of states to compare the networks on
+
+    Returns:
+        agreement rate in [0, 1]
+    """
+    net = copy.deepcopy(net).cpu().eval()
+    return action_agreement(net, quantize_network(net).eval(), states)
+
+
+def benchmark_quantization(net: nn.Module, states: Tensor, repeats: int = 50) -> Dict[str, float]:
+    """
+    Compares a network with its quantised copy, to decide whether the actors can safely act with it
+
+    Args:
+        net: fp32 network
+        states: batch of states, ideally taken from the replay buffer
+        repeats: number of forward passes timed for each network
+
+    Returns:
+        action agreement rate, time per forward pass of each network in milliseconds and the speedup
+    """
+    net = copy.deepcopy(net).cpu().eval()
+    quantized_net = quantize_network(net).eval()
+    states = torch.as_tensor(states).cpu()
+
+    timings = {}
+    for name, model in (("fp32_ms", net), ("int8_ms", quantized_net)):
+        with torch.no_grad():
+            model(states)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model(states)
+        timings[name] = (time.perf_counter() - start) * 1000 / repeats
+
+    return {'agreement': action_agreement(net, quantized_net, states),
+            'fp32_ms': timings['fp32_ms'],
+            'int8_ms': timings['int8_ms'],
+            'speedup': timings['fp32_ms'] / timings['int8_ms']}
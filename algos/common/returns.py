@@ -0,0 +1,92 @@
+"""Discounted returns and baselines of whole batches of concatenated episodes"""
+from typing import Optional
+
+import torch
+from torch import Tensor
+
+
+def discounted_returns(rewards: Tensor, dones: Tensor, gamma: float) -> Tensor:
+    """
+    Discounted reward to go of every step of a batch of concatenated episodes, restarting after each done.
+
+    The recurrence G_t = r_t + gamma * (1 - done_t) * G_t+1 is solved with a reverse scan by doubling: after the
+    k-th pass every step holds the discounted sum of its next 2 ** k rewards and the discount linking it to the step
+    after them, which is zero across an episode boundary. This takes log2(T) vectorised passes instead of a Python
+    loop over the steps, and the discounts never exceed 1 so long episodes do not overflow.
+
+    Args:
+        rewards: reward of each step, shape (T,)
+        dones: whether each step ended its episode, shape (T,). The last step is always treated as the end
+
+    Returns:
+        discounted reward to go of each step
+    """
+    returns = rewards.clone()
+    discounts = gamma * (~dones.bool()).to(returns.dtype)
+    discounts[-1:] = 0.0
+
+    shift = 1
+    while shift < len(returns):
+        returns = torch.cat([returns[:-shift] + discounts[:-shift] * returns[shift:], returns[-shift:]])
+        discounts = torch.cat([discounts[:-shift] * discounts[shift:], torch.zeros_like(discounts[-shift:])])
+        shift *= 2
+
+    return returns
+
+
+def episode_ids(dones: Tensor) -> Tensor:
+    """
+    Index of the episode each step belongs to
+
+    Args:
+        dones: whether each step ended its episode, shape (T,)
+
+    Returns:
+        episode index of each step, starting at 0
+    """
+    dones = dones.long()
+    return torch.cumsum(dones, dim=0) - dones
+
+
+def episode_means(values: Tensor, dones: Tensor) -> Tensor:
+    """
+    Mean of the values over the episode of each step, e.g. the per episode baseline of the returns
+
+    Args:
+        values: value of each step, shape (T,)
+        dones: whether each step ended its episode, shape (T,)
+
+    Returns:
+        mean over its episode for each step
+    """
+    ids = episode_ids(dones)
+    num_episodes = int(ids[-1]) + 1
+    sums = torch.zeros(num_episodes, dtype=values.dtype, device=values.device).index_add_(0, ids, values)
+    counts = torch.bincount(ids, minlength=num_episodes).to(values.dtype)
+    return (sums / counts)[ids]
+
+
+def reward_to_go(rewards: Tensor, dones: Tensor, gamma: float, baseline: Optional[str] = None) -> Tensor:
+    """
+    Discounted reward to go of a batch of concatenated episodes, optionally with a baseline subtracted to reduce
+    the variance of the policy gradient
+
+    Args:
+        rewards: reward of each step, shape (T,)
+        dones: whether each step ended its episode, shape (T,)
+        gamma: discount factor
+        baseline: None, episode to subtract the mean return of each episode or batch to subtract the mean return
+            of the whole batch
+
+    Returns:
+        q vals of each step
+    """
+    returns = discounted_returns(rewards, dones, gamma)
+
+    if baseline is None:
+        return returns
+    if baseline == "episode":
+        return returns - episode_means(returns, dones)
+    if baseline == "batch":
+        return returns - returns.mean()
+    raise ValueError(f"Unknown baseline {baseline}")
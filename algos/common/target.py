@@ -0,0 +1,78 @@
+"""Updates of the target network from the train network"""
+from typing import List
+
+import torch
+from torch import nn, Tensor
+
+
+def _copy_(destination: List[Tensor], source: List[Tensor]) -> None:
+    """Copies each source tensor in place into the matching destination tensor with a single foreach call"""
+    if not destination:
+        return
+    if hasattr(torch, "_foreach_copy_"):
+        torch._foreach_copy_(destination, source)  # pylint: disable=protected-access
+    else:
+        for dest_tensor, src_tensor in zip(destination, source):
+            dest_tensor.copy_(src_tensor)
+
+
+def _lerp_(destination: List[Tensor], source: List[Tensor], weight: float) -> None:
+    """Moves each destination tensor in place towards the matching source tensor by weight with a single foreach call"""
+    if not destination:
+        return
+    if hasattr(torch, "_foreach_lerp_"):
+        torch._foreach_lerp_(destination, source, weight)  # pylint: disable=protected-access
+    else:
+        for dest_tensor, src_tensor in zip(destination, source):
+            dest_tensor.lerp_(src_tensor, weight)
+
+
+class TargetNetworkUpdater:
+    """
+    Keeps the target network up to date with the train network, either with a hard sync every sync_rate steps or
+    with a soft Polyak update on every step, target = (1 - tau) * target + tau * net.
+
+    The parameters are updated in place with fused foreach operations, no state dict is built and no tensor is
+    allocated. Buffers, e.g. the noise of noisy layers, are always copied.
+
+    Args:
+        mode: hard or soft
+        sync_rate: number of steps between hard syncs
+        tau: weight of the train network in the soft updates
+    """
+
+    def __init__(self, mode: str = "hard", sync_rate: int = 1000, tau: float = 0.005) -> None:
+        if mode not in ("hard", "soft"):
+            raise ValueError(f"Unknown target update mode {mode}")
+
+        self.mode = mode
+        self.sync_rate = sync_rate
+        self.tau = tau
+
+    def update(self, net: nn.Module, target_net: nn.Module, step: int) -> None:
+        """
+        Updates the target network if the current step requires it
+
+        Args:
+            net: train network
+            target_net: target network with the same architecture
+            step: current global step
+        """
+        if self.mode == "soft":
+            self.soft_update(net, target_net, self.tau)
+        elif step % self.sync_rate == 0:
+            self.hard_update(net, target_net)
+
+    @staticmethod
+    @torch.no_grad()
+    def hard_update(net: nn.Module, target_net: nn.Module) -> None:
+        """Copies the parameters and buffers of the train network into the target network"""
+        _copy_(list(target_net.parameters()), list(net.parameters()))
+        _copy_(list(target_net.buffers()), list(net.buffers()))
+
+    @staticmethod
+    @torch.no_grad()
+    def soft_update(net: nn.Module, target_net: nn.Module, tau: float) -> None:
+        """Moves the target parameters towards the train parameters by tau and copies the buffers"""
+        _lerp_(list(target_net.parameters()), list(net.parameters()), tau)
+        _copy_(list(target_net.buffers()), list(net.buffers()))
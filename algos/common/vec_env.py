@@ -0,0 +1,227 @@
+"""Vectorised environments that step several gym environments with a single call"""
+import multiprocessing as mp
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from gym import Env
+
+
+class SyncVectorEnv:
+    """
+    Steps several environments one after the other in the current process. Each environment is reset as soon as
+    its episode finishes so the vector env always holds a live state for every environment.
+
+    Args:
+        envs: environments to step together, they should all share the same observation and action spaces
+    """
+
+    def __init__(self, envs: List[Env]) -> None:
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.observation_space = envs[0].observation_space
+        self.action_space = envs[0].action_space
+
+    def __len__(self) -> int:
+        return self.num_envs
+
+    def seed(self, seed: int) -> None:
+        """Seeds each environment with a different offset of the given seed"""
+        for idx, env in enumerate(self.envs):
+            env.seed(seed + idx)
+
+    def reset(self) -> np.ndarray:
+        """
+        Resets every environment
+
+        Returns:
+            batch of the first states of each environment
+        """
+        return np.stack([np.asarray(env.reset()) for env in self.envs])
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Takes a step in every environment
+
+        Args:
+            actions: action for each environment
+
+        Returns:
+            new states, rewards and dones of each environment, followed by the states each environment is in now. These
+            are the new states, except for the environments that finished and were reset
+        """
+        new_states, rewards, dones, states = [], [], [], []
+
+        for env, action in zip(self.envs, actions):
+            new_state, reward, done, _ = env.step(int(action))
+            new_state = np.asarray(new_state)
+            new_states.append(new_state)
+            rewards.append(float(reward))
+            dones.append(done)
+            states.append(np.asarray(env.reset()) if done else new_state)
+
+        return (np.stack(new_states), np.array(rewards, dtype=np.float32),
+                np.array(dones, dtype=np.bool_), np.stack(states))
+
+    def close(self) -> None:
+        """Closes every environment"""
+        for env in self.envs:
+            env.close()
+
+
+class _SharedObservations:
+    """
+    Pair of raw shared memory blocks holding the new states and the current states of every env. It is passed to
+    the worker processes, which view the same blocks as numpy arrays
+
+    Args:
+        ctx: multiprocessing context used to allocate the blocks
+        num_envs: number of envs sharing the blocks
+        shape: observation shape
+        dtype: observation dtype
+    """
+
+    def __init__(self, ctx, num_envs: int, shape: Tuple[int, ...], dtype: np.dtype) -> None:
+        self.shape = (num_envs,) + tuple(shape)
+        self.dtype = np.dtype(dtype)
+        nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self.new_states_buffer = ctx.RawArray("b", nbytes)
+        self.states_buffer = ctx.RawArray("b", nbytes)
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Views the new states and current states blocks as (num_envs, *shape) arrays without copying them"""
+        return (np.frombuffer(self.new_states_buffer, dtype=self.dtype).reshape(self.shape),
+                np.frombuffer(self.states_buffer, dtype=self.dtype).reshape(self.shape))
+
+
+def _worker(remote, parent_remote, env_fn: Callable[[], Env], index: int, shared: _SharedObservations) -> None:
+    """
+    Runs a single env in a worker process. Observations are written straight into the shared arrays at the row of
+    this env, only the commands, rewards and dones go through the pipe
+
+    Args:
+        remote: worker end of the pipe used to receive commands
+        parent_remote: parent end of the pipe, closed in the worker
+        env_fn: function creating the env
+        index: row of this env in the shared arrays
+        shared: shared memory blocks holding the observations of every env
+    """
+    parent_remote.close()
+    new_states, states = shared.arrays()
+    env = env_fn()
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                new_state, reward, done, _ = env.step(int(data))
+                new_states[index] = np.asarray(new_state)
+                states[index] = np.asarray(env.reset()) if done else new_states[index]
+                remote.send((float(reward), bool(done)))
+            elif cmd == "reset":
+                states[index] = np.asarray(env.reset())
+                remote.send(None)
+            elif cmd == "seed":
+                env.seed(data)
+                remote.send(None)
+            elif cmd == "close":
+                break
+            else:
+                raise ValueError(f"Unknown command {cmd}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        env.close()
+        remote.close()
+
+
+class SubprocVectorEnv:
+    """
+    Runs each environment in its own worker process so the simulation and the frame processing of the wrappers
+    scale with the number of cores. The workers write their observations into shared memory arrays instead of
+    pickling them through the pipes, the pipes only carry the actions, rewards and dones.
+
+    The returned states are copied out of the shared arrays, as the workers overwrite them on the next step.
+
+    Args:
+        env_fns: functions creating each environment, they need to be picklable when the start method is not fork,
+            e.g. functools.partial(make_env, env_name)
+        observation_space: observation space of the environments, if not given it is read from an env created with
+            the first env function
+        action_space: action space of the environments, read the same way as the observation space
+        start_method: multiprocessing start method, defaults to the platform default
+    """
+
+    def __init__(self, env_fns: List[Callable[[], Env]], observation_space=None, action_space=None,
+                 start_method: Optional[str] = None) -> None:
+        if observation_space is None or action_space is None:
+            env = env_fns[0]()
+            observation_space, action_space = env.observation_space, env.action_space
+            env.close()
+
+        self.num_envs = len(env_fns)
+        self.observation_space = observation_space
+        self.action_space = action_space
+
+        ctx = mp.get_context(start_method)
+        shared = _SharedObservations(ctx, self.num_envs, observation_space.shape, observation_space.dtype)
+        self.new_states, self.states = shared.arrays()
+
+        self.remotes, self.processes = [], []
+        for index, env_fn in enumerate(env_fns):
+            remote, worker_remote = ctx.Pipe()
+            process = ctx.Process(target=_worker, args=(worker_remote, remote, env_fn, index, shared), daemon=True)
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self.num_envs
+
+    def _call(self, cmd: str, data: List = None) -> List:
+        """Sends a command to every worker, then waits for all of them so the workers run in parallel"""
+        data = [None] * self.num_envs if data is None else data
+        for remote, item in zip(self.remotes, data):
+            remote.send((cmd, item))
+        return [remote.recv() for remote in self.remotes]
+
+    def seed(self, seed: int) -> None:
+        """Seeds each environment with a different offset of the given seed"""
+        self._call("seed", [seed + idx for idx in range(self.num_envs)])
+
+    def reset(self) -> np.ndarray:
+        """
+        Resets every environment
+
+        Returns:
+            batch of the first states of each environment
+        """
+        self._call("reset")
+        return self.states.copy()
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Takes a step in every environment
+
+        Args:
+            actions: action for each environment
+
+        Returns:
+            new states, rewards and dones of each environment, followed by the states each environment is in now. These
+            are the new states, except for the environments that finished and were reset
+        """
+        rewards, dones = zip(*self._call("step", list(actions)))
+        return (self.new_states.copy(), np.array(rewards, dtype=np.float32),
+                np.array(dones, dtype=np.bool_), self.states.copy())
+
+    def close(self) -> None:
+        """Stops every worker process"""
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
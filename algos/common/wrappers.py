@@ -115,10 +115,11 @@ class ImageToPyTorch(gym.ObservationWrapper):
 
     def __init__(self, env):
         super(ImageToPyTorch, self).__init__(env)
-        old_shape = self.observation_space.shape
-        new_shape = (old_shape[-1], old_shape[0], old_shape[1])
+        old_space = self.observation_space
+        new_shape = (old_space.shape[-1], old_space.shape[0], old_space.shape[1])
         self.observation_space = gym.spaces.Box(
-            low=0.0, high=1.0, shape=new_shape, dtype=np.float32)
+            low=np.moveaxis(old_space.low, 2, 0), high=np.moveaxis(old_space.high, 2, 0),
+            shape=new_shape, dtype=old_space.dtype)
 
     @staticmethod
     def observation(observation):
@@ -129,11 +130,31 @@ class ImageToPyTorch(gym.ObservationWrapper):
 class ScaledFloatFrame(gym.ObservationWrapper):
     """scales the pixels"""
 
+    def __init__(self, env):
+        super(ScaledFloatFrame, self).__init__(env)
+        old_space = env.observation_space
+        self.observation_space = gym.spaces.Box(
+            low=0.0, high=1.0, shape=old_space.shape, dtype=np.float32)
+
     @staticmethod
     def observation(obs):
         return np.array(obs).astype(np.float32) / 255.0
 
 
+class UInt8Frame(gym.ObservationWrapper):
+    """keeps the pixels as uint8, they are scaled by the network instead"""
+
+    def __init__(self, env):
+        super(UInt8Frame, self).__init__(env)
+        old_space = env.observation_space
+        self.observation_space = gym.spaces.Box(
+            low=0, high=255, shape=old_space.shape, dtype=np.uint8)
+
+    @staticmethod
+    def observation(obs):
+        return np.array(obs).astype(np.uint8)
+
+
 class BufferWrapper(gym.ObservationWrapper):
     """"Wrapper for image stacking"""
 
@@ -177,13 +198,24 @@ class DataAugmentation(gym.ObservationWrapper):
         return ProcessFrame84.process(obs)
 
 
-def make_env(env_name):
-    """Convert environment with wrappers"""
+def make_env(env_name, uint8_obs=False):
+    """
+    Convert environment with wrappers
+
+    Args:
+        env_name: gym environment tag
+        uint8_obs: keep the stacked frames as uint8 instead of scaling them to float, the networks then scale them
+            on the batch. This quarters the memory used to store and move each observation
+    """
     env = gym.make(env_name)
     env = MaxAndSkipEnv(env)
     env = FireResetEnv(env)
     env = ProcessFrame84(env)
     env = ImageToPyTorch(env)
+    if uint8_obs:
+        env = BufferWrapper(env, 4, dtype=np.uint8)
+        env = ToTensor(env)
+        return UInt8Frame(env)
     env = BufferWrapper(env, 4)
     env = ToTensor(env)
     return ScaledFloatFrame(env)
@@ -11,6 +11,7 @@ see the metrics:
 tensorboard --logdir default
 """
 
+import argparse
 from typing import Tuple
 import torch
 import torch.nn as nn
@@ -20,6 +21,10 @@ from algos.dqn.model import DQNLightning
 class DoubleDQNLightning(DQNLightning):
     """ Double DQN Model """
 
+    def __init__(self, hparams: argparse.Namespace) -> None:
+        super().__init__(hparams)
+        self.double_targets = True
+
     def loss(self, batch: Tuple[torch.Tensor, torch.Tensor]) -> torch.Tensor:
         """
         Calculates the mse loss using a mini batch from the replay buffer. This uses an improvement to the original
@@ -35,25 +40,20 @@ class DoubleDQNLightning(DQNLightning):
         states, actions, rewards, dones, next_states = batch  # batch of experiences, batch_size = 16
 
         actions_v = actions.unsqueeze(-1)  # adds a dimension, 16 -> [16, 1]
-        output = self.net(states)  # shape [16, 2], [batch, action space]
+
+        # states and next_states go through the train network in a single [32, 2] forward pass, the outputs of the
+        # next states are detached as we dont want to mess with their gradients
+        output, next_outputs = self.online_values(states, next_states)  # [16, 2], [batch, action space]
 
         # gather the value of the outputs according to the actions index from the batch
         state_action_values = output.gather(1, actions_v).squeeze(-1)
 
-        # dont want to mess with gradients when using the target network
-        with torch.no_grad():
-            next_outputs = self.net(next_states)  # [16, 2], [batch, action_space]
-
-            next_state_acts = next_outputs.max(1)[1].unsqueeze(-1)  # take action at the index with the highest value
-            next_tgt_out = self.target_net(next_states)
-
-            # Take the value of the action chosen by the train network
-            next_state_values = next_tgt_out.gather(1, next_state_acts).squeeze(-1)
-            next_state_values[dones] = 0.0  # any steps flagged as done get a 0 value
-            next_state_values = next_state_values.detach()  # remove values from the graph, no grads needed
+        # Take the value from the target network of the action with the highest value in the train network
+        next_state_values = self.next_state_values(next_states, next_outputs)
+        next_state_values[dones] = 0.0  # any steps flagged as done get a 0 value
 
         # calc expected discounted return of next_state_values
-        expected_state_action_values = next_state_values * self.hparams.gamma + rewards
+        expected_state_action_values = next_state_values * self.bootstrap_gamma + rewards
 
         # Standard MSE loss between the state action values of the current state and the
         # expected state action values of the next state
@@ -11,9 +11,13 @@ see the metrics:
 tensorboard --logdir default
 """
 
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Optional, Union
 import argparse
+import math
+from functools import partial
 from collections import OrderedDict
+from copy import deepcopy
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -21,13 +25,24 @@ from torch.optim import Optimizer
 from torch.utils.data import DataLoader
 import pytorch_lightning as pl
 from algos.common import wrappers
+from algos.common.actors import ActorPool, actor_epsilons
 from algos.common.agents import ValueAgent
-from algos.common.experience import ExperienceSource, RLDataset
-from algos.common.memory import ReplayBuffer
+from algos.common.experience import ExperienceSource, ReplayBatchStream, VectorExperienceSource
+from algos.common.export import export_policy
+from algos.common.inference import InferenceServer
+from algos.common.memory import Experience, ReplayBuffer, RingReplayBuffer, FrameStackReplayBuffer, \
+    MemmapReplayBuffer, MemmapFrameStackReplayBuffer, SharedMemoryReplayBuffer, SharedMemoryFrameStackReplayBuffer, \
+    PrefetchSampler
 from algos.common.networks import CNN
+from algos.common.quantize import quantized_agreement
+from algos.common.target import TargetNetworkUpdater
+from algos.common.vec_env import SyncVectorEnv, SubprocVectorEnv
 
 
-class DQNLightning(pl.LightningModule):
+FRAME_BUFFER_TYPES = ('frame', 'memmap_frame', 'shared_frame')
+
+
+class DQNLightning(pl.LightningModule):  # pylint: disable=too-many-public-methods,too-many-instance-attributes
     """ Basic DQN Model """
 
     def __init__(self, hparams: argparse.Namespace) -> None:
@@ -36,7 +51,7 @@ class DQNLightning(pl.LightningModule):
 
         device = torch.device("cuda:0" if self.hparams.gpus > 0 else "cpu")
 
-        self.env = wrappers.make_env(self.hparams.env)
+        self.env = wrappers.make_env(self.hparams.env, uint8_obs=self.hparams.uint8_obs)
         self.env.seed(123)
 
         self.obs_shape = self.env.observation_space.shape
@@ -49,7 +64,13 @@ class DQNLightning(pl.LightningModule):
 
         self.agent = ValueAgent(self.net, self.n_actions, eps_start=hparams.eps_start,
                                 eps_end=hparams.eps_end, eps_frames=hparams.eps_last_frame)
-        self.source = ExperienceSource(self.env, self.agent, device)
+        self.source = self.build_source(device)
+        self.test_source = None
+        self.actors = None
+        self.prefetcher = None
+        self.quantized_agreement = None
+        self.double_targets = self.hparams.double_dqn
+        self.target_updater = TargetNetworkUpdater(hparams.target_update, hparams.sync_rate, hparams.tau)
 
         self.total_reward = 0
         self.episode_reward = 0
@@ -61,19 +82,198 @@ class DQNLightning(pl.LightningModule):
             self.reward_list.append(-21)
         self.avg_reward = -21
 
+    def build_source(self, device: torch.device):
+        """
+        Initializes the experience source, stepping a vector of envs when num_envs > 1
+
+        Args:
+            device: device used to run the agent
+
+        Returns:
+            experience source
+        """
+        if self.hparams.num_envs > 1:
+            return VectorExperienceSource(self.build_vector_env(), self.agent, device)
+        return ExperienceSource(self.env, self.agent, device)
+
+    def build_vector_env(self) -> Union[SyncVectorEnv, SubprocVectorEnv]:
+        """
+        Initializes num_envs envs stepped together. With vec_env subproc each env runs in its own worker process,
+        otherwise they are stepped in this process, the first one being self.env
+        """
+        if self.hparams.vec_env == "subproc":
+            env_fn = partial(wrappers.make_env, self.hparams.env, uint8_obs=self.hparams.uint8_obs)
+            vec_env = SubprocVectorEnv([env_fn] * self.hparams.num_envs, self.env.observation_space,
+                                       self.env.action_space)
+            vec_env.seed(123)
+            return vec_env
+
+        envs = [self.env]
+        for idx in range(1, self.hparams.num_envs):
+            env = wrappers.make_env(self.hparams.env, uint8_obs=self.hparams.uint8_obs)
+            env.seed(123 + idx)
+            envs.append(env)
+        return SyncVectorEnv(envs)
+
+    def build_actors(self, n_steps: int = 1, target_net: Optional[nn.Module] = None) -> ActorPool:
+        """
+        Starts num_actors actor processes collecting experience with a copy of self.net
+
+        Args:
+            n_steps: number of steps accumulated for each experience
+            target_net: target network shared with the actors when they should compute priorities
+
+        Returns:
+            pool of running actors
+        """
+        env_fn = partial(wrappers.make_env, self.hparams.env, uint8_obs=self.hparams.uint8_obs)
+        epsilons = actor_epsilons(self.hparams.num_actors, self.hparams.actor_eps_base, self.hparams.actor_eps_alpha)
+
+        server = None
+        if self.hparams.inference_server:
+            server = InferenceServer(ValueAgent(deepcopy(self.net).cpu(), self.n_actions),
+                                     max_batch_size=self.hparams.num_actors)
+
+        return ActorPool(env_fn, self.net, epsilons, n_steps=n_steps, target_net=target_net, gamma=self.hparams.gamma,
+                         server=server, quantize=self.hparams.quantize_actors)
+
     def populate(self, warm_start: int) -> None:
-        """Populates the buffer with initial experience"""
-        if warm_start > 0:
-            for _ in range(warm_start):
-                self.source.agent.epsilon = 1.0
-                exp, _, _ = self.source.step()
+        """Populates the buffer with initial experience, a buffer reopened from disk only needs topping up"""
+        if self.actors is not None:
+            while len(self.buffer) < warm_start:
+                experiences, priorities, _ = self.actors.collect(block=True)
+                self.store_experiences(experiences, priorities)
+        elif warm_start > 0:
+            self.source.agent.epsilon = 1.0
+            for _ in range(math.ceil((warm_start - len(self.buffer)) / self.hparams.num_envs)):
+                self.play_step()
+
+    def play_step(self) -> List[Tuple[float, int]]:
+        """
+        Steps the experience source and adds the new experiences to the buffer
+
+        Returns:
+            total reward and number of steps of each episode that finished during this step
+        """
+        if self.actors is not None:
+            synced = self.global_step % self.hparams.actor_sync_interval == 0
+            if synced:
+                self.actors.sync(self.net, self.target_net)
+            experiences, priorities, finished = self.actors.collect()
+            if synced and experiences and self.hparams.quantize_actors:
+                states = torch.as_tensor(np.stack([exp.state for exp in experiences]))
+                self.quantized_agreement = quantized_agreement(self.net, states)
+            self.store_experiences(experiences, priorities)
+            return finished
+
+        if isinstance(self.source, VectorExperienceSource):
+            experiences, _, _ = self.source.step()
+            for exp in experiences:
                 self.buffer.append(exp)
+            return self.source.pop_rewards_steps()
+
+        exp, reward, done = self.source.step()
+        self.buffer.append(exp)
+
+        self.episode_reward += reward
+        self.episode_steps += 1
+
+        if not done:
+            return []
+
+        finished = [(self.episode_reward, self.episode_steps)]
+        self.episode_reward = 0
+        self.episode_steps = 0
+        return finished
+
+    def collect_step(self) -> List[Tuple[float, int]]:
+        """
+        Collection phase of a training step, it plays env_steps_per_update steps once every updates_per_env_step
+        training steps, so the replay ratio is set without changing the training step. The actor processes collect
+        on their own, so with actors the experience they sent is stored on every training step
+
+        Returns:
+            total reward and number of steps of each episode that finished during the collection
+        """
+        if self.actors is not None:
+            return self.play_step()
+        if self.global_step % self.hparams.updates_per_env_step != 0:
+            return []
+
+        finished = []
+        for _ in range(self.hparams.env_steps_per_update):
+            finished.extend(self.play_step())
+        return finished
+
+    # pylint: disable=unused-argument
+    def store_experiences(self, experiences: List[Experience], priorities: Optional[np.ndarray] = None) -> None:
+        """
+        Adds the experiences sent by the actors to the buffer
+
+        Args:
+            experiences: experiences collected by the actors
+            priorities: initial priority of each experience computed by the actors, not used by the uniform buffer
+        """
+        for exp in experiences:
+            self.buffer.append(exp)
+
+    def actor_metrics(self) -> Dict[str, torch.Tensor]:
+        """Metrics of the actor processes to add to the training log"""
+        if self.quantized_agreement is None:
+            return {}
+        return {'quantized_agreement': torch.tensor(self.quantized_agreement)}
+
+    def record_episode(self, total_reward: float, steps: int) -> None:
+        """
+        Updates the episode metrics with a finished episode
+
+        Args:
+            total_reward: total reward of the episode
+            steps: number of steps in the episode
+        """
+        self.total_reward = total_reward
+        self.reward_list.append(self.total_reward)
+        self.avg_reward = sum(self.reward_list[-100:]) / 100
+        self.episode_count += 1
+        self.total_episode_steps = steps
 
     def build_networks(self) -> None:
         """Initializes the DQN train and target networks"""
         self.net = CNN(self.obs_shape, self.n_actions)
         self.target_net = CNN(self.obs_shape, self.n_actions)
 
+    @property
+    def experience_steps(self) -> int:
+        """Number of env steps between the state and the next state of each experience stored in the buffer"""
+        return 1
+
+    @property
+    def bootstrap_gamma(self) -> float:
+        """Discount applied to the value of the next state of each sampled experience"""
+        return self.hparams.gamma
+
+    def build_buffer(self):
+        """
+        Initializes the replay buffer selected by the buffer_type hparam. The frame buffers rebuild the stacked
+        observations from the consecutive single steps of one env, so they reject the experiences of several envs,
+        of actors or of n steps, which would silently mix up the frames
+        """
+        if self.hparams.buffer_type in FRAME_BUFFER_TYPES and (
+                self.hparams.num_envs > 1 or self.hparams.num_actors > 0 or self.experience_steps > 1):
+            raise ValueError(f"buffer_type {self.hparams.buffer_type} needs the single steps of a single env, set "
+                             "num_envs to 1 and num_actors to 0 and use a 1 step DQN or lazy_n_step")
+
+        ring_buffers = {'ring': RingReplayBuffer, 'frame': FrameStackReplayBuffer,
+                        'shared': SharedMemoryReplayBuffer, 'shared_frame': SharedMemoryFrameStackReplayBuffer}
+        memmap_buffers = {'memmap': MemmapReplayBuffer, 'memmap_frame': MemmapFrameStackReplayBuffer}
+
+        if self.hparams.buffer_type in ring_buffers:
+            return ring_buffers[self.hparams.buffer_type].from_env(self.hparams.replay_size, self.env)
+        if self.hparams.buffer_type in memmap_buffers:
+            return memmap_buffers[self.hparams.buffer_type].from_env(self.hparams.replay_size, self.env,
+                                                                     directory=self.hparams.buffer_dir)
+        return ReplayBuffer(self.hparams.replay_size)
+
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """
         Passes in a state x through the network and gets the q_values of each action as an output
@@ -99,17 +299,58 @@ class DQNLightning(pl.LightningModule):
         """
         states, actions, rewards, dones, next_states = batch
 
-        state_action_values = self.net(states).gather(1, actions.unsqueeze(-1)).squeeze(-1)
+        state_values, next_online_values = self.online_values(states, next_states)
+        state_action_values = state_values.gather(1, actions.unsqueeze(-1)).squeeze(-1)
 
-        with torch.no_grad():
-            next_state_values = self.target_net(next_states).max(1)[0]
-            next_state_values[dones] = 0.0
-            next_state_values = next_state_values.detach()
+        next_state_values = self.next_state_values(next_states, next_online_values)
+        next_state_values[dones] = 0.0
 
-        expected_state_action_values = next_state_values * self.hparams.gamma + rewards
+        expected_state_action_values = next_state_values * self.bootstrap_gamma + rewards
 
         return nn.MSELoss()(state_action_values, expected_state_action_values)
 
+    def online_values(self, states: torch.Tensor,
+                      next_states: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """
+        Q values of the train network for the states of the batch. With double targets the next states are passed
+        through the train network too, concatenated with the states so both go through a single forward pass. The
+        gradient only flows through the states half
+
+        Args:
+            states: states of the batch
+            next_states: next states of the batch
+
+        Returns:
+            Q values of the states, followed by the detached Q values of the next states when double targets are
+            used, otherwise None
+        """
+        if not self.double_targets:
+            return self.net(states), None
+
+        values = self.net(torch.cat([states, next_states]))
+        state_values, next_values = values.split(len(states))
+        return state_values, next_values.detach()
+
+    def next_state_values(self, next_states: torch.Tensor,
+                          next_online_values: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        Values of the next states from the target network, without gradient
+
+        Args:
+            next_states: next states of the batch
+            next_online_values: Q values of the next states from the train network. When given, the target network
+                values the action the train network picks (double DQN), otherwise its own best action
+
+        Returns:
+            value of each next state
+        """
+        with torch.no_grad():
+            target_values = self.target_net(next_states)
+            if next_online_values is None:
+                return target_values.max(1)[0]
+            next_actions = next_online_values.argmax(dim=1, keepdim=True)
+            return target_values.gather(1, next_actions).squeeze(-1)
+
     def training_step(self, batch: Tuple[torch.Tensor, torch.Tensor], _) -> OrderedDict:
         """
         Carries out a single step through the environment to update the replay buffer.
@@ -125,11 +366,8 @@ class DQNLightning(pl.LightningModule):
         self.agent.update_epsilon(self.global_step)
 
         # step through environment with agent and add to buffer
-        exp, reward, done = self.source.step()
-        self.buffer.append(exp)
-
-        self.episode_reward += reward
-        self.episode_steps += 1
+        for total_reward, steps in self.collect_step():
+            self.record_episode(total_reward, steps)
 
         # calculates training loss
         loss = self.loss(batch)
@@ -137,24 +375,15 @@ class DQNLightning(pl.LightningModule):
         if self.trainer.use_dp or self.trainer.use_ddp2:
             loss = loss.unsqueeze(0)
 
-        if done:
-            self.total_reward = self.episode_reward
-            self.reward_list.append(self.total_reward)
-            self.avg_reward = sum(self.reward_list[-100:]) / 100
-            self.episode_count += 1
-            self.episode_reward = 0
-            self.total_episode_steps = self.episode_steps
-            self.episode_steps = 0
-
-        # Soft update of target network
-        if self.global_step % self.hparams.sync_rate == 0:
-            self.target_net.load_state_dict(self.net.state_dict())
+        # Update of target network, hard sync every sync_rate steps or soft update every step
+        self.target_updater.update(self.net, self.target_net, self.global_step)
 
         log = {'total_reward': torch.tensor(self.total_reward).to(self.device),
                'avg_reward': torch.tensor(self.avg_reward),
                'train_loss': loss,
                'episode_steps': torch.tensor(self.total_episode_steps)
                }
+        log.update(self.actor_metrics())
         status = {'steps': torch.tensor(self.global_step).to(self.device),
                   'avg_reward': torch.tensor(self.avg_reward),
                   'total_reward': torch.tensor(self.total_reward).to(self.device),
@@ -166,10 +395,49 @@ class DQNLightning(pl.LightningModule):
         return OrderedDict({'loss': loss, 'avg_reward': torch.tensor(self.avg_reward),
                             'log': log, 'progress_bar': status})
 
+    def export_policy(self, path: str) -> None:
+        """
+        Exports the network with an epsilon greedy head as a TorchScript policy, see export.load_policy
+
+        Args:
+            path: file the policy is saved to
+        """
+        example_states = torch.as_tensor(self.env.observation_space.sample())[None]
+        export_policy(deepcopy(self.net).cpu(), example_states, path, n_actions=self.n_actions, head="greedy")
+
+    def on_train_end(self) -> None:
+        """Stops the actor processes, the prefetch thread and the vector env workers once training is done"""
+        if self.actors is not None:
+            self.actors.close()
+            self.actors = None
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+        if isinstance(self.source, VectorExperienceSource):
+            self.source.env.close()
+
+    def build_test_source(self) -> ExperienceSource:
+        """
+        Initializes the experience source used for evaluation. The episodes of a vector source are already in
+        progress and explore with the training epsilons, so it is evaluated on a fresh single env instead
+        """
+        if not isinstance(self.source, VectorExperienceSource):
+            return self.source
+
+        env = wrappers.make_env(self.hparams.env, uint8_obs=self.hparams.uint8_obs)
+        env.seed(123)
+        return ExperienceSource(env, self.agent, self.source.device)
+
     def test_step(self, *args, **kwargs) -> Dict[str, torch.Tensor]:
         """Evaluate the agent for 10 episodes"""
-        self.agent.epsilon = 0.0
-        test_reward = self.source.run_episode()
+        if self.test_source is None:
+            self.test_source = self.build_test_source()
+
+        if isinstance(self.source, VectorExperienceSource):
+            self.agent.epsilon = self.hparams.eps_end
+        else:
+            self.agent.epsilon = 0.0
+        test_reward = self.test_source.run_episode()
 
         return {'test_reward': test_reward}
 
@@ -185,24 +453,61 @@ class DQNLightning(pl.LightningModule):
         optimizer = optim.Adam(self.net.parameters(), lr=self.hparams.lr)
         return [optimizer]
 
-    def _dataloader(self) -> DataLoader:
-        """Initialize the Replay Buffer dataset used for retrieving experiences"""
-        self.buffer = ReplayBuffer(self.hparams.replay_size)
-        self.populate(self.hparams.warm_start_size)
+    def _dataloader(self, train: bool = True) -> DataLoader:
+        """
+        Initialize the Replay Buffer dataset used for retrieving experiences. The training stream is sampled by
+        num_workers DataLoader workers when the buffer is in shared memory
 
-        dataset = RLDataset(self.buffer, self.hparams.episode_length)
-        dataloader = DataLoader(dataset=dataset,
-                                batch_size=self.hparams.batch_size,
+        Args:
+            train: whether the loader is used for training, the test loader is sampled in the training loop
+        """
+        if self.buffer is None:
+            self.buffer = self.build_buffer()
+            self.populate(self.hparams.warm_start_size)
+
+        num_workers = self.hparams.num_workers if train else 0
+        if num_workers > 0 and not isinstance(self.buffer, SharedMemoryReplayBuffer):
+            raise ValueError("DataLoader workers can only sample a buffer in shared memory, "
+                             "use --buffer_type shared or shared_frame")
+
+        dataloader = DataLoader(dataset=self.build_batch_stream(prefetch=train and num_workers == 0),
+                                batch_size=None,
+                                num_workers=num_workers,
                                 )
         return dataloader
 
+    def build_batch_stream(self, prefetch: bool = False) -> ReplayBatchStream:
+        """
+        Initializes the stream of batches sampled from the buffer. Each epoch has the batches of an episode_length
+        sample, so epoch end callbacks such as checkpointing keep running during training. With prefetch and
+        prefetch_batches > 0 the stream is sampled in a background thread
+
+        Args:
+            prefetch: sample the stream in a background thread when prefetch_batches > 0
+
+        Returns:
+            stream of collated batches
+        """
+        sampler = self.buffer
+        sample_size = self.hparams.batch_size * self.hparams.updates_per_env_step
+        if prefetch and self.hparams.prefetch_batches > 0:
+            num_samples = math.ceil(self.hparams.prefetch_batches / self.hparams.updates_per_env_step)
+            self.prefetcher = PrefetchSampler(self.buffer, sample_size, num_samples=num_samples,
+                                              pin_memory=self.on_gpu)
+            sampler = self.prefetcher
+
+        return ReplayBatchStream(sampler, self.hparams.batch_size, self.hparams.updates_per_env_step,
+                                 num_batches=math.ceil(self.hparams.episode_length / self.hparams.batch_size))
+
     def train_dataloader(self) -> DataLoader:
-        """Get train loader"""
+        """Get train loader, starting the actors first when training with actor processes"""
+        if self.hparams.num_actors > 0 and self.actors is None:
+            self.actors = self.build_actors()
         return self._dataloader()
 
     def test_dataloader(self) -> DataLoader:
-        """Get test loader"""
-        return self._dataloader()
+        """Get test loader, running one test episode per batch of an episode_length sample"""
+        return self._dataloader(train=False)
 
     @staticmethod
     def add_model_specific_args(arg_parser) -> argparse.ArgumentParser:
@@ -216,8 +521,61 @@ class DQNLightning(pl.LightningModule):
         """
         arg_parser.add_argument("--sync_rate", type=int, default=1000,
                                 help="how many frames do we update the target network")
+        arg_parser.add_argument("--target_update", type=str, default="hard", choices=["hard", "soft"],
+                                help="hard copies the network every sync_rate steps, soft moves the target network "
+                                     "towards it by tau on every step")
+        arg_parser.add_argument("--tau", type=float, default=0.005,
+                                help="weight of the network in the soft target updates")
+        arg_parser.add_argument("--env_steps_per_update", type=int, default=1,
+                                help="how many env steps are played in each collection phase")
+        arg_parser.add_argument("--updates_per_env_step", type=int, default=1,
+                                help="how many gradient updates share a collection phase, their minibatches are "
+                                     "drawn from the buffer in a single sample call")
         arg_parser.add_argument("--replay_size", type=int, default=100000,
                                 help="capacity of the replay buffer")
+        arg_parser.add_argument("--buffer_type", type=str, default="deque",
+                                choices=["deque", "ring", "frame", "memmap", "memmap_frame", "shared", "shared_frame"],
+                                help="storage used by the replay buffer, frame only stores each Atari frame once, "
+                                     "memmap keeps the observations on disk and shared keeps the buffer in shared "
+                                     "memory so DataLoader workers can sample it")
+        arg_parser.add_argument("--buffer_dir", type=str, default="replay_buffer",
+                                help="directory holding the files of a memmap replay buffer")
+        arg_parser.add_argument("--num_workers", type=int, default=0,
+                                help="DataLoader workers sampling and collating the training batches, needs a "
+                                     "shared buffer_type")
+        arg_parser.add_argument("--prefetch_batches", type=int, default=0,
+                                help="batches sampled ahead by a background thread while the current one trains, "
+                                     "0 samples in the training loop")
+        arg_parser.add_argument("--per_buffer", type=str, default="tree", choices=["tree", "list"],
+                                help="storage used by the prioritized replay buffer, tree can use the deque or "
+                                     "memmap buffer_type and list only deque")
+        arg_parser.add_argument("--num_envs", type=int, default=1,
+                                help="number of envs stepped together by the agent on each step")
+        arg_parser.add_argument("--vec_env", type=str, default="sync", choices=["sync", "subproc"],
+                                help="run the envs in this process or in one worker process each")
+        arg_parser.add_argument("--num_actors", type=int, default=0,
+                                help="number of actor processes collecting experience while the learner trains, "
+                                     "0 steps the env in the training loop")
+        arg_parser.add_argument("--actor_sync_interval", type=int, default=400,
+                                help="how many learner steps between publishing the weights to the actors")
+        arg_parser.add_argument("--actor_eps_base", type=float, default=0.4,
+                                help="epsilon of the first actor")
+        arg_parser.add_argument("--actor_eps_alpha", type=float, default=7.0,
+                                help="how fast the epsilon decreases over the actors")
+        arg_parser.add_argument("--inference_server", action="store_true",
+                                help="act for every actor with a single batched network in the learner process")
+        arg_parser.add_argument("--quantize_actors", action="store_true",
+                                help="actors act with an int8 dynamically quantised copy of the network, the "
+                                     "agreement with the fp32 actions is logged on every weight sync")
+        arg_parser.add_argument("--double_dqn", action="store_true",
+                                help="use double DQN targets, the train network picks the next action")
+        arg_parser.add_argument("--lazy_n_step", action="store_true",
+                                help="store single steps and compute the n step returns of the N Step DQN when "
+                                     "sampling, so n_steps and gamma are not baked into the buffer")
+        arg_parser.add_argument("--factorised_noise", action="store_true",
+                                help="use factorised gaussian noise in the noisy layers of the Noisy DQN")
+        arg_parser.add_argument("--uint8_obs", action="store_true",
+                                help="keep Atari observations as uint8 and scale them inside the network")
         arg_parser.add_argument("--warm_start_size", type=int, default=10000,
                                 help="how many samples do we use to fill our buffer at the start of training")
         arg_parser.add_argument("--eps_last_frame", type=int, default=150000,
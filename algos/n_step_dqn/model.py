@@ -10,46 +10,58 @@ After ~1500 steps, you will see the total_reward hitting the max score of 200. O
 see the metrics:
 tensorboard --logdir default
 """
-import argparse
 
 import torch
 
-from algos.common import wrappers
-from algos.common.agents import ValueAgent
-from algos.common.experience import NStepExperienceSource
-from algos.common.memory import ReplayBuffer
+from algos.common.actors import ActorPool
+from algos.common.experience import ExperienceSource, NStepExperienceSource, VectorExperienceSource
+from algos.common.memory import NStepReplayBuffer
 from algos.dqn.model import DQNLightning
 
 class NStepDQNLightning(DQNLightning):
     """ NStep DQN Model """
 
-    def __init__(self, hparams: argparse.Namespace) -> None:
-        super().__init__(hparams)
-        self.hparams = hparams
+    def build_source(self, device: torch.device):
+        """
+        Initializes the n step experience source, stepping a vector of envs when num_envs > 1. With lazy_n_step
+        the source gives single steps, see build_buffer
 
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+        Args:
+            device: device used to run the agent
 
-        self.env = wrappers.make_env(self.hparams.env)
-        self.env.seed(123)
+        Returns:
+            experience source
+        """
+        if self.hparams.lazy_n_step:
+            return ExperienceSource(self.env, self.agent, device)
+        if self.hparams.num_envs > 1:
+            return VectorExperienceSource(self.build_vector_env(), self.agent, device, n_steps=self.hparams.n_steps,
+                                          gamma=self.hparams.gamma)
+        return NStepExperienceSource(self.env, self.agent, device, n_steps=self.hparams.n_steps,
+                                     gamma=self.hparams.gamma)
 
-        self.obs_shape = self.env.observation_space.shape
-        self.n_actions = self.env.action_space.n
+    @property
+    def experience_steps(self) -> int:
+        """Number of env steps in each stored experience, single steps with lazy_n_step"""
+        return 1 if self.hparams.lazy_n_step else self.hparams.n_steps
 
-        self.net = None
-        self.target_net = None
-        self.build_networks()
+    @property
+    def bootstrap_gamma(self) -> float:
+        """The next state of each sampled experience is n_steps after its state, with or without lazy_n_step"""
+        return self.hparams.gamma ** self.hparams.n_steps
 
-        self.agent = ValueAgent(self.net, self.n_actions, eps_start=hparams.eps_start,
-                                eps_end=hparams.eps_end, eps_frames=hparams.eps_last_frame)
-        self.source = NStepExperienceSource(self.env, self.agent, device, n_steps=self.hparams.n_steps)
-        self.buffer = ReplayBuffer(self.hparams.replay_size)
+    def build_buffer(self):
+        """
+        Initializes the replay buffer. With lazy_n_step single step experiences are stored and the n step returns
+        are computed when sampling, which needs the experiences of a single env in the order they happened
+        """
+        if not self.hparams.lazy_n_step:
+            return super().build_buffer()
+        if self.hparams.num_envs > 1 or self.hparams.num_actors > 0:
+            raise ValueError("lazy_n_step needs the experience of a single env, set num_envs to 1 and num_actors to 0")
+        return NStepReplayBuffer.from_env(self.hparams.replay_size, self.env, n_steps=self.hparams.n_steps,
+                                          gamma=self.hparams.gamma)
 
-        self.total_reward = 0
-        self.episode_reward = 0
-        self.episode_count = 0
-        self.episode_steps = 0
-        self.total_episode_steps = 0
-        self.reward_list = []
-        for _ in range(100):
-            self.reward_list.append(-21)
-        self.avg_reward = 0
+    def build_actors(self, n_steps: int = None) -> ActorPool:
+        """Starts actor processes collecting n step experience"""
+        return super().build_actors(n_steps=n_steps or self.hparams.n_steps)
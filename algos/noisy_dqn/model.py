@@ -23,9 +23,15 @@ class NoisyDQNLightning(DQNLightning):
     """ Noisy DQN Model """
 
     def build_networks(self) -> None:
-        """Initializes the Noisy DQN train and target networks"""
-        self.net = NoisyCNN(self.obs_shape, self.n_actions)
-        self.target_net = NoisyCNN(self.obs_shape, self.n_actions)
+        """
+        Initializes the Noisy DQN train and target networks. Their noise is only resampled once per training step
+        by reset_noise instead of on every forward call, the actors and the inference server resample the noise of
+        their copy before each step
+        """
+        self.net = NoisyCNN(self.obs_shape, self.n_actions, factorised=self.hparams.factorised_noise,
+                            auto_reset_noise=False)
+        self.target_net = NoisyCNN(self.obs_shape, self.n_actions, factorised=self.hparams.factorised_noise,
+                                   auto_reset_noise=False)
 
     def on_train_start(self) -> None:
         """Set the agents epsilon to 0 as the exploration comes from the network"""
@@ -43,12 +49,13 @@ class NoisyDQNLightning(DQNLightning):
         Returns:
             Training loss and log metrics
         """
-        # step through environment with agent and add to buffer
-        exp, reward, done = self.source.step()
-        self.buffer.append(exp)
+        # sample the noise used by this step, for acting and for the loss
+        self.net.reset_noise()
+        self.target_net.reset_noise()
 
-        self.episode_reward += reward
-        self.episode_steps += 1
+        # step through environment with agent and add to buffer
+        for total_reward, steps in self.collect_step():
+            self.record_episode(total_reward, steps)
 
         # calculates training loss
         loss = self.loss(batch)
@@ -56,24 +63,15 @@ class NoisyDQNLightning(DQNLightning):
         if self.trainer.use_dp or self.trainer.use_ddp2:
             loss = loss.unsqueeze(0)
 
-        if done:
-            self.total_reward = self.episode_reward
-            self.reward_list.append(self.total_reward)
-            self.avg_reward = sum(self.reward_list[-100:]) / 100
-            self.episode_count += 1
-            self.episode_reward = 0
-            self.total_episode_steps = self.episode_steps
-            self.episode_steps = 0
-
-        # Soft update of target network
-        if self.global_step % self.hparams.sync_rate == 0:
-            self.target_net.load_state_dict(self.net.state_dict())
+        # Update of target network, hard sync every sync_rate steps or soft update every step
+        self.target_updater.update(self.net, self.target_net, self.global_step)
 
         log = {'total_reward': torch.tensor(self.total_reward).to(self.device),
                'avg_reward': torch.tensor(self.avg_reward),
                'train_loss': loss,
                'episode_steps': torch.tensor(self.total_episode_steps)
                }
+        log.update(self.actor_metrics())
         status = {'steps': torch.tensor(self.global_step).to(self.device),
                   'avg_reward': torch.tensor(self.avg_reward),
                   'total_reward': torch.tensor(self.total_reward).to(self.device),
@@ -12,26 +12,62 @@ tensorboard --logdir default
 """
 
 from collections import OrderedDict
-from typing import Tuple, List
+from typing import Tuple, List, Optional
+import numpy as np
 import torch
 from torch.utils.data import DataLoader
 
-from algos.common.agents import ValueAgent
-from algos.common.experience import ExperienceSource, PrioRLDataset
-from algos.common.memory import PERBuffer
+from algos.common.actors import ActorPool
+from algos.common.memory import Experience, PERBuffer, SumTreePERBuffer, MemmapSumTreePERBuffer, \
+    AsyncPriorityUpdater
 from algos.dqn.model import DQNLightning
 
+# buffer_type storages each per_buffer can be kept in
+PER_BUFFER_TYPES = {'tree': ('deque', 'memmap'), 'list': ('deque',)}
+
 
 class PERDQNLightning(DQNLightning):
     """ PER DQN Model """
 
     def __init__(self, hparams):
         super().__init__(hparams)
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        self.agent = ValueAgent(self.net, self.n_actions, eps_start=hparams.eps_start,
-                                eps_end=hparams.eps_end, eps_frames=hparams.eps_last_frame)
-        self.source = ExperienceSource(self.env, self.agent, device)
-        self.buffer = PERBuffer(self.hparams.replay_size)
+        self.priority_updater = None
+
+    def build_buffer(self):
+        """Initializes the prioritized replay buffer selected by the per_buffer hparam"""
+        supported = PER_BUFFER_TYPES[self.hparams.per_buffer]
+        if self.hparams.buffer_type not in supported:
+            raise ValueError(f"buffer_type {self.hparams.buffer_type} is not supported by the "
+                             f"{self.hparams.per_buffer} prioritized buffer, "
+                             f"use --buffer_type {' or '.join(supported)}")
+
+        if self.hparams.per_buffer == 'list':
+            return PERBuffer(self.hparams.replay_size)
+        if self.hparams.buffer_type == 'memmap':
+            return MemmapSumTreePERBuffer.from_env(self.hparams.replay_size, self.env,
+                                                   minibatch_size=self.hparams.batch_size,
+                                                   directory=self.hparams.buffer_dir)
+        return SumTreePERBuffer.from_env(self.hparams.replay_size, self.env, minibatch_size=self.hparams.batch_size)
+
+    def build_actors(self, n_steps: int = 1, target_net=None) -> ActorPool:
+        """Starts actor processes that also compute the initial priority of their experiences"""
+        target_net = self.target_net if target_net is None else target_net
+        return super().build_actors(n_steps=n_steps, target_net=target_net)
+
+    def store_experiences(self, experiences: List[Experience], priorities: Optional[np.ndarray] = None) -> None:
+        """
+        Adds the experiences sent by the actors to the buffer with the priorities they computed
+
+        Args:
+            experiences: experiences collected by the actors
+            priorities: initial priority of each experience, the max priority is used when missing
+        """
+        if priorities is None or isinstance(self.buffer, PERBuffer):
+            super().store_experiences(experiences)
+            return
+
+        for exp, priority in zip(experiences, priorities):
+            self.buffer.append(exp, priority)
 
     def training_step(self, batch, _) -> OrderedDict:
         """
@@ -47,45 +83,37 @@ class PERDQNLightning(DQNLightning):
         """
         samples, indices, weights = batch
 
-        indices = indices.cpu().numpy()
+        # copied as the tensors of prefetched batches are reused
+        indices = np.array(indices.cpu())
 
         self.agent.update_epsilon(self.global_step)
 
         # step through environment with agent and add to buffer
-        exp, reward, done = self.source.step()
-        self.buffer.append(exp)
-
-        self.episode_reward += reward
-        self.episode_steps += 1
+        for total_reward, steps in self.collect_step():
+            self.record_episode(total_reward, steps)
 
         # calculates training loss
         loss, batch_weights = self.loss(samples, weights)
 
         # update priorities in buffer
-        self.buffer.update_priorities(indices, batch_weights)
+        if self.priority_updater is not None:
+            self.priority_updater.submit(indices, batch_weights)
+        else:
+            self.buffer.update_priorities(indices, batch_weights)
         # self.buffer.update_beta(self.global_step)
 
         if self.trainer.use_dp or self.trainer.use_ddp2:
             loss = loss.unsqueeze(0)
 
-        if done:
-            self.total_reward = self.episode_reward
-            self.reward_list.append(self.total_reward)
-            self.avg_reward = sum(self.reward_list[-100:]) / 100
-            self.episode_count += 1
-            self.episode_reward = 0
-            self.total_episode_steps = self.episode_steps
-            self.episode_steps = 0
-
-        # Soft update of target network
-        if self.global_step % self.hparams.sync_rate == 0:
-            self.target_net.load_state_dict(self.net.state_dict())
+        # Update of target network, hard sync every sync_rate steps or soft update every step
+        self.target_updater.update(self.net, self.target_net, self.global_step)
 
         log = {'total_reward': torch.tensor(self.total_reward).to(self.device),
                'avg_reward': torch.tensor(self.avg_reward),
                'train_loss': loss,
                'episode_steps': torch.tensor(self.total_episode_steps)
                }
+        log.update(self.actor_metrics())
         status = {'steps': torch.tensor(self.global_step).to(self.device),
                   'avg_reward': torch.tensor(self.avg_reward),
                   'total_reward': torch.tensor(self.total_reward).to(self.device),
@@ -111,24 +139,40 @@ class PERDQNLightning(DQNLightning):
 
         batch_weights = torch.tensor(batch_weights)
 
-        actions_v = actions.unsqueeze(-1)
-        state_action_vals = self.net(states).gather(1, actions_v)
+        state_vals, next_online_vals = self.online_values(states, next_states)
+        state_action_vals = state_vals.gather(1, actions.unsqueeze(-1))
         state_action_vals = state_action_vals.squeeze(-1)
-        with torch.no_grad():
-            next_s_vals = self.target_net(next_states).max(1)[0]
-            next_s_vals[dones] = 0.0
-            exp_sa_vals = next_s_vals.detach() * self.hparams.gamma + rewards
+        next_s_vals = self.next_state_values(next_states, next_online_vals)
+        next_s_vals[dones] = 0.0
+        exp_sa_vals = next_s_vals * self.bootstrap_gamma + rewards
         loss = (state_action_vals - exp_sa_vals) ** 2
         losses_v = batch_weights * loss
         return losses_v.mean(), (losses_v + 1e-5).data.cpu().numpy()
 
-    def _dataloader(self) -> DataLoader:
-        """Initialize the Replay Buffer dataset used for retrieving experiences"""
-        self.buffer = PERBuffer(self.hparams.replay_size)
-        self.populate(self.hparams.warm_start_size)
+    def on_train_end(self) -> None:
+        """Applies the remaining priority updates and stops the actors"""
+        if self.priority_updater is not None:
+            self.priority_updater.close()
+            self.priority_updater = None
+        super().on_train_end()
+
+    def _dataloader(self, train: bool = True) -> DataLoader:
+        """
+        Initialize the Replay Buffer dataset used for retrieving experiences
+
+        Args:
+            train: whether the loader is used for training, only the training stream is prefetched
+        """
+        if self.hparams.num_workers > 0:
+            raise ValueError("The priorities of a prioritized buffer are not shared with DataLoader workers")
+
+        if self.buffer is None:
+            self.buffer = self.build_buffer()
+            self.populate(self.hparams.warm_start_size)
+            if self.actors is not None and isinstance(self.buffer, SumTreePERBuffer):
+                self.priority_updater = AsyncPriorityUpdater(self.buffer)
 
-        dataset = PrioRLDataset(self.buffer, self.hparams.batch_size)
-        dataloader = DataLoader(dataset=dataset,
-                                batch_size=self.hparams.batch_size,
+        dataloader = DataLoader(dataset=self.build_batch_stream(prefetch=train),
+                                batch_size=None,
                                 )
         return dataloader
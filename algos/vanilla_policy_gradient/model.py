@@ -11,7 +11,6 @@ see the metrics:
 tensorboard --logdir default
 """
 from copy import deepcopy
-from itertools import chain
 from typing import Tuple, List
 import argparse
 from collections import OrderedDict
@@ -25,9 +24,11 @@ from torch.utils.data import DataLoader
 import pytorch_lightning as pl
 import gym
 from algos.common.agents import PolicyAgent
-from algos.common.experience import EpisodicExperienceStream
-from algos.common.memory import Experience
+from algos.common.experience import EpisodicRolloutStream
+from algos.common.export import export_policy
+from algos.common.memory import Rollout
 from algos.common.networks import MLP
+from algos.common.returns import reward_to_go
 from algos.common.wrappers import ToTensor
 
 
@@ -79,97 +80,20 @@ class VPGLightning(pl.LightningModule):
         output = self.net(x)
         return output
 
-    def calc_qvals(self, rewards: List[Tensor]) -> List[Tensor]:
+    def process_rollout(self, rollout: Rollout) -> Tuple[Tensor, Tensor, Tensor, Tensor]:
         """
-        Takes in the rewards for each batched episode and returns list of qvals for each batched episode
+        Retrieves the q vals, the states, the actions and the rewards of a rollout. The flat tensors of the rollout
+        are used as they are and the q vals of every episode are computed together, see returns.reward_to_go
 
         Args:
-            rewards: list of rewards for each episodes in the batch
+            rollout: steps of several episodes stored as flat tensors
 
         Returns:
-            List of qvals for each episodes
+            q_vals, states, actions and rewards used for calculating the loss
         """
-        res = []
-        sum_r = 0.0
-        for reward in reversed(rewards):
-            sum_r *= self.hparams.gamma
-            sum_r += reward
-            res.append(deepcopy(sum_r))
-        res = list(reversed(res))
-        # Subtract the mean (baseline) from the q_vals to reduce the high variance
-        sum_q = 0
-        for rew in res:
-            sum_q += rew
-        mean_q = sum_q / len(res)
-        return [q - mean_q for q in res]
-
-    def process_batch(self, batch: List[List[Experience]]) -> Tuple[List[Tensor], List[Tensor], List[Tensor]]:
-        """
-        Takes in a batch of episodes and retrieves the q vals, the states and the actions for the batch
-
-        Args:
-            batch: list of episodes, each containing a list of Experiences
-
-        Returns:
-            q_vals, states and actions used for calculating the loss
-        """
-        # get outputs for each episode
-        batch_rewards, batch_states, batch_actions = [], [], []
-        for episode in batch:
-            ep_rewards, ep_states, ep_actions = [], [], []
-
-            # log the outputs for each step
-            for step in episode:
-                ep_rewards.append(step[2].float())
-                ep_states.append(step[0])
-                ep_actions.append(step[1])
+        batch_qvals = reward_to_go(rollout.rewards, rollout.dones, self.hparams.gamma, baseline="episode")
 
-            # add episode outputs to the batch
-            batch_rewards.append(ep_rewards)
-            batch_states.append(ep_states)
-            batch_actions.append(ep_actions)
-
-        # get qvals
-        batch_qvals = []
-        for reward in batch_rewards:
-            batch_qvals.append(self.calc_qvals(reward))
-
-        # flatten the batched outputs
-        batch_actions, batch_qvals, batch_rewards, batch_states = self.flatten_batch(batch_actions, batch_qvals,
-                                                                                     batch_rewards, batch_states)
-
-        return batch_qvals, batch_states, batch_actions, batch_rewards
-
-    @staticmethod
-    def flatten_batch(batch_actions: List[List[Tensor]], batch_qvals: List[List[Tensor]],
-                      batch_rewards: List[List[Tensor]], batch_states: List[List[Tuple[Tensor, Tensor]]]) \
-            -> Tuple[Tensor, Tensor, Tensor, Tensor]:
-        """
-        Takes in the outputs of the processed batch and flattens the several episodes into a single tensor for each
-        batched output
-
-        Args:
-            batch_actions: actions taken in each batch episodes
-            batch_qvals: Q vals for each batch episode
-            batch_rewards: reward for each batch episode
-            batch_states: states for each batch episodes
-
-        Returns:
-            The input batched results flattend into a single tensor
-        """
-        # flatten all episode steps into a single list
-        batch_qvals = list(chain.from_iterable(batch_qvals))
-        batch_states = list(chain.from_iterable(batch_states))
-        batch_actions = list(chain.from_iterable(batch_actions))
-        batch_rewards = list(chain.from_iterable(batch_rewards))
-
-        # stack steps into single tensor and remove extra dimension
-        batch_qvals = torch.stack(batch_qvals).squeeze()
-        batch_states = torch.stack(batch_states).squeeze()
-        batch_actions = torch.stack(batch_actions).squeeze()
-        batch_rewards = torch.stack(batch_rewards).squeeze()
-
-        return batch_actions, batch_qvals, batch_rewards, batch_states
+        return batch_qvals, rollout.states, rollout.actions, rollout.rewards
 
     def loss(self, batch_qvals: List[Tensor], batch_states: List[Tensor], batch_actions: List[Tensor]) -> torch.Tensor:
         """
@@ -228,13 +152,13 @@ class VPGLightning(pl.LightningModule):
         policy_loss = -log_prob_actions.mean()
         return log_prob, policy_loss
 
-    def training_step(self, batch: Tuple[torch.Tensor, torch.Tensor], _) -> OrderedDict:
+    def training_step(self, batch: Rollout, _) -> OrderedDict:
         """
         Carries out a single step through the environment to update the replay buffer.
         Then calculates loss based on the minibatch recieved
 
         Args:
-            batch: current mini batch of replay data
+            batch: rollout of the batched episodes
             _: batch number, not used
 
         Returns:
@@ -242,10 +166,10 @@ class VPGLightning(pl.LightningModule):
         """
         device = self.get_device(batch)
 
-        batch_qvals, batch_states, batch_actions, batch_rewards = self.process_batch(batch)
+        batch_qvals, batch_states, batch_actions, batch_rewards = self.process_rollout(batch)
 
         # get avg reward over the batched episodes
-        self.episode_reward = sum(batch_rewards) / len(batch)
+        self.episode_reward = batch_rewards.sum().item() / (len(batch.offsets) - 1)
         self.reward_list.append(self.episode_reward)
         self.avg_reward = sum(self.reward_list) / len(self.reward_list)
 
@@ -271,6 +195,16 @@ class VPGLightning(pl.LightningModule):
 
         return OrderedDict({'loss': loss, 'reward': self.avg_reward, 'log': log, 'progress_bar': status})
 
+    def export_policy(self, path: str) -> None:
+        """
+        Exports the network with a categorical head as a TorchScript policy, see export.load_policy
+
+        Args:
+            path: file the policy is saved to
+        """
+        example_states = torch.as_tensor(self.env.observation_space.sample())[None]
+        export_policy(deepcopy(self.net).cpu(), example_states, path, head="categorical")
+
     def configure_optimizers(self) -> List[Optimizer]:
         """ Initialize Adam optimizer"""
         optimizer = optim.Adam(self.net.parameters(), lr=self.hparams.lr)
@@ -278,8 +212,8 @@ class VPGLightning(pl.LightningModule):
 
     def _dataloader(self) -> DataLoader:
         """Initialize the Replay Buffer dataset used for retrieving experiences"""
-        dataset = EpisodicExperienceStream(self.env, self.agent, self.device, episodes=self.hparams.batch_episodes)
-        dataloader = DataLoader(dataset=dataset)
+        dataset = EpisodicRolloutStream(self.env, self.agent, self.device, episodes=self.hparams.batch_episodes)
+        dataloader = DataLoader(dataset=dataset, batch_size=None)
         return dataloader
 
     def train_dataloader(self) -> DataLoader:
@@ -288,7 +222,7 @@ class VPGLightning(pl.LightningModule):
 
     def get_device(self, batch) -> str:
         """Retrieve device currently being used by minibatch"""
-        return batch[0][0][0].device.index if self.on_gpu else 'cpu'
+        return batch.states.device.index if self.on_gpu else 'cpu'
 
     @staticmethod
     def add_model_specific_args(arg_parser) -> argparse.ArgumentParser:
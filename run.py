@@ -63,6 +63,9 @@ def main(hparams) -> None:
     trainer.fit(model)
     trainer.test()
 
+    if hparams.export_path:
+        model.export_policy(hparams.export_path)
+
 
 if __name__ == '__main__':
     parent_parser = argparse.ArgumentParser(add_help=False)
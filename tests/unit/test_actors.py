@@ -0,0 +1,176 @@
+from functools import partial
+from unittest import TestCase
+
+import gym
+import numpy as np
+import torch
+from torch import nn
+
+from algos.common.actors import ActorPool, actor_epsilons, td_priorities
+from algos.common.agents import ValueAgent
+from algos.common.inference import InferenceServer
+from algos.common.memory import Experience
+from algos.common.networks import NoisyLinear
+
+
+class TinyNet(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.linear = nn.Linear(4, 2)
+
+    def forward(self, x):
+        return self.linear(x.float())
+
+
+class AlternatingNet(nn.Module):
+    """Prefers the other action after every noise reset"""
+    def __init__(self):
+        super().__init__()
+        self.register_buffer("noise", torch.zeros(1))
+
+    def reset_noise(self):
+        self.noise.fill_(1.0 - float(self.noise))
+
+    def forward(self, x):
+        return torch.cat([1.0 - self.noise, self.noise]).expand(x.view(-1, 4).shape[0], 2)
+
+
+class NoisyBiasNet(nn.Module):
+    """Noisy layer whose action only depends on the noise of its bias"""
+    def __init__(self):
+        super().__init__()
+        self.noisy = NoisyLinear(4, 2, sigma_init=1.0, auto_reset_noise=False)
+        with torch.no_grad():
+            self.noisy.bias.zero_()
+
+    def reset_noise(self):
+        self.noisy.reset_noise()
+
+    def forward(self, x):
+        return self.noisy(x.float().view(-1, 4) * 0.0)
+
+
+class TestActorEpsilons(TestCase):
+
+    def test_single_actor(self):
+        self.assertEqual(actor_epsilons(1, base=0.4), [0.4])
+
+    def test_spread(self):
+        epsilons = actor_epsilons(8, base=0.4, alpha=7.0)
+
+        self.assertEqual(len(epsilons), 8)
+        self.assertAlmostEqual(epsilons[0], 0.4)
+        self.assertAlmostEqual(epsilons[-1], 0.4 ** 8)
+        self.assertTrue(all(a > b for a, b in zip(epsilons, epsilons[1:])))
+
+
+class TestActorPool(TestCase):
+
+    def setUp(self) -> None:
+        self.net = TinyNet()
+        self.pool = ActorPool(partial(gym.make, "CartPole-v0"), self.net, [1.0, 0.5], chunk_size=8)
+
+    def tearDown(self) -> None:
+        self.pool.close()
+
+    def test_collect(self):
+        """Test that the actors send numpy experiences and the episodes they finished"""
+        experiences, finished = [], []
+        while len(experiences) < 64 or not finished:
+            chunk, priorities, chunk_finished = self.pool.collect(block=True)
+            self.assertIsNone(priorities)
+            experiences.extend(chunk)
+            finished.extend(chunk_finished)
+
+        self.assertIsInstance(experiences[0], Experience)
+        self.assertIsInstance(experiences[0].state, np.ndarray)
+        self.assertEqual(experiences[0].state.shape, (4,))
+        for total_reward, steps in finished:
+            self.assertEqual(total_reward, steps)
+
+    def test_sync(self):
+        """Test that publishing copies the learner weights into the shared network"""
+        with torch.no_grad():
+            self.net.linear.weight.fill_(2.0)
+
+        self.pool.sync(self.net)
+
+        self.assertEqual(self.pool.shared.version.value, 1)
+        self.assertTrue(torch.equal(self.pool.shared.net.linear.weight, self.net.linear.weight))
+
+    def test_close(self):
+        self.pool.close()
+        self.assertEqual(len(self.pool), 0)
+
+
+class TestActorPoolNoise(TestCase):
+
+    def test_noise_reset_every_step(self):
+        """Test that a greedy actor with a noisy network gets new noise, and so another action, on every step"""
+        pool = ActorPool(partial(gym.make, "CartPole-v0"), AlternatingNet(), [0.0], chunk_size=8)
+
+        experiences, _, _ = pool.collect(block=True, timeout=10.0)
+        pool.close()
+
+        actions = [exp.action for exp in experiences]
+        self.assertTrue(all(action != next_action for action, next_action in zip(actions, actions[1:])))
+
+
+    def test_noisy_layers(self):
+        """Test that greedy actors with a real noisy network explore, with and without quantisation"""
+        for quantize in (False, True):
+            pool = ActorPool(partial(gym.make, "CartPole-v0"), NoisyBiasNet(), [0.0], chunk_size=32,
+                             quantize=quantize)
+            experiences, _, _ = pool.collect(block=True, timeout=10.0)
+            pool.close()
+
+            self.assertEqual({exp.action for exp in experiences}, {0, 1})
+
+
+class TestTDPriorities(TestCase):
+
+    def test_priorities(self):
+        """Test that the priority is the squared TD error of each experience"""
+        net = TinyNet()
+        with torch.no_grad():
+            net.linear.weight.zero_()
+            net.linear.bias.copy_(torch.tensor([1.0, 2.0]))
+
+        experiences = [Experience(np.zeros(4), 0, 1.0, False, np.zeros(4)),
+                       Experience(np.zeros(4), 1, 0.5, True, np.zeros(4))]
+
+        priorities = td_priorities(net, net, experiences, gamma=0.5)
+
+        # q(s, 0) = 1, target = 1 + 0.5 * 2 = 2 and q(s, 1) = 2, target = 0.5 as the episode is done
+        self.assertTrue(np.allclose(priorities, [1.0 + 1e-5, 2.25 + 1e-5]))
+
+
+class TestActorPoolPriorities(TestCase):
+
+    def test_collect(self):
+        """Test that actors sharing a target network send a priority with every experience"""
+        net = TinyNet()
+        pool = ActorPool(partial(gym.make, "CartPole-v0"), net, [1.0], target_net=TinyNet(), chunk_size=8)
+
+        experiences, priorities, _ = pool.collect(block=True, timeout=10.0)
+        pool.close()
+
+        self.assertEqual(len(priorities), len(experiences))
+        self.assertTrue(np.all(priorities > 0))
+
+
+class TestActorPoolInferenceServer(TestCase):
+
+    def test_collect(self):
+        """Test that actors acting through an inference server still send their experiences"""
+        net = TinyNet()
+        server = InferenceServer(ValueAgent(TinyNet(), 2), max_batch_size=2)
+        pool = ActorPool(partial(gym.make, "CartPole-v0"), net, [1.0, 0.0], chunk_size=8, server=server)
+
+        experiences, _, _ = pool.collect(block=True, timeout=10.0)
+        pool.sync(net)
+        pool.close()
+
+        self.assertGreater(len(experiences), 0)
+        self.assertGreater(server.num_requests, 0)
+        self.assertIsNone(pool.server)
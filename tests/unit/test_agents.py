@@ -3,6 +3,7 @@ from unittest import TestCase
 from unittest.mock import Mock
 
 import gym
+import numpy as np
 import torch
 
 from algos.common.agents import Agent, PolicyAgent, ValueAgent
@@ -40,6 +41,49 @@ class TestValueAgent(TestCase):
         self.assertIsInstance(action, int)
         self.assertEqual(action, 1)
 
+    def test_value_agent_ACT_BATCH(self):
+        """Test that a batch of states gets one greedy action each when epsilon is 0"""
+        self.net.return_value = torch.Tensor([[0.0, 100.0], [100.0, 0.0], [0.0, 100.0]])
+        self.value_agent.epsilon = 0.0
+        states = torch.stack([self.state] * 3)
+
+        actions = self.value_agent.act_batch(states, self.device)
+
+        self.assertEqual(list(actions), [1, 0, 1])
+
+    def test_value_agent_ACT_BATCH_RANDOM(self):
+        """Test that every action is random when epsilon is 1"""
+        self.net.return_value = torch.zeros(64, 2)
+        self.value_agent.epsilon = 1.0
+
+        actions = self.value_agent.act_batch(torch.stack([self.state] * 64), self.device)
+
+        self.assertEqual(actions.shape, (64,))
+        self.assertTrue(np.any(actions == 1))
+
+    def test_value_agent_ACT_BATCH_EPSILONS(self):
+        """Test that each row uses its own epsilon and the network only sees the greedy rows"""
+        self.net.return_value = torch.Tensor([[0.0, 100.0]] * 32)
+        states = torch.stack([self.state] * 64)
+        epsilons = np.array([0.0, 1.0] * 32)
+
+        actions = self.value_agent.act_batch(states, self.device, epsilon=epsilons)
+
+        self.assertEqual(self.net.call_args[0][0].shape, (32, 4))
+        self.assertTrue(np.all(actions[::2] == 1))
+        self.assertEqual(actions.dtype, np.int64)
+
+    def test_value_agent_GET_ACTION_NO_GRAD(self):
+        """Test that acting does not build an autograd graph"""
+        net = torch.nn.Linear(4, 2)
+        agent = ValueAgent(net, 2)
+        state = self.state.float()
+        states = torch.stack([state] * 3)
+
+        with torch.enable_grad():
+            self.assertIsInstance(agent.get_action(state, self.device), int)
+            self.assertEqual(agent.greedy_actions(states).shape, (3,))
+
     def test_value_agent_RANDOM(self):
         action = self.value_agent.get_random_action()
         self.assertIsInstance(action, int)
@@ -59,3 +103,23 @@ class TestPolicyAgent(TestCase):
         self.assertIsInstance(action, int)
         self.assertEqual(action, 1)
 
+    def test_policy_agent_SAMPLE_ACTIONS(self):
+        """Test that a whole batch is sampled at once with the log probability of each action"""
+        self.net.return_value = torch.Tensor([[0.0, 100.0], [100.0, 0.0], [0.0, 100.0]])
+        policy_agent = PolicyAgent(self.net)
+
+        actions, log_probs = policy_agent.sample_actions(torch.stack([self.state] * 3), self.device,
+                                                         return_log_probs=True)
+
+        self.assertEqual(actions.tolist(), [1, 0, 1])
+        self.assertTrue(torch.allclose(log_probs, torch.zeros(3)))
+
+    def test_policy_agent_ACT_BATCH(self):
+        """Test that sampled actions follow the probabilities of the policy"""
+        self.net.return_value = torch.log(torch.Tensor([[0.25, 0.75]] * 4000))
+        policy_agent = PolicyAgent(self.net)
+
+        actions = policy_agent.act_batch(torch.stack([self.state] * 4000), self.device)
+
+        self.assertIsInstance(actions, np.ndarray)
+        self.assertAlmostEqual(actions.mean(), 0.75, delta=0.05)
@@ -0,0 +1,221 @@
+from functools import partial
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import gym
+import torch
+from torch import nn
+
+from algos.common.experience import ExperienceSource, VectorExperienceSource
+from algos.common.memory import RingReplayBuffer, SumTreePERBuffer
+from algos.common.vec_env import SyncVectorEnv
+from algos.dqn.model import DQNLightning
+from algos.n_step_dqn.model import NStepDQNLightning
+from algos.per_dqn.model import PERDQNLightning
+
+
+class TestFusedOnlineValues(TestCase):
+
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.model = SimpleNamespace(net=nn.Linear(4, 2), target_net=nn.Linear(4, 2), double_targets=True)
+        self.states = torch.rand(8, 4)
+        self.next_states = torch.rand(8, 4)
+
+    def test_single_forward(self):
+        """Test that the fused forward matches two separate forward passes"""
+        state_values, next_values = DQNLightning.online_values(self.model, self.states, self.next_states)
+
+        self.assertTrue(torch.allclose(state_values, self.model.net(self.states)))
+        self.assertTrue(torch.allclose(next_values, self.model.net(self.next_states)))
+
+    def test_gradient_only_through_states(self):
+        state_values, next_values = DQNLightning.online_values(self.model, self.states, self.next_states)
+
+        self.assertTrue(state_values.requires_grad)
+        self.assertFalse(next_values.requires_grad)
+
+        state_values.sum().backward()
+        expected = torch.zeros_like(self.model.net.weight)
+        expected[:] = self.states.sum(0)
+        self.assertTrue(torch.allclose(self.model.net.weight.grad, expected))
+
+    def test_without_double_targets(self):
+        self.model.double_targets = False
+        state_values, next_values = DQNLightning.online_values(self.model, self.states, self.next_states)
+
+        self.assertEqual(state_values.shape, (8, 2))
+        self.assertIsNone(next_values)
+
+    def test_next_state_values(self):
+        """Test that double targets value the action picked by the train network"""
+        target_values = self.model.target_net(self.next_states)
+        next_online_values = torch.zeros(8, 2)
+        next_online_values[:, 1] = 1.0
+
+        values = DQNLightning.next_state_values(self.model, self.next_states, next_online_values)
+        self.assertTrue(torch.allclose(values, target_values[:, 1]))
+        self.assertFalse(values.requires_grad)
+
+        values = DQNLightning.next_state_values(self.model, self.next_states)
+        self.assertTrue(torch.allclose(values, target_values.max(1)[0]))
+
+
+class TestLossTarget(TestCase):
+
+    def setUp(self) -> None:
+        net = nn.Linear(4, 2)
+        with torch.no_grad():
+            net.weight.zero_()
+            net.bias.copy_(torch.tensor([1.0, 2.0]))
+        self.model = SimpleNamespace(net=net, target_net=net, double_targets=False,
+                                     hparams=SimpleNamespace(gamma=0.5, n_steps=3))
+        self.model.online_values = partial(DQNLightning.online_values, self.model)
+        self.model.next_state_values = partial(DQNLightning.next_state_values, self.model)
+        self.batch = (torch.zeros(1, 4), torch.tensor([0]), torch.tensor([1.0]), torch.tensor([False]),
+                      torch.zeros(1, 4))
+
+    def test_one_step_target(self):
+        """Test that q(s, 0) = 1 is regressed towards 1 + gamma * 2"""
+        self.model.bootstrap_gamma = DQNLightning.bootstrap_gamma.fget(self.model)
+        loss = DQNLightning.loss(self.model, self.batch)
+        self.assertAlmostEqual(loss.item(), (0.5 * 2.0) ** 2)
+
+    def test_n_step_target(self):
+        """Test that the value of a next state n steps ahead is discounted by gamma ** n"""
+        self.model.bootstrap_gamma = NStepDQNLightning.bootstrap_gamma.fget(self.model)
+        loss = DQNLightning.loss(self.model, self.batch)
+        self.assertAlmostEqual(loss.item(), (0.5 ** 3 * 2.0) ** 2)
+
+
+class TestReplayRatio(TestCase):
+
+    def setUp(self) -> None:
+        self.model = SimpleNamespace(actors=None, global_step=0, play_step=Mock(return_value=[(1.0, 10)]),
+                                     hparams=SimpleNamespace(env_steps_per_update=3, updates_per_env_step=2))
+
+    def test_env_steps_per_update(self):
+        finished = DQNLightning.collect_step(self.model)
+
+        self.assertEqual(self.model.play_step.call_count, 3)
+        self.assertEqual(finished, [(1.0, 10)] * 3)
+
+    def test_updates_per_env_step(self):
+        """Test that the env is only played on the first update of each collection phase"""
+        for step in range(6):
+            self.model.global_step = step
+            DQNLightning.collect_step(self.model)
+
+        self.assertEqual(self.model.play_step.call_count, 9)
+
+    def test_actors(self):
+        self.model.actors = Mock()
+        self.model.global_step = 1
+        DQNLightning.collect_step(self.model)
+
+        self.model.play_step.assert_called_once()
+
+
+class TestBuildBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.model = SimpleNamespace(env=gym.make("CartPole-v0"), experience_steps=1,
+                                     hparams=SimpleNamespace(buffer_type="frame", replay_size=100, buffer_dir=None,
+                                                             num_envs=1, num_actors=0, n_steps=3, lazy_n_step=False))
+
+    def test_frame_buffer_interleaved_envs(self):
+        """Test that a frame buffer is rejected when the steps of several envs or actors are interleaved"""
+        self.model.hparams.num_envs = 2
+        with self.assertRaises(ValueError):
+            DQNLightning.build_buffer(self.model)
+
+        self.model.hparams.num_envs = 1
+        self.model.hparams.num_actors = 2
+        with self.assertRaises(ValueError):
+            DQNLightning.build_buffer(self.model)
+
+    def test_frame_buffer_n_steps(self):
+        self.model.experience_steps = NStepDQNLightning.experience_steps.fget(self.model)
+        with self.assertRaises(ValueError):
+            DQNLightning.build_buffer(self.model)
+
+        self.model.hparams.lazy_n_step = True
+        self.assertEqual(NStepDQNLightning.experience_steps.fget(self.model), 1)
+
+    def test_ring_buffer_interleaved_envs(self):
+        self.model.hparams.buffer_type = "ring"
+        self.model.hparams.num_envs = 2
+
+        self.assertIsInstance(DQNLightning.build_buffer(self.model), RingReplayBuffer)
+
+    def test_per_unsupported_buffer_types(self):
+        """Test that the prioritized buffers reject the storages they cannot be kept in"""
+        self.model.hparams.batch_size = 4
+        self.model.hparams.per_buffer = "tree"
+        for buffer_type in ["ring", "frame", "memmap_frame", "shared", "shared_frame"]:
+            self.model.hparams.buffer_type = buffer_type
+            with self.assertRaises(ValueError):
+                PERDQNLightning.build_buffer(self.model)
+
+        self.model.hparams.buffer_type = "deque"
+        self.assertIsInstance(PERDQNLightning.build_buffer(self.model), SumTreePERBuffer)
+
+        self.model.hparams.per_buffer = "list"
+        self.model.hparams.buffer_type = "memmap"
+        with self.assertRaises(ValueError):
+            PERDQNLightning.build_buffer(self.model)
+
+
+class TestEvaluation(TestCase):
+
+    def setUp(self) -> None:
+        agent = Mock(epsilon=1.0, return_value=0, act_batch=Mock(side_effect=lambda states, *_, **__: [0] * 2))
+        source = VectorExperienceSource(SyncVectorEnv([gym.make("CartPole-v0") for _ in range(2)]), agent, "cpu")
+        self.model = SimpleNamespace(source=source, test_source=None, agent=agent,
+                                     hparams=SimpleNamespace(env="CartPole-v0", uint8_obs=False, eps_end=0.1))
+        self.model.build_test_source = partial(DQNLightning.build_test_source, self.model)
+
+    @patch("algos.dqn.model.wrappers.make_env", side_effect=lambda *_, **__: gym.make("CartPole-v0"))
+    def test_vector_source(self, make_env):
+        """Test that a vector source is evaluated on a fresh env at eps_end without stepping its envs"""
+        self.model.source.step()
+        states = self.model.source.states.copy()
+
+        for _ in range(2):
+            result = DQNLightning.test_step(self.model)
+            self.assertGreater(result['test_reward'], 0)
+
+        make_env.assert_called_once()
+        self.assertIsInstance(self.model.test_source, ExperienceSource)
+        self.assertEqual(self.model.agent.epsilon, 0.1)
+        self.assertTrue((self.model.source.states == states).all())
+
+
+class TestTrainEnd(TestCase):
+
+    def test_closes_vector_env(self):
+        source = Mock(spec=VectorExperienceSource, env=Mock())
+        model = SimpleNamespace(actors=Mock(), prefetcher=None, source=source)
+        actors = model.actors
+
+        DQNLightning.on_train_end(model)
+
+        actors.close.assert_called_once()
+        source.env.close.assert_called_once()
+        self.assertIsNone(model.actors)
+
+
+class TestDataloader(TestCase):
+
+    def test_buffer_built_once(self):
+        """Test that the train and test loaders share the buffer built and populated by the first one"""
+        model = SimpleNamespace(buffer=None, build_buffer=Mock(return_value=Mock()), populate=Mock(),
+                                build_batch_stream=Mock(return_value=[]),
+                                hparams=SimpleNamespace(warm_start_size=10, num_workers=0))
+
+        DQNLightning._dataloader(model)
+        DQNLightning._dataloader(model, train=False)
+
+        model.build_buffer.assert_called_once()
+        model.populate.assert_called_once_with(10)
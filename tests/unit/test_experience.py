@@ -7,8 +7,10 @@ import torch
 from torch.utils.data import DataLoader
 
 from algos.common.agents import Agent
-from algos.common.experience import EpisodicExperienceStream, RLDataset, ExperienceSource, NStepExperienceSource
-from algos.common.memory import Experience
+from algos.common.experience import EpisodicExperienceStream, RLDataset, ExperienceSource, NStepExperienceSource, \
+    VectorExperienceSource, ReplayBatchStream, NStepAccumulator, EpisodicRolloutStream
+from algos.common.memory import Experience, ReplayBuffer, PERBuffer, Rollout
+from algos.common.vec_env import SyncVectorEnv
 from algos.common.wrappers import ToTensor
 
 
@@ -119,6 +121,17 @@ class TestNStepExperienceSource(TestCase):
         self.assertEqual(next_state.all(), self.next_state_02.all())
         self.assertEqual(self.experience03.done, done)
 
+    def test_source_gamma(self):
+        """Test that the rewards are discounted with the gamma of the source"""
+        self.source = NStepExperienceSource(self.env, self.agent, Mock(), n_steps=2, gamma=0.5)
+
+        self.source.n_step_buffer.append(self.experience02)
+        self.source.n_step_buffer.append(self.experience03)
+
+        reward, _, _ = self.source.get_transition_info()
+
+        self.assertEqual(reward, 1.5)
+
     def test_multi_step_discount(self):
         self.source = NStepExperienceSource(self.env, self.agent, Mock(), n_steps=3)
         self.source.env.step = Mock(return_value=(self.next_state_02, self.reward_02, self.done_02, Mock()))
@@ -137,6 +150,152 @@ class TestNStepExperienceSource(TestCase):
         self.assertEqual(exp[4].all(), self.experience02.new_state.all())
 
 
+class TestVectorExperienceSource(TestCase):
+
+    def setUp(self) -> None:
+        self.num_envs = 4
+        self.agent = Agent(net=Mock())
+        self.env = SyncVectorEnv([gym.make("CartPole-v0") for _ in range(self.num_envs)])
+
+    def test_step(self):
+        """Test that each step returns an experience for every env"""
+        source = VectorExperienceSource(self.env, self.agent, Mock())
+
+        experiences, rewards, dones = source.step()
+
+        self.assertEqual(len(experiences), self.num_envs)
+        self.assertEqual(len(rewards), self.num_envs)
+        self.assertEqual(len(dones), self.num_envs)
+        self.assertIsInstance(experiences[0], Experience)
+        self.assertTrue(np.array_equal(experiences[0].new_state, source.states[0]))
+
+    def test_episode_rewards(self):
+        """Test that the rewards of every finished episode are tracked for each env"""
+        source = VectorExperienceSource(self.env, self.agent, Mock())
+
+        total_steps = 0
+        for _ in range(60):
+            experiences, _, _ = source.step()
+            total_steps += len(experiences)
+
+        finished = source.pop_rewards_steps()
+
+        self.assertGreaterEqual(len(finished), self.num_envs)
+        for total_reward, steps in finished:
+            self.assertEqual(total_reward, steps)
+        self.assertEqual(sum(steps for _, steps in finished) + source.episode_steps.sum(), total_steps)
+        self.assertEqual(source.pop_rewards_steps(), [])
+
+    def test_n_step(self):
+        """Test that n step experiences are only emitted once each env has taken n steps"""
+        source = VectorExperienceSource(self.env, self.agent, Mock(), n_steps=3)
+
+        experiences, _, _ = source.step()
+        self.assertEqual(len(experiences), 0)
+        source.step()
+        experiences, _, _ = source.step()
+
+        self.assertEqual(len(experiences), self.num_envs)
+        self.assertAlmostEqual(experiences[0].reward, 1 + 0.9 + 0.81, places=5)
+
+    def test_epsilons(self):
+        """Test that the fixed epsilon of each env is passed to the agent"""
+        agent = Mock(return_value=0)
+        agent.act_batch = Mock(return_value=np.zeros(self.num_envs, dtype=np.int64))
+        epsilons = [0.4, 0.1, 0.01, 0.001]
+        source = VectorExperienceSource(self.env, agent, Mock(), epsilons=epsilons)
+
+        source.step()
+
+        self.assertTrue(np.array_equal(agent.act_batch.call_args[1]["epsilon"], epsilons))
+
+    def test_run_episode(self):
+        source = VectorExperienceSource(self.env, self.agent, Mock())
+        total_reward = source.run_episode()
+        self.assertIsInstance(total_reward, float)
+
+
+class TestEpisodicRolloutStream(TestCase):
+
+    def setUp(self) -> None:
+        self.env = ToTensor(gym.make("CartPole-v0"))
+        self.agent = Mock(return_value=0)
+        self.stream = EpisodicRolloutStream(self.env, self.agent, Mock(), episodes=3, capacity=8)
+
+    def test_rollout(self):
+        """Test that whole episodes are given as flat tensors without being collated"""
+        rollout = next(iter(DataLoader(self.stream, batch_size=None)))
+
+        self.assertIsInstance(rollout, Rollout)
+        self.assertEqual(len(rollout.offsets), 4)
+        steps = int(rollout.offsets[-1])
+        self.assertEqual(rollout.states.shape, (steps, 4))
+        self.assertEqual(rollout.actions.shape, (steps,))
+        self.assertEqual(rollout.rewards.sum().item(), steps)
+        self.assertTrue(torch.equal(torch.nonzero(rollout.dones).squeeze(1) + 1, rollout.offsets[1:]))
+
+    def test_buffers_used_in_turn(self):
+        """Test that the next rollout does not overwrite the current one"""
+        first = next(iter(self.stream))
+        first_states = first.states.clone()
+        next(iter(self.stream))
+
+        self.assertTrue(torch.equal(first.states, first_states))
+
+
+class TestNStepAccumulator(TestCase):
+
+    def test_matches_reference(self):
+        """Test that the emitted experiences match a discounted sum computed step by step for each env"""
+        num_envs, n_steps, gamma = 3, 4, 0.9
+        rng = np.random.RandomState(0)
+        accumulator = NStepAccumulator(num_envs, n_steps, gamma)
+        history = [[] for _ in range(num_envs)]
+        emitted = []
+
+        for step in range(50):
+            states = np.stack([np.full(2, step * num_envs + idx) for idx in range(num_envs)])
+            rewards = rng.rand(num_envs).astype(np.float32)
+            dones = rng.rand(num_envs) < 0.15
+            for idx in range(num_envs):
+                history[idx].append((states[idx], rewards[idx], dones[idx]))
+            emitted.extend(zip(*accumulator.add(states, np.arange(num_envs), rewards, dones, states + 1)))
+
+        expected = {}
+        for idx in range(num_envs):
+            for start, (state, _, _) in enumerate(history[idx]):
+                reward, steps = 0.0, history[idx][start:start + n_steps]
+                for k, (_, step_reward, step_done) in enumerate(steps):
+                    reward += gamma ** k * step_reward
+                    if step_done:
+                        break
+                if len(steps) == n_steps or step_done:
+                    expected[int(state[0])] = (reward, bool(step_done), int(steps[k][0][0]) + 1)
+
+        self.assertEqual(len(emitted), len(expected))
+        for state, action, reward, done, next_state in emitted:
+            exp_reward, exp_done, exp_next = expected[int(state[0])]
+            self.assertEqual(action, int(state[0]) % num_envs)
+            self.assertAlmostEqual(reward, exp_reward, places=5)
+            self.assertEqual(done, exp_done)
+            self.assertEqual(next_state[0], exp_next)
+
+    def test_flush_on_done(self):
+        """Test that every pending step of an env is emitted when its episode ends"""
+        accumulator = NStepAccumulator(2, 10, gamma=1.0)
+        for _ in range(3):
+            states, *_ = accumulator.add(np.zeros((2, 1)), np.zeros(2), np.ones(2), np.zeros(2), np.ones((2, 1)))
+            self.assertEqual(len(states), 0)
+
+        _, _, rewards, dones, _ = accumulator.add(np.zeros((2, 1)), np.zeros(2), np.ones(2), np.array([True, False]),
+                                                  np.ones((2, 1)))
+
+        self.assertTrue(np.array_equal(np.sort(rewards), [1, 2, 3, 4]))
+        self.assertTrue(np.all(dones))
+        self.assertFalse(accumulator.pending[0].any())
+        self.assertEqual(accumulator.pending[1].sum(), 4)
+
+
 class TestRLDataset(TestCase):
 
     def setUp(self) -> None:
@@ -164,4 +323,55 @@ class TestRLDataset(TestCase):
             self.assertEqual(sample_batched[4].shape, torch.Size([32, 4, 84, 84]))
 
 
+class TestReplayBatchStream(TestCase):
 
+    def setUp(self) -> None:
+        self.buffer = ReplayBuffer(100)
+        for idx in range(100):
+            self.buffer.append(Experience(np.full(4, idx), idx % 2, 1.0, False, np.full(4, idx + 1)))
+
+    def test_collated_batches(self):
+        """Test that the loader gives the batches of the buffer sample without collating them again"""
+        stream = ReplayBatchStream(self.buffer, batch_size=8, batches_per_sample=3, num_batches=7)
+        batches = list(DataLoader(stream, batch_size=None))
+
+        self.assertEqual(len(batches), 7)
+        states, actions, rewards, dones, next_states = batches[0]
+        self.assertEqual(states.shape, (8, 4))
+        self.assertEqual(actions.shape, (8,))
+        self.assertEqual(rewards.dtype, torch.float32)
+        self.assertEqual(dones.dtype, torch.bool)
+        self.assertTrue(torch.equal(next_states, states + 1))
+
+    def test_epoch_shared_by_workers(self):
+        """Test that each iteration gives num_batches batches in total, however many workers sample the stream"""
+        stream = ReplayBatchStream(self.buffer, batch_size=8, batches_per_sample=2, num_batches=7)
+        loader = DataLoader(stream, batch_size=None, num_workers=2)
+
+        for _ in range(2):
+            self.assertEqual(len(list(loader)), 7)
+
+    def test_single_sample_call(self):
+        self.buffer.sample = Mock(wraps=self.buffer.sample)
+        stream = iter(ReplayBatchStream(self.buffer, batch_size=8, batches_per_sample=3))
+
+        for _ in range(3):
+            next(stream)
+        self.buffer.sample.assert_called_once_with(24)
+
+    def test_endless(self):
+        stream = iter(ReplayBatchStream(self.buffer, batch_size=8))
+        for _ in range(50):
+            next(stream)
+
+    def test_prioritized_layout(self):
+        buffer = PERBuffer(100)
+        for exp in self.buffer.buffer:
+            buffer.append(exp)
+
+        samples, indices, weights = next(iter(ReplayBatchStream(buffer, batch_size=8)))
+
+        self.assertEqual(len(samples), 5)
+        self.assertEqual(samples[0].shape, (8, 4))
+        self.assertEqual(indices.shape, (8,))
+        self.assertEqual(weights.shape, (8,))
@@ -0,0 +1,72 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import gym
+import numpy as np
+import torch
+
+from algos.common.experience import ExperienceSource
+from algos.common.export import export_policy, load_policy, ScriptedAgent
+from algos.common.networks import CNN, MLP
+
+
+class TestExportPolicy(TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "policy.pt")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_greedy(self):
+        """Test that the exported greedy policy picks the same actions as the network"""
+        net = CNN((4, 84, 84), 6)
+        states = torch.rand(3, 4, 84, 84)
+
+        export_policy(net, states[:1], self.path, n_actions=6)
+        policy = load_policy(self.path)
+
+        expected = net(states).argmax(dim=1)
+        self.assertTrue(torch.equal(policy(states, torch.tensor(0.0)), expected))
+
+    def test_greedy_epsilon(self):
+        """Test that epsilon 1 gives random actions"""
+        net = MLP((4,), 2)
+        export_policy(net, torch.rand(1, 4), self.path, n_actions=2)
+        policy = load_policy(self.path)
+
+        actions = policy(torch.zeros(200, 4), torch.tensor(1.0))
+
+        self.assertEqual(set(actions.tolist()), {0, 1})
+
+    def test_categorical(self):
+        net = MLP((4,), 2)
+        export_policy(net, torch.rand(1, 4), self.path, head="categorical")
+        policy = load_policy(self.path)
+
+        actions = policy(torch.rand(5, 4))
+
+        self.assertEqual(actions.shape, (5,))
+
+    def test_unknown_head(self):
+        with self.assertRaises(ValueError):
+            export_policy(MLP((4,), 2), torch.rand(1, 4), self.path, head="unknown")
+
+
+class TestScriptedAgent(TestCase):
+
+    def test_experience_source(self):
+        """Test that an exported policy can be run by the experience sources without the training code"""
+        env = gym.make("CartPole-v0")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "policy.pt")
+            export_policy(MLP((4,), 2), torch.as_tensor(env.reset())[None], path, n_actions=2)
+            agent = ScriptedAgent(load_policy(path), epsilon=0.0)
+
+        source = ExperienceSource(env, agent, torch.device("cpu"))
+        total_reward = source.run_episode()
+
+        self.assertGreater(total_reward, 0)
+        self.assertIsInstance(agent.act_batch(np.zeros((3, 4))), np.ndarray)
@@ -0,0 +1,103 @@
+import multiprocessing as mp
+import threading
+from unittest import TestCase
+
+import numpy as np
+import torch
+from torch import nn
+
+from algos.common.agents import ValueAgent
+from algos.common.inference import InferenceServer, RemoteAgent
+
+
+class TestInferenceServer(TestCase):
+
+    def setUp(self) -> None:
+        self.net = nn.Linear(4, 2)
+        with torch.no_grad():
+            self.net.weight.zero_()
+            self.net.bias.copy_(torch.tensor([0.0, 1.0]))
+        self.agent = ValueAgent(self.net, 2, eps_start=0.0)
+        self.server = InferenceServer(self.agent, max_batch_size=8, max_wait=0.05)
+
+    def tearDown(self) -> None:
+        self.server.close()
+
+    def test_act(self):
+        action = self.server.act(np.zeros(4, dtype=np.float32))
+        self.assertEqual(action, 1)
+
+    def test_noise_reset_every_batch(self):
+        """Test that a noisy network gets new noise before every micro batch"""
+        self.net.reset_noise = lambda: self.net.bias.data.copy_(self.net.bias.data.flip(0))
+
+        actions = [self.server.act(np.zeros(4, dtype=np.float32)) for _ in range(4)]
+
+        self.assertEqual(actions, [0, 1, 0, 1])
+
+    def test_micro_batches(self):
+        """Test that concurrent requests are answered with fewer forward passes than requests"""
+        futures = [self.server.submit(np.zeros(4, dtype=np.float32)) for _ in range(32)]
+        actions = [future.result() for future in futures]
+
+        self.assertEqual(actions, [1] * 32)
+        self.assertEqual(self.server.num_requests, 32)
+        self.assertLessEqual(self.server.num_batches, 8)
+
+    def test_threads(self):
+        """Test that actor threads get an answer for each of their requests"""
+        results = []
+
+        def actor():
+            results.extend(self.server.act(np.zeros(4, dtype=np.float32)) for _ in range(10))
+
+        threads = [threading.Thread(target=actor) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [1] * 40)
+
+    def test_epsilon(self):
+        """Test that each request can use its own epsilon"""
+        actions = [self.server.submit(np.zeros(4, dtype=np.float32), epsilon=1.0) for _ in range(64)]
+        self.assertIn(0, [future.result() for future in actions])
+
+    def test_update_weights(self):
+        """Test that swapped weights are used for the next batch without changing the given network"""
+        new_net = nn.Linear(4, 2)
+        with torch.no_grad():
+            new_net.weight.zero_()
+            new_net.bias.copy_(torch.tensor([1.0, 0.0]))
+
+        self.server.update_weights(new_net.state_dict())
+
+        self.assertEqual(self.server.act(np.zeros(4, dtype=np.float32)), 0)
+        with torch.no_grad():
+            new_net.bias.copy_(torch.tensor([0.0, 1.0]))
+        self.assertEqual(self.server.act(np.zeros(4, dtype=np.float32)), 0)
+
+    def test_remote_agent(self):
+        """Test that an agent on the other end of a pipe gets its actions from the server"""
+        server_conn, agent_conn = mp.Pipe()
+        self.server.connect(server_conn)
+        agent = RemoteAgent(agent_conn)
+
+        self.assertEqual(agent(np.zeros(4, dtype=np.float32)), 1)
+        actions = agent.act_batch(np.zeros((5, 4), dtype=np.float32))
+        self.assertEqual(actions.tolist(), [1] * 5)
+
+        agent_conn.close()
+
+    def test_remote_agent_error(self):
+        """Test that an error of the server is raised by the remote agent instead of blocking it"""
+        server_conn, agent_conn = mp.Pipe()
+        self.server.connect(server_conn)
+        agent = RemoteAgent(agent_conn)
+
+        with self.assertRaises(RuntimeError):
+            agent(np.zeros(3, dtype=np.float32))
+        self.assertEqual(agent(np.zeros(4, dtype=np.float32)), 1)
+
+        agent_conn.close()
@@ -1,12 +1,19 @@
+import pickle
+import tempfile
+from multiprocessing.reduction import ForkingPickler
 from unittest import TestCase
 from unittest.mock import Mock
 
+import gym
 import numpy as np
 import torch
 from torch.utils.data import DataLoader
 
-from algos.common.experience import RLDataset
-from algos.common.memory import ReplayBuffer, Experience, PERBuffer, MultiStepBuffer, Buffer
+from algos.common.experience import RLDataset, ReplayBatchStream
+from algos.common.memory import ReplayBuffer, Experience, PERBuffer, MultiStepBuffer, Buffer, RingReplayBuffer, \
+    SumTree, MinTree, MaxTree, SumTreePERBuffer, FrameStackReplayBuffer, MemmapReplayBuffer, \
+    MemmapFrameStackReplayBuffer, MemmapSumTreePERBuffer, AsyncPriorityUpdater, SharedMemoryReplayBuffer, \
+    SharedMemoryFrameStackReplayBuffer, PrefetchSampler, NStepReplayBuffer, RolloutBuffer
 
 
 class TestBuffer(TestCase):
@@ -116,6 +123,74 @@ class TestReplayBuffer(TestCase):
         self.assertEqual(next_states.shape, (batch_size, 32, 32))
 
 
+class TestRingReplayBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.capacity = 5
+        self.buffer = RingReplayBuffer(self.capacity, obs_shape=(4, 8, 8))
+
+    def make_experience(self, value):
+        state = np.full([4, 8, 8], value, dtype=np.float32)
+        return Experience(state, value, float(value), value % 2 == 0, state + 1)
+
+    def test_from_env(self):
+        """Test that the field arrays are sized from the env spaces"""
+        env = gym.make("CartPole-v0")
+        buffer = RingReplayBuffer.from_env(10, env)
+
+        self.assertEqual(buffer.states.shape, (10, 4))
+        self.assertEqual(buffer.next_states.shape, (10, 4))
+        self.assertEqual(buffer.actions.shape, (10,))
+        self.assertEqual(buffer.actions.dtype, np.int64)
+
+    def test_replay_buffer_APPEND(self):
+        """Test that appending writes into the next slot"""
+        self.assertEqual(len(self.buffer), 0)
+
+        idx = self.buffer.append(self.make_experience(3))
+
+        self.assertEqual(idx, 0)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer.actions[0], 3)
+        self.assertEqual(self.buffer.next_states[0, 0, 0, 0], 4.0)
+
+    def test_replay_buffer_OVERWRITE(self):
+        """Test that the oldest experiences are overwritten once the buffer is full"""
+        for value in range(self.capacity + 2):
+            self.buffer.append(self.make_experience(value))
+
+        self.assertEqual(len(self.buffer), self.capacity)
+        self.assertEqual(list(self.buffer.actions), [5, 6, 2, 3, 4])
+
+    def test_replay_buffer_SAMPLE(self):
+        """Test that you can sample from the buffer and the outputs are the correct shape and dtype"""
+        batch_size = 8
+        for value in range(3):
+            self.buffer.append(self.make_experience(value))
+
+        states, actions, rewards, dones, next_states = self.buffer.sample(batch_size)
+
+        self.assertEqual(states.shape, (batch_size, 4, 8, 8))
+        self.assertEqual(actions.shape, (batch_size,))
+        self.assertEqual(rewards.dtype, np.float32)
+        self.assertEqual(dones.dtype, np.bool_)
+        self.assertEqual(next_states.shape, (batch_size, 4, 8, 8))
+        self.assertTrue(np.all(actions < 3))
+        self.assertTrue(np.all(states[:, 0, 0, 0] == actions))
+
+    def test_dataloader(self):
+        """tests that the buffer works with dataloader"""
+        for value in range(self.capacity):
+            self.buffer.append(self.make_experience(value))
+
+        dataset = RLDataset(self.buffer, sample_size=4)
+        dl = DataLoader(dataset, batch_size=4)
+
+        for sample_batched in dl:
+            self.assertEqual(sample_batched[0].shape, torch.Size([4, 4, 8, 8]))
+            self.assertEqual(sample_batched[1].shape, torch.Size([4]))
+
+
 class TestPrioReplayBuffer(TestCase):
 
     def setUp(self) -> None:
@@ -169,6 +244,507 @@ class TestPrioReplayBuffer(TestCase):
         self.assertEqual(next_states.shape, (batch_size, 32, 32))
 
 
+class TestFrameStackReplayBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.stack_size = 4
+        self.obs_shape = (self.stack_size, 2, 2)
+        self.episode_lengths = [3, 6, 1, 5]
+        self.experiences = self.play_episodes()
+
+    def play_episodes(self):
+        """Creates the experiences of several episodes with stacked frames the same way BufferWrapper does"""
+        experiences = []
+        step = 0
+        for length in self.episode_lengths:
+            stack = np.zeros(self.obs_shape, dtype=np.float32)
+            stack[-1] = (step % 200 + 1) / 255.0
+            for t in range(length):
+                new_stack = np.concatenate([stack[1:], np.full((1, 2, 2), (step % 200 + 2) / 255.0)])
+                experiences.append(Experience(stack, step, 1.0, t == length - 1, new_stack.astype(np.float32)))
+                stack = new_stack.astype(np.float32)
+                step += 1
+        return experiences
+
+    def check_sample(self, buffer, valid_steps):
+        states, actions, _, dones, next_states = buffer.sample(256)
+
+        self.assertEqual(states.shape, (256, *self.obs_shape))
+        self.assertEqual(states.dtype, np.float32)
+        for state, action, done, next_state in zip(states, actions, dones, next_states):
+            self.assertIn(action, valid_steps)
+            original = self.experiences[action]
+            self.assertTrue(np.allclose(state, original.state))
+            if not done:
+                self.assertTrue(np.allclose(next_state, original.new_state))
+
+    def test_replay_buffer_SAMPLE(self):
+        """Test that the stacked observations are rebuilt exactly, including the zero padding at episode starts"""
+        buffer = FrameStackReplayBuffer(100, self.obs_shape, obs_dtype=np.float32)
+        for exp in self.experiences:
+            buffer.append(exp)
+
+        self.assertEqual(buffer.frames.shape, (100, 2, 2))
+        self.assertEqual(buffer.frames.dtype, np.uint8)
+        self.check_sample(buffer, range(len(self.experiences)))
+
+    def test_replay_buffer_OVERWRITE(self):
+        """Test that only the experiences still held by a full buffer are sampled and rebuilt correctly"""
+        capacity = 7
+        buffer = FrameStackReplayBuffer(capacity, self.obs_shape, obs_dtype=np.float32)
+        for exp in self.experiences:
+            buffer.append(exp)
+
+        self.assertEqual(len(buffer), capacity)
+        total = len(self.experiences)
+        self.check_sample(buffer, range(total - capacity + self.stack_size, total))
+
+    def test_replay_buffer_WRAPPED(self):
+        """Test that the oldest slots of a full buffer, whose earlier frames were overwritten, are not sampled"""
+        self.episode_lengths = [20]
+        self.experiences = self.play_episodes()
+        capacity = 9
+        buffer = FrameStackReplayBuffer(capacity, self.obs_shape, obs_dtype=np.float32)
+        for exp in self.experiences:
+            buffer.append(exp)
+
+        _, actions, _, _, _ = buffer.sample(256)
+        self.assertEqual(set(actions), set(range(20 - capacity + self.stack_size, 20)))
+        self.check_sample(buffer, range(20))
+
+    def test_from_env(self):
+        """Test that the frames are sized from the stacked observation space of the env"""
+        env = Mock()
+        env.observation_space = gym.spaces.Box(0.0, 1.0, shape=(4, 84, 84), dtype=np.float32)
+        env.action_space = gym.spaces.Discrete(6)
+
+        buffer = FrameStackReplayBuffer.from_env(10, env)
+
+        self.assertEqual(buffer.frames.shape, (10, 84, 84))
+        self.assertEqual(buffer.scale, 255.0)
+
+
+class TestMemmapReplayBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+        self.capacity = 6
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def make_experience(self, value):
+        state = np.full([4, 8, 8], value, dtype=np.float32)
+        return Experience(state, value, float(value), False, state + 1)
+
+    def test_memmap_STORAGE(self):
+        """Test that the observations are memory mapped while the other fields are kept in RAM"""
+        buffer = MemmapReplayBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+
+        self.assertIsInstance(buffer.states, np.memmap)
+        self.assertIsInstance(buffer.next_states, np.memmap)
+        self.assertNotIsInstance(buffer.rewards, np.memmap)
+        self.assertNotIsInstance(buffer.dones, np.memmap)
+
+    def test_memmap_REOPEN(self):
+        """Test that a buffer created on the same directory carries on from the previous one"""
+        buffer = MemmapReplayBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+        for value in range(self.capacity + 2):
+            buffer.append(self.make_experience(value))
+        del buffer
+
+        reopened = MemmapReplayBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+
+        self.assertEqual(len(reopened), self.capacity)
+        self.assertEqual(reopened.pos, 2)
+        self.assertEqual(list(reopened.actions), [6, 7, 2, 3, 4, 5])
+        states, actions, rewards, _, next_states = reopened.sample(16)
+        self.assertTrue(np.all(states[:, 0, 0, 0] == actions))
+        self.assertTrue(np.all(rewards == actions))
+        self.assertTrue(np.all(next_states[:, 0, 0, 0] == actions + 1))
+
+    def test_memmap_MISMATCH(self):
+        """Test that reopening a directory holding a buffer of another shape fails"""
+        MemmapReplayBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+
+        with self.assertRaises(ValueError):
+            MemmapReplayBuffer(self.capacity, (4, 4, 4), directory=self.directory)
+
+    def test_memmap_frame_REOPEN(self):
+        """Test that the frame stacking buffer also restores the episode boundaries"""
+        buffer = MemmapFrameStackReplayBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+        state = np.zeros([4, 8, 8], dtype=np.uint8)
+        buffer.append(Experience(state, 0, 0.0, True, state + 1))
+        del buffer
+
+        reopened = MemmapFrameStackReplayBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+
+        self.assertIsInstance(reopened.frames, np.memmap)
+        self.assertEqual(len(reopened), 1)
+        self.assertTrue(reopened.episode_start)
+        self.assertTrue(reopened.starts[0])
+
+    def test_memmap_per_REOPEN(self):
+        """Test that a reopened prioritized buffer can be sampled straight away"""
+        buffer = MemmapSumTreePERBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+        for value in range(3):
+            buffer.append(self.make_experience(value))
+        buffer.update_priorities(np.arange(3), np.array([5.0, 0.1, 2.0]))
+        del buffer
+
+        reopened = MemmapSumTreePERBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+        _, indices, weights = reopened.sample(4)
+
+        self.assertAlmostEqual(reopened.sum_tree.total(), 3.0)
+        self.assertTrue(np.all(indices < 3))
+        self.assertTrue(np.allclose(weights, 1.0))
+
+    def test_memmap_per_APPEND_PRIORITY(self):
+        """Test that the priorities computed by the actors reach the trees and the cursor is still stored"""
+        buffer = MemmapSumTreePERBuffer(self.capacity, (4, 8, 8), directory=self.directory)
+        buffer.append(self.make_experience(0), 4.0)
+        buffer.append(self.make_experience(1), priority=9.0)
+        buffer.append(self.make_experience(2))
+
+        self.assertAlmostEqual(buffer.sum_tree[0], 4.0 ** buffer.prob_alpha)
+        self.assertAlmostEqual(buffer.sum_tree[1], 9.0 ** buffer.prob_alpha)
+        self.assertAlmostEqual(buffer.sum_tree[2], 9.0 ** buffer.prob_alpha)
+        self.assertEqual(buffer.cursor.tolist(), [3, 3, 0])
+        self.assertEqual(buffer.states[1, 0, 0, 0], 1)
+
+
+class TestSharedMemoryReplayBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.buffer = SharedMemoryReplayBuffer(100, (4,))
+
+    def make_experience(self, value):
+        state = np.full(4, value, dtype=np.float32)
+        return Experience(state, value % 2, float(value), False, state + 1)
+
+    def test_shared_storage(self):
+        for value in range(3):
+            self.buffer.append(self.make_experience(value))
+
+        self.assertTrue(all(tensor.is_shared() for tensor in self.buffer.tensors.values()))
+        self.assertEqual(len(self.buffer), 3)
+        self.assertEqual(self.buffer.pos, 3)
+
+        states, _, rewards, _, next_states = self.buffer.sample(8)
+        self.assertTrue(np.allclose(states[:, 0], rewards))
+        self.assertTrue(np.allclose(next_states, states + 1))
+
+    def test_pickled_copy_shares_memory(self):
+        """Test that a copy sent to a spawned process sees the experiences appended afterwards"""
+        copy = pickle.loads(ForkingPickler.dumps(self.buffer))
+        for value in range(5):
+            self.buffer.append(self.make_experience(value))
+
+        self.assertEqual(len(copy), 5)
+        self.assertTrue(np.array_equal(copy.states, self.buffer.states))
+
+    def test_workers_sample_new_experiences(self):
+        """Test that DataLoader workers sample the experiences appended after they started"""
+        self.buffer.append(self.make_experience(0))
+        loader = iter(DataLoader(ReplayBatchStream(self.buffer, batch_size=16), batch_size=None, num_workers=1))
+        next(loader)
+        for value in range(1, 100):
+            self.buffer.append(self.make_experience(value))
+
+        rewards = torch.cat([next(loader)[2] for _ in range(10)])
+        self.assertGreater(rewards.max().item(), 0)
+
+    def test_frame_stack(self):
+        buffer = SharedMemoryFrameStackReplayBuffer(10, (4, 8, 8))
+        state = np.zeros((4, 8, 8), dtype=np.uint8)
+        buffer.append(Experience(state, 0, 1.0, False, state + 1))
+
+        self.assertTrue(buffer.tensors['frames'].is_shared())
+        states, _, _, _, next_states = buffer.sample(2)
+        self.assertTrue(np.array_equal(next_states[:, -1], np.ones((2, 8, 8))))
+
+
+class TestPrefetchSampler(TestCase):
+
+    def setUp(self) -> None:
+        self.buffer = RingReplayBuffer(100, (4,))
+        for value in range(100):
+            state = np.full(4, value, dtype=np.float32)
+            self.buffer.append(Experience(state, value % 2, float(value), False, state + 1))
+
+    def test_prefetched_tensors(self):
+        sampler = PrefetchSampler(self.buffer, sample_size=8)
+        states, actions, rewards, dones, next_states = sampler.sample(8)
+        sampler.close()
+
+        self.assertIsInstance(states, torch.Tensor)
+        self.assertEqual(states.shape, (8, 4))
+        self.assertEqual(actions.dtype, torch.int64)
+        self.assertEqual(dones.dtype, torch.bool)
+        self.assertTrue(torch.equal(states[:, 0], rewards))
+        self.assertTrue(torch.equal(next_states, states + 1))
+
+    def test_slots_reused(self):
+        """Test that the slots are reused, and only once in_use newer samples were handed out"""
+        sampler = PrefetchSampler(self.buffer, sample_size=8, num_samples=1, in_use=2)
+        samples = [sampler.sample() for _ in range(6)]
+        sampler.close()
+
+        storages = {sample[0].data_ptr() for sample in samples}
+        self.assertEqual(len(storages), 3)
+        for previous, current in zip(samples, samples[1:]):
+            self.assertNotEqual(previous[0].data_ptr(), current[0].data_ptr())
+
+    def test_prioritized_layout(self):
+        buffer = SumTreePERBuffer(100, (4,))
+        for value in range(10):
+            buffer.append(Experience(np.full(4, value, dtype=np.float32), 0, 1.0, False, np.zeros(4)))
+
+        sampler = PrefetchSampler(buffer, sample_size=8)
+        (states, *_), indices, weights = sampler.sample()
+        sampler.close()
+
+        self.assertEqual(states.shape, (8, 4))
+        self.assertTrue(torch.equal(states[:, 0].long(), indices))
+        self.assertEqual(weights.dtype, torch.float32)
+
+    def test_list_per_appends_while_sampling(self):
+        """Test that the list based PER buffer can be prefetched while the training loop appends to it"""
+        buffer = PERBuffer(1000)
+        for value in range(10):
+            buffer.append(Experience(np.full(4, value, dtype=np.float32), 0, 1.0, False, np.zeros(4)))
+
+        sampler = PrefetchSampler(buffer, sample_size=8, num_samples=1)
+        for value in range(10, 1000):
+            buffer.append(Experience(np.full(4, value, dtype=np.float32), 0, 1.0, False, np.zeros(4)))
+            if value % 10 == 0:
+                (states, *_), indices, weights = sampler.sample()
+                self.assertTrue(torch.equal(states[:, 0].long(), indices))
+                self.assertTrue(torch.all(weights <= 1.0))
+        sampler.close()
+
+    def test_errors_raised(self):
+        """Test that the error that stopped the thread is raised again by later calls instead of blocking"""
+        sampler = PrefetchSampler(Mock(sample=Mock(side_effect=RuntimeError("empty"))), sample_size=8)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                sampler.sample()
+        sampler.close()
+
+    def test_wrong_size(self):
+        sampler = PrefetchSampler(self.buffer, sample_size=8)
+        with self.assertRaises(ValueError):
+            sampler.sample(16)
+        sampler.close()
+
+
+class TestNStepReplayBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.buffer = NStepReplayBuffer(10, (2,), n_steps=3, gamma=0.5)
+
+    def append_episode(self, start, length):
+        for step in range(length):
+            value = start + step
+            state = np.full(2, value, dtype=np.float32)
+            self.buffer.append(Experience(state, value, 1.0, step == length - 1, state + 1))
+
+    def test_n_step_returns(self):
+        self.append_episode(0, 8)
+        states, actions, rewards, dones, next_states = self.buffer._gather(np.array([0, 4, 5, 6, 7]))
+
+        self.assertTrue(np.array_equal(actions, [0, 4, 5, 6, 7]))
+        self.assertTrue(np.allclose(rewards, [1.75, 1.75, 1.75, 1.5, 1.0]))
+        self.assertTrue(np.array_equal(dones, [False, False, True, True, True]))
+        self.assertTrue(np.array_equal(next_states[:, 0], [3, 7, 8, 8, 8]))
+        self.assertTrue(np.array_equal(states[:, 0], [0, 4, 5, 6, 7]))
+
+    def test_incomplete_windows_skipped(self):
+        """Test that the newest slots are only sampled once the steps after them were written"""
+        self.append_episode(0, 4)
+        for _ in range(20):
+            _, actions, _, _, _ = self.buffer.sample(16)
+            self.assertTrue(np.all(actions <= 1))
+
+        with self.assertRaises(ValueError):
+            NStepReplayBuffer(10, (2,), n_steps=3).sample(1)
+
+    def test_wrapped_ring(self):
+        self.append_episode(0, 13)
+        for _ in range(20):
+            _, actions, _, _, next_states = self.buffer.sample(16)
+            self.assertTrue(np.all((actions >= 3) & (actions <= 10)))
+            self.assertTrue(np.array_equal(next_states[:, 0], actions + 3))
+
+    def test_change_n_steps(self):
+        """Test that n_steps and gamma can be changed without collecting the experience again"""
+        self.append_episode(0, 8)
+        self.buffer.n_steps = 1
+        _, _, rewards, _, next_states = self.buffer._gather(np.array([0]))
+        self.assertTrue(np.allclose(rewards, [1.0]))
+        self.assertEqual(next_states[0, 0], 1)
+
+        self.buffer.n_steps, self.buffer.gamma = 2, 1.0
+        _, _, rewards, _, _ = self.buffer._gather(np.array([0]))
+        self.assertTrue(np.allclose(rewards, [2.0]))
+
+
+class TestRolloutBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.buffer = RolloutBuffer(capacity=4)
+
+    def append_episode(self, length):
+        for step in range(length):
+            self.buffer.append(torch.full((3,), float(step)), step % 2, 1.0, step == length - 1)
+
+    def test_flat_rollout(self):
+        self.append_episode(3)
+        self.append_episode(2)
+
+        rollout = self.buffer.rollout()
+
+        self.assertEqual(self.buffer.num_episodes, 2)
+        self.assertEqual(rollout.states.shape, (5, 3))
+        self.assertTrue(torch.equal(rollout.states[:, 0], torch.tensor([0., 1., 2., 0., 1.])))
+        self.assertEqual(rollout.actions.dtype, torch.int64)
+        self.assertEqual(rollout.rewards.dtype, torch.float32)
+        self.assertTrue(torch.equal(rollout.dones, torch.tensor([False, False, True, False, True])))
+        self.assertTrue(torch.equal(rollout.offsets, torch.tensor([0, 3, 5])))
+
+    def test_grow(self):
+        """Test that the tensors double in size when an episode does not fit, keeping the stored steps"""
+        self.append_episode(3)
+        self.append_episode(7)
+
+        self.assertEqual(self.buffer.capacity, 16)
+        self.assertTrue(torch.equal(self.buffer.rollout().states[:3, 0], torch.tensor([0., 1., 2.])))
+
+    def test_incomplete_episode_excluded(self):
+        self.append_episode(3)
+        self.buffer.append(torch.zeros(3), 0, 1.0, False)
+
+        self.assertEqual(len(self.buffer), 4)
+        self.assertEqual(len(self.buffer.rollout().states), 3)
+
+    def test_clear(self):
+        self.append_episode(3)
+        states = self.buffer.states
+        self.buffer.clear()
+
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.buffer.num_episodes, 0)
+        self.append_episode(2)
+        self.assertIs(self.buffer.states, states)
+
+
+class TestSegmentTrees(TestCase):
+
+    def setUp(self) -> None:
+        self.capacity = 6
+        self.priorities = np.array([1.0, 3.0, 0.5, 2.0, 4.0, 1.5])
+
+    def test_sum_tree_TOTAL(self):
+        """Test that the root holds the sum of all the leaves after a batched and a single update"""
+        tree = SumTree(self.capacity)
+        tree.update(np.arange(self.capacity), self.priorities)
+        self.assertAlmostEqual(tree.total(), self.priorities.sum())
+
+        tree.update(2, 10.0)
+        self.assertAlmostEqual(tree.total(), self.priorities.sum() - 0.5 + 10.0)
+
+    def test_sum_tree_PREFIX_SUM(self):
+        """Test that each value is mapped to the leaf containing it in the cumulative sum"""
+        tree = SumTree(self.capacity)
+        tree.update(np.arange(self.capacity), self.priorities)
+
+        values = np.array([0.0, 0.99, 1.0, 3.9, 4.2, 6.6, 11.9])
+        indices = tree.find_prefix_sum(values)
+
+        self.assertEqual(list(indices), [0, 0, 1, 1, 2, 4, 5])
+
+    def test_min_max_tree(self):
+        """Test that the min and max trees keep track of the extreme leaves"""
+        min_tree = MinTree(self.capacity)
+        max_tree = MaxTree(self.capacity)
+        min_tree.update(np.arange(self.capacity), self.priorities)
+        max_tree.update(np.arange(self.capacity), self.priorities)
+
+        self.assertEqual(min_tree.min(), 0.5)
+        self.assertEqual(max_tree.max(), 4.0)
+
+        max_tree.update(np.array([4]), np.array([0.1]))
+        self.assertEqual(max_tree.max(), 3.0)
+
+
+class TestSumTreePERBuffer(TestCase):
+
+    def setUp(self) -> None:
+        self.buffer = SumTreePERBuffer(10, obs_shape=(32, 32))
+
+        self.state = np.random.rand(32, 32)
+        self.next_state = np.random.rand(32, 32)
+        self.experience = Experience(self.state, 1, 1.0, False, self.next_state)
+
+    def test_replay_buffer_APPEND(self):
+        """Test that new experiences are added with the max priority"""
+        self.buffer.append(self.experience)
+        self.assertEqual(len(self.buffer), 1)
+        self.assertEqual(self.buffer.sum_tree[0], 1.0)
+
+        self.buffer.update_priorities(np.array([0]), np.array([4.0]))
+        self.buffer.append(self.experience)
+        self.assertAlmostEqual(self.buffer.sum_tree[1], 4.0 ** self.buffer.prob_alpha)
+
+    def test_replay_buffer_APPEND_PRIORITY(self):
+        """Test that an experience can be added with the priority computed by an actor"""
+        self.buffer.append(self.experience, priority=4.0)
+        self.assertAlmostEqual(self.buffer.sum_tree[0], 4.0 ** self.buffer.prob_alpha)
+
+    def test_replay_buffer_SAMPLE(self):
+        """Test that you can sample from the buffer and the outputs are the correct shape"""
+        batch_size = 3
+
+        for _ in range(10):
+            self.buffer.append(self.experience)
+
+        batch, indices, weights = self.buffer.sample(batch_size)
+
+        self.assertEqual(len(batch), 5)
+        self.assertEqual(batch[0].shape, (batch_size, 32, 32))
+        self.assertEqual(batch[1].shape, (batch_size,))
+        self.assertEqual(indices.shape, (batch_size,))
+        self.assertEqual(weights.dtype, np.float32)
+        self.assertTrue(np.allclose(weights, 1.0))
+
+    def test_replay_buffer_PRIORITY(self):
+        """Test that samples follow the priorities and that the weights compensate for them"""
+        for _ in range(4):
+            self.buffer.append(self.experience)
+
+        self.buffer.update_priorities(np.arange(4), np.array([1e-8, 1e-8, 1e-3, 100.0]))
+
+        _, indices, weights = self.buffer.sample(64)
+
+        self.assertTrue(np.all(indices >= 2))
+        self.assertGreater(np.sum(indices == 3), 48)
+        self.assertTrue(np.all(weights <= 1.0))
+        self.assertAlmostEqual(float(weights[indices == 3].max()), float(weights.min()), places=6)
+
+    def test_minibatches_stratified(self):
+        """Test that each minibatch of a sample split by the stream spans the whole priority range"""
+        buffer = SumTreePERBuffer(1000, obs_shape=(2,), minibatch_size=32)
+        for _ in range(1000):
+            buffer.append(Experience(np.zeros(2), 0, 0.0, False, np.zeros(2)))
+
+        stream = iter(ReplayBatchStream(buffer, batch_size=32, batches_per_sample=4))
+        for _ in range(4):
+            _, indices, _ = next(stream)
+            self.assertLess(int(indices.min()), 1000 / 32)
+            self.assertGreaterEqual(int(indices.max()), 1000 - 1000 / 32)
+
+
 class TestMultiStepReplayBuffer(TestCase):
 
     def setUp(self) -> None:
@@ -290,3 +866,36 @@ class TestMultiStepReplayBuffer(TestCase):
         self.assertEqual(batch[2], reward_gt)
         self.assertEqual(batch[3], self.experience02.done)
         self.assertEqual(batch[4].all(), self.experience02.new_state.all())
+
+
+class TestAsyncPriorityUpdater(TestCase):
+
+    def setUp(self) -> None:
+        self.buffer = SumTreePERBuffer(10, obs_shape=(4,))
+        experience = Experience(np.zeros(4), 0, 1.0, False, np.zeros(4))
+        for _ in range(10):
+            self.buffer.append(experience)
+        self.updater = AsyncPriorityUpdater(self.buffer)
+
+    def tearDown(self) -> None:
+        self.updater.close()
+
+    def test_submit(self):
+        """Test that submitted priorities are applied once flushed, the latest one winning for repeated indices"""
+        self.updater.submit(np.array([0, 1]), np.array([2.0, 3.0]))
+        self.updater.submit(np.array([1, 2]), np.array([5.0, 6.0]))
+        self.updater.flush()
+
+        alpha = self.buffer.prob_alpha
+        self.assertAlmostEqual(self.buffer.sum_tree[0], 2.0 ** alpha)
+        self.assertAlmostEqual(self.buffer.sum_tree[1], 5.0 ** alpha)
+        self.assertAlmostEqual(self.buffer.sum_tree[2], 6.0 ** alpha)
+        self.assertAlmostEqual(self.buffer.sum_tree.total(), 2.0 ** alpha + 5.0 ** alpha + 6.0 ** alpha + 7)
+
+    def test_close(self):
+        """Test that closing applies the waiting updates and stops the thread"""
+        self.updater.submit(np.array([3]), np.array([4.0]))
+        self.updater.close()
+
+        self.assertFalse(self.updater.thread.is_alive())
+        self.assertAlmostEqual(self.buffer.sum_tree[3], 4.0 ** self.buffer.prob_alpha)
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+import torch
+
+from algos.common.networks import NoisyLinear, NoisyCNN
+
+
+class TestNoisyLinear(TestCase):
+
+    def test_auto_reset(self):
+        """Test that the noise is resampled on every forward call by default"""
+        layer = NoisyLinear(8, 4)
+        input_x = torch.rand(2, 8)
+
+        self.assertFalse(torch.equal(layer(input_x), layer(input_x)))
+
+    def test_reset_noise(self):
+        """Test that without auto reset the output only changes after reset_noise"""
+        for factorised in (False, True):
+            layer = NoisyLinear(8, 4, factorised=factorised, auto_reset_noise=False)
+            input_x = torch.rand(2, 8)
+
+            output = layer(input_x)
+            self.assertTrue(torch.equal(output, layer(input_x)))
+
+            layer.reset_noise()
+            self.assertFalse(torch.equal(output, layer(input_x)))
+
+    def test_factorised(self):
+        """Test that factorised noise matches the layer with the full noise matrix built explicitly"""
+        layer = NoisyLinear(8, 4, factorised=True, auto_reset_noise=False)
+        input_x = torch.rand(2, 8)
+
+        self.assertEqual(layer.epsilon_in.shape, (8,))
+        self.assertEqual(layer.epsilon_out.shape, (4,))
+        self.assertFalse(hasattr(layer, "epsilon_weight"))
+
+        weight = layer.weight + layer.sigma_weight * torch.ger(layer.epsilon_out, layer.epsilon_in)
+        bias = layer.bias + layer.sigma_bias * layer.epsilon_out
+        self.assertTrue(torch.allclose(layer(input_x), input_x @ weight.t() + bias, atol=1e-6))
+
+    def test_eval_mean(self):
+        """Test that eval mode uses the mean weights"""
+        layer = NoisyLinear(8, 4, factorised=True)
+        layer.eval()
+        input_x = torch.rand(2, 8)
+
+        self.assertTrue(torch.allclose(layer(input_x), input_x @ layer.weight.t() + layer.bias))
+
+    def test_gradients(self):
+        """Test that the noise parameters get gradients"""
+        layer = NoisyLinear(8, 4, factorised=True)
+        layer(torch.rand(2, 8)).sum().backward()
+
+        self.assertIsNotNone(layer.sigma_weight.grad)
+        self.assertIsNotNone(layer.sigma_bias.grad)
+
+
+class TestNoisyCNN(TestCase):
+
+    def test_reset_noise(self):
+        net = NoisyCNN((4, 84, 84), 6, factorised=True, auto_reset_noise=False)
+        input_x = torch.rand(1, 4, 84, 84)
+
+        output = net(input_x)
+        self.assertTrue(torch.equal(output, net(input_x)))
+
+        net.reset_noise()
+        self.assertFalse(torch.equal(output, net(input_x)))
@@ -0,0 +1,74 @@
+from unittest import TestCase
+
+import torch
+from torch import nn
+
+from algos.common.networks import CNN, MLP, NoisyCNN, NoisyLinear
+from algos.common.quantize import quantize_network, action_agreement, benchmark_quantization, \
+    quantized_agreement
+
+
+class Negated(nn.Module):
+    def __init__(self, net):
+        super().__init__()
+        self.net = net
+
+    def forward(self, x):
+        return -self.net(x)
+
+
+class TestQuantizeNetwork(TestCase):
+
+    def test_linear_layers(self):
+        """Test that the linear layers are quantised while the original network stays in fp32"""
+        net = MLP((4,), 2)
+        quantized_net = quantize_network(net)
+
+        self.assertTrue(all(type(layer) is not nn.Linear for layer in quantized_net.modules()))
+        self.assertTrue(any(type(layer) is nn.Linear for layer in net.modules()))
+        self.assertEqual(quantized_net(torch.rand(3, 4)).shape, (3, 2))
+
+    def test_noisy_layers_keep_noise(self):
+        """Test that the noisy layers of the quantised copy stay in train mode and follow reset_noise"""
+        net = NoisyCNN((4, 84, 84), 6, auto_reset_noise=False)
+        quantized_net = quantize_network(net)
+        states = torch.rand(2, 4, 84, 84)
+
+        self.assertTrue(all(layer.training for layer in quantized_net.modules() if isinstance(layer, NoisyLinear)))
+        values = quantized_net(states)
+        self.assertTrue(torch.equal(values, quantized_net(states)))
+        quantized_net.reset_noise()
+        self.assertFalse(torch.equal(values, quantized_net(states)))
+
+    def test_cnn_head(self):
+        net = CNN((4, 84, 84), 6)
+        quantized_net = quantize_network(net)
+
+        self.assertIsInstance(quantized_net.conv[0], nn.Conv2d)
+        self.assertEqual(quantized_net(torch.rand(2, 4, 84, 84)).shape, (2, 6))
+
+
+class TestActionAgreement(TestCase):
+
+    def test_agreement(self):
+        net = MLP((4,), 2)
+        states = torch.rand(64, 4)
+
+        self.assertEqual(action_agreement(net, net, states), 1.0)
+
+        self.assertEqual(action_agreement(net, Negated(net), states), 0.0)
+
+    def test_quantized_agreement_noisy(self):
+        """Test that a noisy network is compared with its quantised copy without noise and is left in train mode"""
+        torch.manual_seed(0)
+        net = nn.Sequential(NoisyLinear(4, 8), nn.ReLU(), NoisyLinear(8, 2))
+
+        self.assertEqual(quantized_agreement(net, torch.rand(256, 4)), 1.0)
+        self.assertTrue(net.training)
+
+    def test_benchmark(self):
+        report = benchmark_quantization(MLP((4,), 2), torch.rand(16, 4), repeats=2)
+
+        self.assertEqual(set(report), {'agreement', 'fp32_ms', 'int8_ms', 'speedup'})
+        self.assertGreaterEqual(report['agreement'], 0.0)
+        self.assertLessEqual(report['agreement'], 1.0)
@@ -8,7 +8,8 @@ from torch.utils.data import DataLoader
 
 from algos.common import cli
 from algos.common.agents import Agent
-from algos.common.experience import EpisodicExperienceStream
+from algos.common.experience import EpisodicRolloutStream
+from algos.common.memory import Rollout
 from algos.common.networks import MLP
 from algos.common.wrappers import ToTensor
 from algos.dqn.model import DQNLightning
@@ -23,8 +24,8 @@ class TestReinforce(TestCase):
         self.n_actions = self.env.action_space.n
         self.net = MLP(self.obs_shape, self.n_actions)
         self.agent = Agent(self.net)
-        self.xp_stream = EpisodicExperienceStream(self.env, self.agent, Mock(), episodes=4)
-        self.rl_dataloader = DataLoader(self.xp_stream)
+        self.rollout_stream = EpisodicRolloutStream(self.env, self.agent, Mock(), episodes=4)
+        self.rl_dataloader = DataLoader(self.rollout_stream, batch_size=None)
 
         parent_parser = argparse.ArgumentParser(add_help=False)
         parent_parser = cli.add_base_args(parent=parent_parser)
@@ -44,9 +45,7 @@ class TestReinforce(TestCase):
         self.model.agent = self.agent
 
         for i_batch, batch in enumerate(self.rl_dataloader):
-            exp_batch = batch
-
-            batch_qvals, batch_states, batch_actions, _ = self.model.process_batch(exp_batch)
+            batch_qvals, batch_states, batch_actions, _ = self.model.process_rollout(batch)
 
             loss = self.model.loss(batch_qvals, batch_states, batch_actions)
 
@@ -54,44 +53,35 @@ class TestReinforce(TestCase):
             break
 
     def test_get_qvals(self):
-        """Test that given an batch of episodes that it will return a list of qvals for each episode"""
-        batch_qvals = []
-        for i_batch, batch in enumerate(self.rl_dataloader):
-
-            for episode in batch:
-                rewards = [step[2] for step in episode]
-                batch_qvals.append(self.model.calc_qvals(rewards))
-
-            self.assertEqual(len(batch_qvals), len(batch))
-            self.assertIsInstance(batch_qvals[0][0], torch.Tensor)
-            self.assertEqual(batch_qvals[0][0], (batch_qvals[0][1] * self.hparams.gamma) + 1.0)
-            break
-
-    def test_process_batch(self):
-        """Test that given a batch of episodes that it will return the q_vals, the states and the actions"""
-        batch_len = 0
-
-        for i_batch, batch in enumerate(self.rl_dataloader):
-            for mini_batch in batch:
-                batch_len += len(mini_batch)
-
-            q_vals, states, actions, rewards = self.model.process_batch(batch)
-
-            self.assertEqual(len(q_vals), batch_len)
-            self.assertEqual(len(states), batch_len)
-            self.assertEqual(len(actions), batch_len)
-            self.assertEqual(len(rewards), batch_len)
-
-            self.assertEqual(len(q_vals.shape), 1)
-            self.assertEqual(len(states.shape), 2)
-            self.assertEqual(len(actions.shape), 1)
-            self.assertEqual(len(rewards.shape), 1)
+        """Test that the q val of each step is its reward plus the discounted q val of the next step"""
+        rollout = next(iter(self.rl_dataloader))
+        q_vals, _, _, _ = self.model.process_rollout(rollout)
+
+        first_episode = int(rollout.offsets[1])
+        self.assertTrue(torch.allclose(q_vals[:first_episode - 1],
+                                       q_vals[1:first_episode] * self.hparams.gamma + 1.0))
+
+    def test_process_rollout(self):
+        """Test that a rollout gives the q_vals, states, actions and rewards of every step as flat tensors"""
+        rollout = next(iter(self.rl_dataloader))
+
+        q_vals, states, actions, rewards = self.model.process_rollout(rollout)
+
+        steps = int(rollout.offsets[-1])
+        self.assertEqual(q_vals.shape, (steps,))
+        self.assertEqual(states.shape, (steps, 4))
+        self.assertEqual(actions.shape, (steps,))
+        self.assertEqual(rewards.shape, (steps,))
+        first_episode = int(rollout.offsets[1])
+        self.assertAlmostEqual(q_vals[first_episode - 1].item(), 1.0)
+        expected = (1 - self.hparams.gamma ** first_episode) / (1 - self.hparams.gamma)
+        self.assertAlmostEqual(q_vals[0].item(), expected, places=4)
 
     def test_calc_q_vals(self):
-        rewards = [1, 1, 1, 1]
-        gt_qvals = [3.9403989999999998, 2.9701, 1.99, 1.0]
-
-        qvals = self.model.calc_qvals(rewards)
+        rollout = Rollout(torch.zeros(4, 4), torch.zeros(4, dtype=torch.long), torch.ones(4),
+                          torch.tensor([False, False, False, True]), torch.tensor([0, 4]))
+        gt_qvals = torch.tensor([3.9403989999999998, 2.9701, 1.99, 1.0])
 
-        self.assertEqual(gt_qvals, qvals)
+        qvals, _, _, _ = self.model.process_rollout(rollout)
 
+        self.assertTrue(torch.allclose(gt_qvals, qvals))
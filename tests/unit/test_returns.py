@@ -0,0 +1,77 @@
+from unittest import TestCase
+
+import torch
+
+from algos.common.returns import discounted_returns, episode_ids, episode_means, reward_to_go
+
+
+def loop_returns(rewards, dones, gamma):
+    res = []
+    sum_r = 0.0
+    for reward, done in zip(reversed(rewards), reversed(dones)):
+        if done:
+            sum_r = 0.0
+        sum_r = reward + sum_r * gamma
+        res.append(sum_r)
+    return list(reversed(res))
+
+
+class TestReturns(TestCase):
+
+    def setUp(self) -> None:
+        self.rewards = torch.tensor([1.0, 1.0, 1.0, 1.0, 2.0, 0.0, 3.0])
+        self.dones = torch.tensor([False, False, False, True, False, False, True])
+        self.gamma = 0.99
+
+    def test_single_episode(self):
+        returns = discounted_returns(torch.ones(4), torch.tensor([False, False, False, True]), self.gamma)
+        self.assertTrue(torch.allclose(returns, torch.tensor([3.940399, 2.9701, 1.99, 1.0])))
+
+    def test_resets_at_episode_boundaries(self):
+        returns = discounted_returns(self.rewards, self.dones, self.gamma)
+        expected = loop_returns(self.rewards.tolist(), self.dones.tolist(), self.gamma)
+        self.assertTrue(torch.allclose(returns, torch.tensor(expected)))
+
+    def test_matches_loop_on_long_random_batch(self):
+        """Test that the scan matches the step by step recurrence for lengths that are not powers of two"""
+        torch.manual_seed(0)
+        rewards = torch.randn(1000, dtype=torch.float64)
+        dones = torch.rand(1000) < 0.01
+
+        returns = discounted_returns(rewards, dones, self.gamma)
+
+        expected = loop_returns(rewards.tolist(), dones.tolist(), self.gamma)
+        self.assertTrue(torch.allclose(returns, torch.tensor(expected, dtype=torch.float64)))
+
+    def test_unfinished_last_episode(self):
+        """Test that the last step is treated as the end of its episode"""
+        returns = discounted_returns(torch.ones(3), torch.zeros(3, dtype=torch.bool), 0.5)
+        self.assertTrue(torch.allclose(returns, torch.tensor([1.75, 1.5, 1.0])))
+
+    def test_inputs_not_modified(self):
+        rewards = self.rewards.clone()
+        discounted_returns(rewards, self.dones, self.gamma)
+        self.assertTrue(torch.equal(rewards, self.rewards))
+
+    def test_episode_ids(self):
+        self.assertEqual(episode_ids(self.dones).tolist(), [0, 0, 0, 0, 1, 1, 1])
+
+    def test_episode_means(self):
+        means = episode_means(self.rewards, self.dones)
+        self.assertTrue(torch.allclose(means, torch.tensor([1.0] * 4 + [5 / 3] * 3)))
+
+    def test_episode_baseline(self):
+        """Test that the returns of each episode are centred on their own mean"""
+        q_vals = reward_to_go(self.rewards, self.dones, self.gamma, baseline="episode")
+        returns = discounted_returns(self.rewards, self.dones, self.gamma)
+
+        self.assertTrue(torch.allclose(q_vals[:4], returns[:4] - returns[:4].mean()))
+        self.assertTrue(torch.allclose(q_vals[4:], returns[4:] - returns[4:].mean()))
+
+    def test_batch_baseline(self):
+        q_vals = reward_to_go(self.rewards, self.dones, self.gamma, baseline="batch")
+        self.assertAlmostEqual(q_vals.mean().item(), 0.0, places=5)
+
+    def test_unknown_baseline(self):
+        with self.assertRaises(ValueError):
+            reward_to_go(self.rewards, self.dones, self.gamma, baseline="value")
@@ -0,0 +1,85 @@
+from unittest import TestCase
+
+import torch
+
+from algos.common.networks import MLP, NoisyCNN
+from algos.common.target import TargetNetworkUpdater
+
+
+class TestTargetNetworkUpdater(TestCase):
+
+    def setUp(self) -> None:
+        torch.manual_seed(0)
+        self.net = MLP((4,), 2)
+        self.target_net = MLP((4,), 2)
+
+    def assert_same_weights(self, net, target_net):
+        for param, target_param in zip(net.state_dict().values(), target_net.state_dict().values()):
+            self.assertTrue(torch.equal(param, target_param))
+
+    def test_hard_update_every_sync_rate_steps(self):
+        updater = TargetNetworkUpdater("hard", sync_rate=10)
+        target_params = list(self.target_net.parameters())
+
+        updater.update(self.net, self.target_net, step=3)
+        self.assertFalse(torch.equal(target_params[0], list(self.net.parameters())[0]))
+
+        updater.update(self.net, self.target_net, step=20)
+        self.assert_same_weights(self.net, self.target_net)
+
+        # the target tensors are updated in place
+        for param, target_param in zip(target_params, self.target_net.parameters()):
+            self.assertIs(param, target_param)
+
+    def test_soft_update(self):
+        """Test that each soft update is a Polyak average of the two networks"""
+        updater = TargetNetworkUpdater("soft", tau=0.1)
+        expected = [0.9 * target_param + 0.1 * param
+                    for param, target_param in zip(self.net.parameters(), self.target_net.parameters())]
+
+        updater.update(self.net, self.target_net, step=3)
+
+        for exp, target_param in zip(expected, self.target_net.parameters()):
+            self.assertTrue(torch.allclose(exp, target_param))
+
+    def test_soft_update_without_foreach(self):
+        """Test that the per tensor fallback gives the same soft update as the foreach op"""
+        updater = TargetNetworkUpdater("soft", tau=0.1)
+        expected = [0.9 * target_param + 0.1 * param
+                    for param, target_param in zip(self.net.parameters(), self.target_net.parameters())]
+
+        foreach_lerp = torch._foreach_lerp_
+        del torch._foreach_lerp_
+        try:
+            updater.update(self.net, self.target_net, step=3)
+        finally:
+            torch._foreach_lerp_ = foreach_lerp
+
+        for exp, target_param in zip(expected, self.target_net.parameters()):
+            self.assertTrue(torch.allclose(exp, target_param))
+
+    def test_soft_update_converges(self):
+        updater = TargetNetworkUpdater("soft", tau=0.5)
+        for step in range(60):
+            updater.update(self.net, self.target_net, step)
+
+        for param, target_param in zip(self.net.parameters(), self.target_net.parameters()):
+            self.assertTrue(torch.allclose(param, target_param))
+
+    def test_buffers_copied(self):
+        net = NoisyCNN((4, 84, 84), 6)
+        target_net = NoisyCNN((4, 84, 84), 6)
+        net.reset_noise()
+
+        TargetNetworkUpdater("soft", tau=0.0).update(net, target_net, step=1)
+
+        for buffer, target_buffer in zip(net.buffers(), target_net.buffers()):
+            self.assertTrue(torch.equal(buffer, target_buffer))
+
+    def test_no_grad(self):
+        TargetNetworkUpdater("soft").update(self.net, self.target_net, step=1)
+        self.assertTrue(all(param.grad_fn is None for param in self.target_net.parameters()))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            TargetNetworkUpdater("polyak")
@@ -0,0 +1,73 @@
+from functools import partial
+from unittest import TestCase
+
+import gym
+import numpy as np
+
+from algos.common.vec_env import SyncVectorEnv, SubprocVectorEnv
+
+
+class TestSyncVectorEnv(TestCase):
+
+    def setUp(self) -> None:
+        self.num_envs = 3
+        self.env = SyncVectorEnv([gym.make("CartPole-v0") for _ in range(self.num_envs)])
+        self.env.seed(123)
+
+    def test_reset(self):
+        states = self.env.reset()
+        self.assertEqual(states.shape, (self.num_envs, 4))
+
+    def test_step(self):
+        """Test that every env is stepped and that finished envs are reset independently"""
+        self.env.reset()
+        actions = np.zeros(self.num_envs, dtype=np.int64)
+
+        finished = np.zeros(self.num_envs, dtype=np.bool_)
+        for _ in range(100):
+            new_states, rewards, dones, states = self.env.step(actions)
+
+            self.assertEqual(new_states.shape, (self.num_envs, 4))
+            self.assertEqual(rewards.shape, (self.num_envs,))
+            self.assertTrue(np.array_equal(new_states[~dones], states[~dones]))
+            self.assertFalse(np.any(np.all(new_states[dones] == states[dones], axis=1)))
+            finished |= dones
+
+        self.assertTrue(np.all(finished))
+
+
+class TestSubprocVectorEnv(TestCase):
+
+    def setUp(self) -> None:
+        self.num_envs = 3
+        self.env = SubprocVectorEnv([partial(gym.make, "CartPole-v0") for _ in range(self.num_envs)])
+        self.env.seed(123)
+
+    def tearDown(self) -> None:
+        self.env.close()
+
+    def test_spaces(self):
+        self.assertEqual(self.env.observation_space.shape, (4,))
+        self.assertEqual(self.env.action_space.n, 2)
+
+    def test_matches_sync(self):
+        """Test that the workers produce the same transitions as stepping the envs in process"""
+        sync_env = SyncVectorEnv([gym.make("CartPole-v0") for _ in range(self.num_envs)])
+        sync_env.seed(123)
+
+        self.assertTrue(np.allclose(self.env.reset(), sync_env.reset()))
+
+        actions = np.ones(self.num_envs, dtype=np.int64)
+        for _ in range(30):
+            results = self.env.step(actions)
+            expected = sync_env.step(actions)
+            for result, expected_result in zip(results, expected):
+                self.assertTrue(np.allclose(result, expected_result))
+
+    def test_states_are_copies(self):
+        """Test that returned states are not overwritten by the next step"""
+        states = self.env.reset()
+        first_states = states.copy()
+        self.env.step(np.zeros(self.num_envs, dtype=np.int64))
+
+        self.assertTrue(np.array_equal(states, first_states))
@@ -2,14 +2,14 @@ import argparse
 from unittest import TestCase
 from unittest.mock import Mock
 
-import numpy as np
 import gym
 import torch
 from torch.utils.data import DataLoader
 
 from algos.common import cli
 from algos.common.agents import Agent
-from algos.common.experience import EpisodicExperienceStream
+from algos.common.experience import EpisodicRolloutStream
+from algos.common.memory import Rollout
 from algos.common.networks import MLP
 from algos.common.wrappers import ToTensor
 from algos.vanilla_policy_gradient.model import VPGLightning
@@ -23,8 +23,8 @@ class TestVPG(TestCase):
         self.n_actions = self.env.action_space.n
         self.net = MLP(self.obs_shape, self.n_actions)
         self.agent = Agent(self.net)
-        self.xp_stream = EpisodicExperienceStream(self.env, self.agent, Mock(), episodes=4)
-        self.rl_dataloader = DataLoader(self.xp_stream)
+        self.rollout_stream = EpisodicRolloutStream(self.env, self.agent, Mock(), episodes=4)
+        self.rl_dataloader = DataLoader(self.rollout_stream, batch_size=None)
 
         parent_parser = argparse.ArgumentParser(add_help=False)
         parent_parser = cli.add_base_args(parent=parent_parser)
@@ -37,13 +37,13 @@ class TestVPG(TestCase):
         self.model = VPGLightning(self.hparams)
 
     def test_calc_q_vals(self):
-        rewards = [torch.tensor(1), torch.tensor(1), torch.tensor(1), torch.tensor(1)]
-        gt_qvals = np.array([ 1.4652743,   0.49497533, -0.4851246,  -1.4751246 ])
+        rollout = Rollout(torch.zeros(8, 4), torch.zeros(8, dtype=torch.long), torch.ones(8),
+                          torch.tensor([False, False, False, True] * 2), torch.tensor([0, 4, 8]))
+        gt_qvals = torch.tensor([1.4652743, 0.49497533, -0.4851246, -1.4751246] * 2)
 
-        qvals = self.model.calc_qvals(rewards)
-        qvals = torch.stack(qvals).numpy()
+        qvals, _, _, _ = self.model.process_rollout(rollout)
 
-        self.assertEqual(gt_qvals.all(), qvals.all())
+        self.assertTrue(torch.allclose(gt_qvals, qvals))
 
     def test_loss(self):
         """Test the vpg loss function"""
@@ -51,9 +51,7 @@ class TestVPG(TestCase):
         self.model.agent = self.agent
 
         for i_batch, batch in enumerate(self.rl_dataloader):
-            exp_batch = batch
-
-            batch_qvals, batch_states, batch_actions, _ = self.model.process_batch(exp_batch)
+            batch_qvals, batch_states, batch_actions, _ = self.model.process_rollout(batch)
 
             loss = self.model.loss(batch_qvals, batch_states, batch_actions)
 
@@ -1,9 +1,23 @@
 from unittest import TestCase
 
 import gym
+import numpy as np
 import torch
 
-from algos.common.wrappers import ToTensor
+from algos.common.networks import CNN
+from algos.common.wrappers import ToTensor, BufferWrapper, UInt8Frame, ScaledFloatFrame
+
+
+class FrameEnv(gym.Env):
+    """Env returning random 1x8x8 uint8 frames"""
+    observation_space = gym.spaces.Box(low=0, high=255, shape=(1, 8, 8), dtype=np.uint8)
+    action_space = gym.spaces.Discrete(2)
+
+    def reset(self):
+        return np.random.randint(0, 256, (1, 8, 8), dtype=np.uint8)
+
+    def step(self, action):
+        return self.reset(), 1.0, False, {}
 
 
 class TestToTensor(TestCase):
@@ -18,3 +32,29 @@ class TestToTensor(TestCase):
 
         new_state, _, _, _ = self.env.step(1)
         self.assertIsInstance(new_state, torch.Tensor)
+
+
+class TestUInt8Frame(TestCase):
+
+    def setUp(self) -> None:
+        self.env = UInt8Frame(ToTensor(BufferWrapper(FrameEnv(), 4, dtype=np.uint8)))
+
+    def test_wrapper(self):
+        """Test that the stacked frames stay uint8 and are not shared between steps"""
+        state = self.env.reset()
+        new_state, _, _, _ = self.env.step(1)
+
+        self.assertEqual(self.env.observation_space.dtype, np.uint8)
+        self.assertEqual(state.dtype, np.uint8)
+        self.assertEqual(state.shape, (4, 8, 8))
+        self.assertTrue(np.array_equal(state[-1], new_state[-2]))
+        self.assertIsNot(state, new_state)
+
+    def test_network_scaling(self):
+        """Test that the networks give the same output for uint8 frames as for frames scaled to float"""
+        float_env = ScaledFloatFrame(ToTensor(BufferWrapper(FrameEnv(), 4)))
+        net = CNN((4, 84, 84), 2)
+        frames = torch.randint(0, 256, (2, 4, 84, 84), dtype=torch.uint8)
+
+        self.assertEqual(float_env.observation_space.dtype, np.float32)
+        self.assertTrue(torch.allclose(net(frames), net(frames.float() / 255.0)))